@@ -1,10 +1,22 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
+import os
 from datetime import datetime, timedelta
 import plotly.express as px
 import plotly.graph_objects as go
 
+from opensam.app_data import (
+    MAX_SESSION_STATE_BYTES, finish_page, get_data, get_filtered_positions, get_installs_users, get_license_position,
+    get_reclaim_installs, lazy_download, paged_dataframe, record_snapshot, session_state_bytes, start_page,
+)
+from opensam.exports import EXPORT_FORMATS
+from opensam.portfolio import (
+    RISK_FILTERS, license_type_mix, reclaim_value, renewal_timeline, top_vendors_by_spend,
+)
+from opensam.storage import DATA_FILES, dataset_version, data_paths
+from opensam.timing import stage
+
 st.set_page_config(
     page_title="OpenSAM - Software Asset Management",
     page_icon="💼",
@@ -12,6 +24,9 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Per-stage timings for this rerun (logged at the bottom of the page)
+start_page("home")
+
 # Custom CSS - Business Professional Theme
 st.markdown("""
 <style>
@@ -196,6 +211,9 @@ def fmt_number(value):
         return "0"
     return f"{value:,.0f}"
 
+# Date columns are datetime64; render them as plain dates in tables
+DATE_COLUMN_CONFIG = {"last_used_date": st.column_config.DateColumn("last_used_date", format="YYYY-MM-DD")}
+
 # ============================================================================
 # Schema Validation
 # ============================================================================
@@ -212,30 +230,23 @@ def validate_schema(df, name, required_cols):
 # Data Loading with Session State
 # ============================================================================
 
-@st.cache_data(ttl=60)
-def load_csv(path):
-    """Load CSV with caching and TTL."""
-    try:
-        return pd.read_csv(path)
-    except FileNotFoundError:
-        st.error(f"File not found: {path}")
-        return pd.DataFrame()
-
-def coerce_dates(df, cols):
-    """Convert specified columns to date type."""
-    for c in cols:
-        if c in df.columns:
-            df[c] = pd.to_datetime(df[c], errors="coerce").dt.date
-    return df
+DATA_DIR = "data"
 
 def load_data():
-    """Load all data sources and store in session_state."""
+    """Load all data sources once per dataset version, shared by every session.
+
+    The frames live in a process-wide cache (opensam.app_data.get_data);
+    session_state only records which version and directory this session uses.
+    """
     # Check if we need to reload
-    if "data" in st.session_state and "data_loaded" in st.session_state:
-        return st.session_state["data"]
+    if "data_loaded" in st.session_state:
+        return get_data()
 
-    # Load from uploads or files
-    data = {}
+    # Fingerprint the files first so derived tables are keyed to exactly what gets loaded
+    source_files = data_paths(DATA_DIR)
+    st.session_state["data_version"] = dataset_version([path for files in source_files.values() for path in files])
+    # Installation deltas under DATA_DIR/deltas are applied on top by opensam.app_data
+    st.session_state["data_dir"] = DATA_DIR
 
     with st.sidebar:
         st.header("Data Sources")
@@ -243,11 +254,14 @@ def load_data():
         st.caption("📊 Using sample data (Acme Corp)")
         st.caption("💡 Want to use your own data? Contact AppForge Labs for a custom deployment.")
 
-        # Load from local files only (secure for public demo)
-        data["licenses"] = load_csv("data/licenses.csv")
-        data["installs"] = load_csv("data/installations.csv")
-        data["users"] = load_csv("data/users.csv")
-        data["vendors"] = load_csv("data/vendors.csv")
+        # Load from local files only (secure for public demo), through each CSV's columnar cache
+        # Typed per opensam.schema: datetime64 dates, categorical labels, compact seat counts;
+        # category sets are shared across join keys (software, vendor) so merges stay categorical
+        # Each table may also be <name>.parquet or numbered shards (see opensam.storage)
+        for name, files in source_files.items():
+            if not files:
+                st.error(f"File not found: {os.path.join(DATA_DIR, DATA_FILES[name])}")
+        data = get_data()
 
     # Validate schemas
     validate_schema(data["licenses"], "licenses.csv",
@@ -261,24 +275,14 @@ def load_data():
         if "vendor" not in data["vendors"].columns:
             st.warning("⚠️ vendors.csv is missing 'vendor' column. Vendor data will not be used.")
 
-    # Coerce dates
-    data["licenses"] = coerce_dates(data["licenses"], ["contract_start", "contract_end"])
-    data["installs"] = coerce_dates(data["installs"], ["install_date", "last_used_date"])
-
-    # Normalize
-    if "software" in data["licenses"].columns:
-        data["licenses"]["software"] = data["licenses"]["software"].astype(str)
-    if "software" in data["installs"].columns:
-        data["installs"]["software"] = data["installs"]["software"].astype(str)
-
-    # Store in session
-    st.session_state["data"] = data
     st.session_state["data_loaded"] = True
 
     return data
 
 # Load data
-data = load_data()
+with stage("load_data", cached=True) as timing:
+    data = load_data()
+    timing["rows"] = sum(len(frame) for frame in data.values())
 licenses = data["licenses"]
 installs = data["installs"]
 users = data["users"]
@@ -306,67 +310,35 @@ with st.sidebar:
     # Store in session state for other pages to access
     st.session_state["count_by_user"] = count_by_user
 
+    show_timings = st.checkbox(
+        "Show performance panel",
+        value=False,
+        help="⏱️ Duration, input rows and cache hit/miss of each stage of the page run, shown at the bottom of the sidebar"
+    )
+    st.session_state["show_timings"] = show_timings
+
+    # Sessions hold widget state only; the data itself is shared per dataset version
+    session_sizes = session_state_bytes()
+    session_total = sum(session_sizes.values())
+    st.caption(f"🧠 Session state: {session_total / 1024:,.1f} KB")
+    if session_total > MAX_SESSION_STATE_BYTES:
+        heaviest = ", ".join(list(session_sizes)[:3])
+        st.warning(f"⚠️ Session state is over {MAX_SESSION_STATE_BYTES // 1024:,} KB (largest: {heaviest}).")
+
 # ============================================================================
 # Data Processing
 # ============================================================================
 
-# Join installs->users for status and department
-installs_users = installs.merge(users, on="user_email", how="left")
-
-# Fill missing status
-if "status" in installs_users.columns:
-    installs_users["status"] = installs_users["status"].fillna("unknown")
-
-# Utilization calc per software
-if count_by_user:
-    # Count unique users, not devices
-    usage = installs_users.groupby("software").agg(
-        installs_count=("user_email", "nunique"),
-        active_installs=("user_email", lambda s: installs_users.loc[s.index][installs_users.loc[s.index, "status"] == "active"]["user_email"].nunique()),
-        inactive_installs=("user_email", lambda s: installs_users.loc[s.index][installs_users.loc[s.index, "status"] == "terminated"]["user_email"].nunique()),
-        last_used_max=("last_used_date", "max"),
-    ).reset_index()
-else:
-    # Count devices (original logic)
-    usage = installs_users.groupby("software").agg(
-        installs_count=("device_id", "nunique"),
-        active_installs=("status", lambda s: (s == "active").sum() if s.notna().any() else 0),
-        inactive_installs=("status", lambda s: (s == "terminated").sum() if s.notna().any() else 0),
-        last_used_max=("last_used_date", "max"),
-    ).reset_index()
-
-# Merge with licenses
-sam = licenses.merge(usage, on="software", how="left").fillna({"installs_count": 0, "active_installs": 0, "inactive_installs": 0})
-sam["installs_count"] = sam["installs_count"].astype(int)
-sam["active_installs"] = sam["active_installs"].astype(int)
-sam["inactive_installs"] = sam["inactive_installs"].astype(int)
-
-# ELP & savings
-today = datetime.utcnow().date()
-sam["seats_used"] = sam["active_installs"]
-sam["seats_unused"] = (sam["seats_purchased"] - sam["seats_used"]).clip(lower=0)
-sam["overage"] = (sam["seats_used"] - sam["seats_purchased"]).clip(lower=0)
-sam["elp"] = sam["seats_purchased"] - sam["seats_used"]
-
-# Contract days remaining with guard for NaT
-if "contract_end" in sam.columns:
-    sam["contract_days_remaining"] = sam["contract_end"].apply(
-        lambda x: (x - today).days if pd.notna(x) else 999999
-    )
-else:
-    sam["contract_days_remaining"] = 999999
+# Join installs->users for status and department (computed once per dataset version, shared across pages)
+installs_users = get_installs_users()
 
-sam["renewal_due"] = sam["contract_days_remaining"].apply(lambda d: d <= 30)
+# Utilization per software (unique users when counting by user, devices otherwise) merged with
+# licenses: ELP, overage, renewal timing and potential savings (subscriptions only)
+today = datetime.utcnow().date()
+sam = get_license_position(count_by_user, today)
 
-# Potential savings (SUBSCRIPTIONS ONLY)
-if "license_type" in sam.columns and "unit_cost_usd" in sam.columns:
-    sam["potential_savings_usd"] = np.where(
-        sam["license_type"].str.contains("subscription", case=False, na=False),
-        sam["seats_unused"] * sam["unit_cost_usd"],
-        0
-    )
-else:
-    sam["potential_savings_usd"] = 0
+# Record this dataset state as today's usage snapshot (only changed installs are written, once per state)
+record_snapshot(today)
 
 # ============================================================================
 # HERO SECTION - Giant Savings Number
@@ -400,11 +372,7 @@ with hero_col2:
     st.markdown("### 🎯 Where Are Your Savings?")
 
     # Calculate savings breakdown
-    terminated_users_df = sam[sam["inactive_installs"] > 0]
-    terminated_savings = 0
-    for _, row in terminated_users_df.iterrows():
-        if pd.notna(row.get("license_type")) and "subscription" in str(row["license_type"]).lower():
-            terminated_savings += row["inactive_installs"] * row.get("unit_cost_usd", 0)
+    terminated_savings = reclaim_value(sam)
 
     unused_seats_savings = hero_savings - terminated_savings
 
@@ -414,26 +382,27 @@ with hero_col2:
     })
 
     if hero_savings > 0:
-        fig_hero = px.bar(
-            savings_data,
-            y='Category',
-            x='Savings',
-            orientation='h',
-            color='Savings',
-            color_continuous_scale=['#e74c3c', '#27ae60'],
-            text='Savings'
-        )
-        fig_hero.update_traces(texttemplate='$%{text:,.0f}', textposition='inside')
-        fig_hero.update_layout(
-            showlegend=False,
-            height=150,
-            margin=dict(t=0, b=0, l=0, r=0),
-            xaxis_title="",
-            yaxis_title="",
-            coloraxis_showscale=False,
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)'
-        )
+        with stage("chart:hero", rows=len(savings_data)):
+            fig_hero = px.bar(
+                savings_data,
+                y='Category',
+                x='Savings',
+                orientation='h',
+                color='Savings',
+                color_continuous_scale=['#e74c3c', '#27ae60'],
+                text='Savings'
+            )
+            fig_hero.update_traces(texttemplate='$%{text:,.0f}', textposition='inside')
+            fig_hero.update_layout(
+                showlegend=False,
+                height=150,
+                margin=dict(t=0, b=0, l=0, r=0),
+                xaxis_title="",
+                yaxis_title="",
+                coloraxis_showscale=False,
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)'
+            )
         st.plotly_chart(fig_hero, use_container_width=True)
 
         col_a, col_b = st.columns(2)
@@ -497,7 +466,7 @@ with st.expander("🔧 Advanced Filters (click to customize)", expanded=False):
     with cols[1]:
         risk_filter_manual = st.selectbox(
             "Risk",
-            ["All", "Over-Used", "Expiring < 30d", "Inactive Users Present"],
+            RISK_FILTERS,
             help="⚠️ Over-Used = compliance issue (more users than seats). Expiring = contract ends soon. Inactive = terminated users still have licenses."
         )
     with cols[2]:
@@ -537,20 +506,8 @@ st.caption("""
 • Inactive Users Present = Terminated users still hold installations
 """)
 
-# Apply filters
-filtered = sam.copy()
-if vendor_filter:
-    filtered = filtered[filtered["vendor"].isin(vendor_filter)]
-if only_subs and "license_type" in filtered.columns:
-    filtered = filtered[filtered["license_type"].str.contains("subscription", case=False, na=False)]
-if risk_filter != "All":
-    if risk_filter == "Over-Used":
-        filtered = filtered[filtered["overage"] > 0]
-    elif risk_filter == "Expiring < 30d":
-        filtered = filtered[filtered["renewal_due"] == True]
-    elif risk_filter == "Inactive Users Present":
-        filtered = filtered[filtered["inactive_installs"] > 0]
-filtered = filtered[filtered["potential_savings_usd"] >= min_savings]
+# Apply filters (bitwise over precomputed risk flags; each combination is cached, so presets switch instantly)
+filtered = get_filtered_positions(count_by_user, today, vendor_filter, only_subs, risk_filter, min_savings)
 
 st.markdown("---")
 
@@ -586,16 +543,13 @@ if len(overages) > 0:
 inactive_total = filtered["inactive_installs"].sum()
 if inactive_total > 0:
     # Calculate reclaimable value (subscriptions only)
-    reclaim_value = 0
-    for _, row in filtered[filtered["inactive_installs"] > 0].iterrows():
-        if pd.notna(row.get("license_type")) and "subscription" in str(row["license_type"]).lower():
-            reclaim_value += row["inactive_installs"] * row.get("unit_cost_usd", 0)
+    reclaimable = reclaim_value(filtered)
 
-    if reclaim_value > 0:
+    if reclaimable > 0:
         alerts.append({
             "icon": "💰",
             "priority": 3,
-            "message": f"SAVINGS OPPORTUNITY: Reclaim {fmt_currency(reclaim_value)} from {int(inactive_total)} inactive user{'s' if inactive_total > 1 else ''}",
+            "message": f"SAVINGS OPPORTUNITY: Reclaim {fmt_currency(reclaimable)} from {int(inactive_total)} inactive user{'s' if inactive_total > 1 else ''}",
             "products": ""
         })
 
@@ -634,14 +588,11 @@ st.subheader("Portfolio Insights")
 # Create 3 columns for charts
 chart_col1, chart_col2, chart_col3 = st.columns(3)
 
-with chart_col1:
+with chart_col1, stage("chart:license_type", rows=len(filtered)):
     # Subscription vs Perpetual breakdown
     st.markdown("**License Type Distribution**")
     if "license_type" in filtered.columns:
-        license_counts = filtered.groupby("license_type").agg(
-            count=("software", "count"),
-            total_spend=("unit_cost_usd", lambda x: (x * filtered.loc[x.index, "seats_purchased"]).sum())
-        ).reset_index()
+        license_counts = license_type_mix(filtered)
 
         fig_license = px.pie(
             license_counts,
@@ -653,14 +604,11 @@ with chart_col1:
         fig_license.update_layout(showlegend=False, height=250, margin=dict(t=0, b=0, l=0, r=0))
         st.plotly_chart(fig_license, use_container_width=True)
 
-with chart_col2:
+with chart_col2, stage("chart:top_vendors", rows=len(filtered)):
     # Top 5 vendors by spend
     st.markdown("**Top Vendors by Spend**")
     if "vendor" in filtered.columns and "unit_cost_usd" in filtered.columns:
-        vendor_spend = filtered.groupby("vendor").apply(
-            lambda x: (x["unit_cost_usd"] * x["seats_purchased"]).sum()
-        ).sort_values(ascending=False).head(5).reset_index()
-        vendor_spend.columns = ["vendor", "total_spend"]
+        vendor_spend = top_vendors_by_spend(filtered, n=5)
 
         fig_vendor = px.bar(
             vendor_spend,
@@ -678,17 +626,13 @@ with chart_col2:
         )
         st.plotly_chart(fig_vendor, use_container_width=True)
 
-with chart_col3:
+with chart_col3, stage("chart:renewal_timeline", rows=len(filtered)):
     # Contracts expiring in next 90 days
     st.markdown("**Renewal Timeline (90 days)**")
-    expiring_90 = filtered[filtered["contract_days_remaining"] <= 90].sort_values("contract_days_remaining")
+    expiring_90_display = renewal_timeline(filtered, within_days=90, limit=10)  # Top 10 soonest
 
-    if len(expiring_90) > 0:
+    if len(expiring_90_display) > 0:
         # Create timeline chart
-        expiring_90_display = expiring_90.head(10).copy()  # Top 10 soonest
-        expiring_90_display["color"] = expiring_90_display["contract_days_remaining"].apply(
-            lambda x: "Urgent (<30d)" if x <= 30 else "Soon (30-90d)"
-        )
 
         fig_timeline = px.bar(
             expiring_90_display,
@@ -722,7 +666,8 @@ st.subheader("Effective License Position & Risks", help="📊 ELP = Seats Purcha
 display_cols = ["software", "vendor", "license_type", "seats_purchased", "seats_used", "elp", "overage", "seats_unused"]
 
 # Add overage indicator column
-filtered["overage_alert"] = filtered["overage"].apply(lambda x: "⚠️" if x > 0 else "")
+# (assign, not in-place: the filtered frame is a shared cache entry)
+filtered = filtered.assign(overage_alert=filtered["overage"].apply(lambda x: "⚠️" if x > 0 else ""))
 
 display_df = filtered[["overage_alert"] + display_cols + ["unit_cost_usd", "potential_savings_usd", "contract_end", "contract_days_remaining", "renewal_due", "inactive_installs"]].copy()
 
@@ -743,7 +688,8 @@ final_display = display_df[[
     "contract_end_fmt": "contract_end"
 })
 
-st.dataframe(final_display, use_container_width=True)
+with stage("render_dataframe", rows=len(final_display)):
+    st.dataframe(final_display, use_container_width=True)
 
 st.caption(f"📊 Active seats counted by: **{'unique users' if count_by_user else 'unique devices'}** (change in sidebar settings)")
 
@@ -753,29 +699,23 @@ st.caption(f"📊 Active seats counted by: **{'unique users' if count_by_user el
 
 st.subheader("Find Optimizations", help="💡 Identify wasted spend: terminated users with licenses, and active users who aren't using their software")
 
+# Both reclaim lists (and their display columns) are built once per dataset version and day, so a
+# rerun (page flip, sort change) only slices the visible page
+reclaim = get_reclaim_installs(today)
+
 # Inactive users consuming installs
-inactive = installs_users[installs_users["status"] == "terminated"].copy()
+inactive = reclaim["terminated"]
 st.markdown("**🔴 Inactive users still holding installs (Reclaim Now):**")
 st.caption("These users are terminated but still have software installed. You can reclaim these seats immediately for instant savings.")
-inactive_display_cols = ["user_email", "software", "device_id", "last_used_date"]
-if "department" in inactive.columns:
-    inactive_display_cols.append("department")
-st.dataframe(inactive[inactive_display_cols], use_container_width=True)
+# Sorted, filtered and paged on the server: only the visible page is sent to the browser
+paged_dataframe("inactive_installs", reclaim["terminated_display"], column_config=DATE_COLUMN_CONFIG)
 st.caption(f"💰 {len(inactive)} installations to reclaim from terminated users → Remove their licenses to save money")
 
 # Low-usage candidates (no use in last 60 days)
 st.markdown("**⚠️ Low-usage installs (no activity in 60+ days):**")
 st.caption("These active users haven't used their software in 60+ days. Consider reaching out to confirm they still need it before renewal.")
-threshold = today - timedelta(days=60)
-low = installs_users[
-    ((pd.to_datetime(installs_users["last_used_date"]) < pd.to_datetime(threshold)) |
-     (installs_users["last_used_date"].isna())) &
-    (installs_users["status"] == "active")  # Only active users (terminated are in reclaim)
-].copy()
-low_display_cols = ["user_email", "software", "device_id", "last_used_date"]
-if "department" in low.columns:
-    low_display_cols.append("department")
-st.dataframe(low[low_display_cols], use_container_width=True)
+low = reclaim["low_usage"]  # Only active users (terminated are in reclaim)
+paged_dataframe("low_usage_installs", reclaim["low_usage_display"], column_config=DATE_COLUMN_CONFIG, today=today)
 st.caption(f"💡 {len(low)} low-usage installations → Contact these users to verify if they still need their licenses")
 
 # ============================================================================
@@ -784,43 +724,44 @@ st.caption(f"💡 {len(low)} low-usage installations → Contact these users to
 
 st.subheader("Export", help="📁 Download data as CSV to share with stakeholders, import into Excel, or upload to ServiceNow")
 
-def to_csv(df):
-    """Convert dataframe to CSV bytes."""
-    return df.to_csv(index=False).encode("utf-8")
+export_format = st.selectbox(
+    "Export format",
+    list(EXPORT_FORMATS),
+    format_func=lambda fmt: EXPORT_FORMATS[fmt][0],
+    key="export_format",
+    help="🗜️ gzip/zip downloads of large lists are several times smaller; Parquet loads straight into pandas, Power BI or Spark"
+)
+export_label = EXPORT_FORMATS[export_format][0]
 
+# Files are generated (in chunks) when a button is clicked, and cached per dataset version, filters and format
 col1, col2, col3 = st.columns(3)
 
 with col1:
     st.download_button(
-        "📥 Download ELP Report (CSV)",
-        data=to_csv(filtered),
-        file_name="opensam_elp_report.csv",
-        mime="text/csv",
+        f"📥 Download ELP Report ({export_label})",
+        **lazy_download("opensam_elp_report", filtered, export_format, count_by_user=count_by_user, today=today,
+                        vendors=vendor_filter, only_subs=only_subs, risk=risk_filter, min_savings=min_savings),
         use_container_width=True,
         help="Full license position data with all fields"
     )
 
 with col2:
     st.download_button(
-        "📥 Download Inactive Installs (CSV)",
-        data=to_csv(inactive),
-        file_name="opensam_inactive_installs.csv",
-        mime="text/csv",
+        f"📥 Download Inactive Installs ({export_label})",
+        **lazy_download("opensam_inactive_installs", inactive, export_format),
         use_container_width=True,
         help="List of terminated users with licenses to reclaim"
     )
 
 with col3:
     st.download_button(
-        "📥 Download Low-Usage Installs (CSV)",
-        data=to_csv(low),
-        file_name="opensam_low_usage.csv",
-        mime="text/csv",
+        f"📥 Download Low-Usage Installs ({export_label})",
+        **lazy_download("opensam_low_usage", low, export_format, today=today),
         use_container_width=True,
         help="Users with no activity in 60+ days"
     )
 
-st.caption("✅ All CSV exports respect current filter selections")
+st.caption("✅ All exports respect current filter selections")
 
 # ============================================================================
 # Footer
@@ -834,3 +775,5 @@ with col1:
 with col2:
     if st.button("🚀 Upgrade to Pro", use_container_width=True, help="Get custom features, integrations, and hosted deployment"):
         st.info("**AppForge Labs Pro Features:**\n\n✅ Custom integrations (SCCM, Intune, ServiceNow)\n✅ Automated data sync\n✅ Advanced analytics & forecasting\n✅ White-label deployment\n✅ Dedicated support\n\n📧 Contact: paulsemaan007@gmail.com")
+
+finish_page()
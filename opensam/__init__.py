@@ -0,0 +1,38 @@
+"""OpenSAM computation library.
+
+Pure pandas functions behind the Streamlit pages, usable from batch jobs,
+worker processes and benchmarks without a Streamlit runtime::
+
+    from opensam import load_dataset, join_users, software_usage, license_position
+
+    data, version = load_dataset("data")
+    installs_users = join_users(data["installs"], data["users"])
+    sam = license_position(data["licenses"], software_usage(installs_users), today)
+
+``opensam.app_data`` is the only module that imports Streamlit.
+"""
+
+from opensam.departments import allocate_spend, department_installs, department_stats, software_breakdown
+from opensam.enrich import join_licenses, join_users
+from opensam.history import HistoryStore
+from opensam.ingest import LiveDataset, delta_paths, read_delta, upsert_installs
+from opensam.portfolio import (
+    filter_mask, filter_positions, license_position, license_type_mix, low_usage_installs, reclaim_value,
+    renewal_timeline, risk_flags, terminated_installs, top_vendors_by_spend,
+)
+from opensam.products import (
+    ProductIndex, installs_for_product, license_terms, product_license, product_position, seat_count,
+)
+from opensam.renewals import (
+    RenewalIndex, alert_icons, days_until, renewal_forecast, renewal_metrics, renewal_schedule, schedule_totals,
+    servicenow_export, term_months,
+)
+from opensam.scenarios import (
+    lru_seats, need_probabilities, optimize_reductions, portfolio_overage_risk, removal_candidates, scenario_impact,
+    simulate_overage,
+)
+from opensam.schema import TABLE_SCHEMAS, align_categories, apply_schema
+from opensam.sqlite_store import SQLiteStore
+from opensam.storage import compact_deltas, dataset_version, load_dataset, read_csv_cached, read_table
+from opensam.timing import latency_summary
+from opensam.usage import software_usage
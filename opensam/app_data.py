@@ -0,0 +1,575 @@
+"""Base and derived tables shared by every page and browser session.
+
+The base tables are loaded once per dataset version into a process-wide
+``st.cache_resource`` entry (``get_data``); sessions keep only the version,
+the data directory and their widget state, never their own frames (see
+``session_state_bytes``). One ``LiveDataset`` (see opensam.ingest) per dataset version is cached
+process-wide with ``st.cache_resource``, keyed by the version ``load_data``
+(app.py) records in session_state, so joins and aggregates run once per
+version of the data/ files rather than once per rerun. Installation deltas
+dropped in ``data/deltas/`` are picked up on the next rerun and applied
+incrementally. The returned frames are shared: treat them as read-only and
+add columns with ``.assign`` or on a ``.copy(deep=False)``.
+
+With ``OPENSAM_BACKEND=duckdb`` the usage, ELP, department and renewal tables
+come from opensam.duckdb_backend instead (database file optionally set with
+``OPENSAM_DUCKDB_PATH``); installs-level frames still come from pandas.
+
+With ``OPENSAM_STORE=sqlite`` the per-product, per-department and renewal
+window slices are queried from the indexed opensam.sqlite_store file (path
+optionally set with ``OPENSAM_SQLITE_PATH``) instead of filtering the
+process-wide joins.
+
+The home page's Quick Views and Advanced Filters go through
+``get_filtered_positions``: risk bitmasks are computed once per ELP table and
+each filter combination's result is cached, so switching presets is a lookup.
+
+Large install tables are rendered with ``paged_dataframe``: sorted, filtered
+and paged on the server, so only the visible page is sent to the browser.
+
+Each dataset state (version plus applied deltas) is recorded once as a dated
+snapshot in the opensam.history store (``data/.history`` unless
+``OPENSAM_HISTORY_DIR`` is set); ``get_usage_trend`` reads usage trends back
+for a product or department.
+
+Pages open a timing run with ``start_page`` and close it with ``finish_page``,
+which appends the run to a JSONL log (``logs/timing.jsonl`` unless
+``OPENSAM_TIMING_LOG`` is set; empty disables it) and, when enabled in the
+sidebar, shows the stage timings of the run (see opensam.timing).
+
+Download buttons get their payload through ``lazy_csv`` / ``lazy_download``: a
+callable Streamlit runs only when the button is clicked, with the bytes cached
+per dataset version, filter selection and export format.
+"""
+
+import hashlib
+import os
+import sys
+
+import pandas as pd
+import streamlit as st
+
+from opensam.departments import department_installs
+from opensam.exports import EXPORT_FORMATS, export_bytes, export_filename
+from opensam.history import HISTORY_DIRNAME, HistoryStore
+from opensam.ingest import LiveDataset, delta_paths
+from opensam.portfolio import (
+    filter_positions, license_position, low_usage_installs, risk_flags, terminated_installs,
+)
+from opensam.products import product_position, seat_count
+from opensam.renewals import (
+    FORECAST_MONTHS, RenewalIndex, renewal_forecast, renewal_metrics, renewal_schedule, schedule_totals,
+)
+from opensam.scenarios import (
+    lru_seats, need_probabilities, optimize_reductions, portfolio_overage_risk, removal_candidates, simulate_overage,
+)
+from opensam.storage import load_dataset
+from opensam.tables import PAGE_SIZES, match_mask, page_positions, sort_positions
+from opensam.timing import current_run, finish_run, mark_miss, recent_latency, stage, stage_table, start_run
+
+# Keep a couple of versions around so sessions still on older data are not evicted immediately
+MAX_CACHED_VERSIONS = 2
+MAX_CACHED_EXPORTS = 16
+MAX_CACHED_TABLE_STATES = 32
+MAX_CACHED_FILTERS = 32
+MAX_CACHED_RANKINGS = 64
+# Per-session budget: sessions keep widget state only, so anything near this is a frame stored by mistake
+MAX_SESSION_STATE_BYTES = 1 << 20
+BACKEND = os.environ.get("OPENSAM_BACKEND", "pandas").lower()
+STORE = os.environ.get("OPENSAM_STORE", "memory").lower()
+# Processes for the portfolio overage simulation (1 = in the app process)
+SIMULATION_WORKERS = int(os.environ.get("OPENSAM_WORKERS", "1"))
+# Snapshot history location (default: .history in the data directory)
+HISTORY_DIR = os.environ.get("OPENSAM_HISTORY_DIR")
+TIMING_LOG = os.environ.get("OPENSAM_TIMING_LOG", os.path.join("logs", "timing.jsonl"))
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_VERSIONS)
+def _dataset(version, data_dir):
+    mark_miss()
+    return load_dataset(data_dir, apply_deltas=False)[0]
+
+
+def get_data():
+    """The session's base tables (typed, categories aligned), shared read-only by every session on that version."""
+    return _dataset(st.session_state["data_version"], st.session_state.get("data_dir", "data"))
+
+
+def session_state_bytes():
+    """Approximate bytes held by this session's state, per key, largest first.
+
+    Frames are measured with their deep memory usage, arrays by nbytes and
+    anything else with ``sys.getsizeof``.
+    """
+    sizes = {}
+    for key, value in st.session_state.items():
+        if isinstance(value, pd.DataFrame):
+            size = int(value.memory_usage(deep=True).sum())
+        elif isinstance(value, pd.Series):
+            size = int(value.memory_usage(deep=True))
+        else:
+            size = getattr(value, "nbytes", None) or sys.getsizeof(value)
+        sizes[str(key)] = size
+    return dict(sorted(sizes.items(), key=lambda item: item[1], reverse=True))
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_VERSIONS)
+def _live_dataset(version, _installs, _users, _licenses):
+    mark_miss()
+    return LiveDataset(_installs, _users, _licenses)
+
+
+def get_live_dataset():
+    """The session's LiveDataset, with any new delta files applied."""
+    data = get_data()
+    live = _live_dataset(st.session_state["data_version"], data["installs"], data["users"], data["licenses"])
+    live.sync(delta_paths(st.session_state.get("data_dir", "data")))
+    return live
+
+
+@st.cache_resource(show_spinner=False)
+def _duckdb_backend(data_dir):
+    from opensam.duckdb_backend import DuckDBBackend
+    return DuckDBBackend(data_dir, database=os.environ.get("OPENSAM_DUCKDB_PATH", ":memory:"))
+
+
+@st.cache_resource(show_spinner=False, max_entries=8 * MAX_CACHED_VERSIONS)
+def _sql_table(state, method, args, _backend):
+    return getattr(_backend, method)(*args)
+
+
+def _sql(method, *args):
+    """``DuckDBBackend.<method>(*args)``, cached until the sources or deltas change."""
+    backend = _duckdb_backend(st.session_state.get("data_dir", "data"))
+    backend.refresh()
+    return _sql_table((backend.version, len(backend.applied)), method, args, backend)
+
+
+@st.cache_resource(show_spinner=False)
+def _sqlite_store(data_dir):
+    from opensam.sqlite_store import SQLiteStore
+    return SQLiteStore(data_dir, path=os.environ.get("OPENSAM_SQLITE_PATH"))
+
+
+def _store():
+    """The SQLite store for the session's data directory, with new sources and deltas applied."""
+    store = _sqlite_store(st.session_state.get("data_dir", "data"))
+    store.refresh()
+    return store
+
+
+def get_installs_users():
+    """installs ⋈ users for the session's dataset version (status filled as "unknown")."""
+    with stage("join_installs_users", cached=True) as timing:
+        installs_users = get_live_dataset().installs_users
+        timing["rows"] = len(installs_users)
+    return installs_users
+
+
+# Columns the home page shows for the reclaim lists (department only when present)
+RECLAIM_DISPLAY_COLUMNS = ["user_email", "software", "device_id", "last_used_date", "department"]
+
+
+@st.cache_resource(show_spinner=False, max_entries=2 * MAX_CACHED_VERSIONS)
+def _reclaim_installs(key, today, _installs_users):
+    mark_miss()
+    lists = {
+        "terminated": terminated_installs(_installs_users),
+        "low_usage": low_usage_installs(_installs_users, today),
+    }
+    for name, frame in list(lists.items()):
+        lists[f"{name}_display"] = frame[[col for col in RECLAIM_DISPLAY_COLUMNS if col in frame.columns]]
+    return lists
+
+
+def get_reclaim_installs(today):
+    """Terminated users' installs and active users' low-usage installs, each with a display-column copy.
+
+    Keys: terminated, terminated_display, low_usage, low_usage_display.
+    Built once per dataset state and day and shared, so treat them as read-only.
+    """
+    installs_users = get_installs_users()
+    key = selection_key("reclaim_installs", {"today": today})
+    with stage("reclaim_lists", rows=len(installs_users), cached=True):
+        return _reclaim_installs(key, today, installs_users)
+
+
+def get_installs_users_licenses():
+    """installs ⋈ users ⋈ licenses cost columns for the session's dataset version."""
+    with stage("join_installs_licenses") as timing:
+        installs_users_licenses = get_live_dataset().installs_users_licenses()
+        timing["rows"] = len(installs_users_licenses)
+    return installs_users_licenses
+
+
+def get_software_usage(count_by_user):
+    """Per-software usage table (see opensam.usage) for the session's dataset version."""
+    if BACKEND == "duckdb":
+        return _sql("software_usage", count_by_user)
+    live = get_live_dataset()
+    with stage("usage_groupby", rows=len(live.installs_users)):
+        return live.software_usage(count_by_user)
+
+
+@st.cache_resource(show_spinner=False, max_entries=4 * MAX_CACHED_VERSIONS)
+def _license_position(key, today, _licenses, _usage):
+    mark_miss()
+    return license_position(_licenses, _usage, today)
+
+
+def get_license_position(count_by_user, today):
+    """Licenses with ELP, overage, renewal and savings columns (see opensam.portfolio)."""
+    if BACKEND == "duckdb":
+        return _sql("license_position", today, count_by_user)
+    key = selection_key("license_position", {"count_by_user": count_by_user, "today": today})
+    licenses, usage = get_data()["licenses"], get_software_usage(count_by_user)
+    with stage("build_sam", rows=len(licenses), cached=True):
+        return _license_position(key, today, licenses, usage)
+
+
+@st.cache_resource(show_spinner=False, max_entries=4 * MAX_CACHED_VERSIONS)
+def _risk_flags(key, _sam):
+    return risk_flags(_sam)
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_FILTERS)
+def _filtered_positions(key, vendors, only_subs, risk, min_savings, _sam, _flags):
+    mark_miss()
+    return filter_positions(_sam, vendors, only_subs, risk, min_savings, flags=_flags)
+
+
+def get_filtered_positions(count_by_user, today, vendors=(), only_subs=False, risk="All", min_savings=0):
+    """ELP rows matching the home page filters (see opensam.portfolio.filter_positions).
+
+    Risk flags are computed once per position table; the result is cached per
+    filter combination and shared, so treat it as read-only.
+    """
+    key = selection_key("license_position", {"count_by_user": count_by_user, "today": today})
+    sam = get_license_position(count_by_user, today)
+    with stage("filter", rows=len(sam), cached=True):
+        flags = _risk_flags(key, sam)
+        return _filtered_positions(key, tuple(sorted(vendors or ())), only_subs, risk, min_savings, sam, flags)
+
+
+def get_department_stats(count_by_user):
+    """Per-department seat and reclaim statistics (see opensam.departments) for the session's dataset version."""
+    if BACKEND == "duckdb":
+        return _sql("department_stats", count_by_user)
+    return get_live_dataset().department_stats(count_by_user)
+
+
+@st.cache_resource(show_spinner=False, max_entries=2 * MAX_CACHED_VERSIONS)
+def _renewal_metrics(key, today, _licenses, _vendors):
+    return renewal_metrics(_licenses, _vendors, today)
+
+
+def get_renewal_metrics(today):
+    """Licenses joined to vendor notice periods with renewal timing columns (see opensam.renewals)."""
+    if BACKEND == "duckdb":
+        return _sql("renewal_metrics", today)
+    data = get_data()
+    return _renewal_metrics(selection_key("renewal_metrics", {"today": today}), today, data["licenses"], data["vendors"])
+
+
+@st.cache_resource(show_spinner=False, max_entries=2 * MAX_CACHED_VERSIONS)
+def _renewal_index(key, _renewals):
+    return RenewalIndex(_renewals)
+
+
+def _renewals_by_end(today):
+    return _renewal_index(selection_key("renewal_index", {"today": today}), get_renewal_metrics(today))
+
+
+def get_renewal_schedule(today, vendors=None, only_subs=False, max_days=90):
+    """Renewal metrics for the contracts matching the radar filters, soonest renewal first."""
+    if STORE == "sqlite":
+        return renewal_schedule(_store().renewal_metrics(today, max_days), vendors, only_subs, max_days)
+    return _renewals_by_end(today).schedule(vendors, only_subs, max_days)
+
+
+def get_renewal_totals(today, vendors=None, only_subs=False, max_days=90):
+    """Radar KPIs for the same window (see opensam.renewals.schedule_totals), from prefix sums in memory."""
+    if STORE == "sqlite":
+        return schedule_totals(get_renewal_schedule(today, vendors, only_subs, max_days))
+    return _renewals_by_end(today).totals(vendors, only_subs, max_days)
+
+
+@st.cache_resource(show_spinner=False, max_entries=2 * MAX_CACHED_VERSIONS)
+def _renewal_forecast(key, today, months, _licenses):
+    return renewal_forecast(_licenses, today, months)
+
+
+def get_renewal_forecast(today, months=FORECAST_MONTHS):
+    """Monthly renewal spend by vendor and license_type for the next ``months`` months (see opensam.renewals)."""
+    licenses = get_data()["licenses"]
+    key = selection_key("renewal_forecast", {"today": today, "months": months})
+    return _renewal_forecast(key, today, months, licenses)
+
+
+def _product_source():
+    # Where per-product installs are read from: the SQLite store or the in-memory product index
+    return _store() if STORE == "sqlite" else get_live_dataset().product_index()
+
+
+def _product_installs(source, software):
+    if STORE == "sqlite":
+        return source.product_installs(software)
+    return source.installs(software)
+
+
+def get_product_installs(software):
+    """installs ⋈ users rows for one product."""
+    return _product_installs(_product_source(), software)
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_RANKINGS)
+def _product_seats(key, software, count_by_user, _source):
+    installs = _product_installs(_source, software)
+    return {
+        "active": seat_count(installs[installs["status"] == "active"], count_by_user),
+        "terminated": seat_count(installs[installs["status"] == "terminated"], count_by_user),
+        "has_last_used": "last_used_date" in installs.columns,
+    }
+
+
+def get_product_seats(software, count_by_user):
+    """Active and terminated seats held on ``software``, and whether its installs carry last_used_date.
+
+    Cached per product and seat mode, so Scenario Planning reruns read no installs.
+    """
+    key = selection_key("product_seats", {"product": software})
+    return _product_seats(key, software, count_by_user, _product_source())
+
+
+def get_product_position(license_info, software, count_by_user, today):
+    """Product Drilldown metrics and install tables for ``software`` (see opensam.products.product_position)."""
+    if STORE == "sqlite":
+        return product_position(license_info, _store().product_installs(software), count_by_user, today)
+    return get_live_dataset().product_index().product_position(license_info, software, count_by_user, today)
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_RANKINGS)
+def _removal_ranking(key, software, count_by_user, exclude_terminated, _source):
+    return removal_candidates(_product_installs(_source, software), count_by_user, exclude_terminated)
+
+
+def get_removal_ranking(software, count_by_user, exclude_terminated=True):
+    """Scenario Planning's removal order for ``software`` (see opensam.scenarios.removal_candidates).
+
+    Ranked once per product, seat mode and terminated setting (the product's
+    installs are only read on a miss), so the "Reduce N seats" slider only
+    takes a prefix. Shared: treat it as read-only.
+    """
+    key = selection_key("removal_ranking", {"product": software})
+    return _removal_ranking(key, software, count_by_user, exclude_terminated, _product_source())
+
+
+@st.cache_resource(show_spinner=False, max_entries=2 * MAX_CACHED_VERSIONS)
+def _lru_seats(key, count_by_user, _installs_users):
+    return lru_seats(_installs_users, count_by_user)
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_FILTERS)
+def _reduction_plan(key, target_savings, max_overage, _positions, _seats):
+    return optimize_reductions(_positions, _seats, target_savings, max_overage)
+
+
+def get_reduction_plan(count_by_user, today, target_savings=None, max_overage=0):
+    """Portfolio-wide seat reductions (see opensam.scenarios.optimize_reductions).
+
+    The LRU ranking of every product's seats is built once per dataset
+    version and seat mode; each target / risk limit is then solved once.
+    """
+    seats = _lru_seats(selection_key("lru_seats", {"count_by_user": count_by_user}), count_by_user, get_installs_users())
+    key = selection_key("reduction_plan", {"count_by_user": count_by_user, "today": today})
+    return _reduction_plan(key, target_savings, max_overage, get_license_position(count_by_user, today), seats)
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_RANKINGS)
+def _need_probabilities(key, software, count_by_user, today, _source):
+    return need_probabilities(_product_installs(_source, software), count_by_user, today)
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_RANKINGS)
+def _overage_risk(key, count_by_user, today, seats, _probabilities):
+    return simulate_overage(_probabilities, seats)
+
+
+def get_overage_risk(software, count_by_user, today, seats):
+    """Simulated chance that ``software``'s active seats need more than ``seats`` (see opensam.scenarios.simulate_overage).
+
+    The product's installs are read once per product, seat mode and day; a
+    new seat count only reruns the simulation.
+    """
+    key = selection_key("overage_risk", {"product": software})
+    probabilities = _need_probabilities(key, software, count_by_user, today, _product_source())
+    return _overage_risk(key, count_by_user, today, seats, probabilities)
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_FILTERS)
+def _plan_risk(key, count_by_user, today, target_savings, max_overage, _plan, _installs_users):
+    return portfolio_overage_risk(_plan, _installs_users, count_by_user, today, workers=SIMULATION_WORKERS)
+
+
+def get_plan_risk(count_by_user, today, target_savings=None, max_overage=0):
+    """Simulated overage risk of every product in ``get_reduction_plan``'s plan, with OPENSAM_WORKERS processes."""
+    plan = get_reduction_plan(count_by_user, today, target_savings, max_overage)["plan"]
+    key = selection_key("plan_risk", {})
+    return _plan_risk(key, count_by_user, today, target_savings, max_overage, plan, get_installs_users())
+
+
+def get_department_installs(department):
+    """installs ⋈ users ⋈ licenses rows for one department."""
+    if STORE == "sqlite":
+        return _store().department_installs(department)
+    return department_installs(get_installs_users_licenses(), department)
+
+
+@st.cache_resource(show_spinner=False)
+def _history_store(root):
+    return HistoryStore(root)
+
+
+def _history():
+    return _history_store(HISTORY_DIR or os.path.join(st.session_state.get("data_dir", "data"), HISTORY_DIRNAME))
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_VERSIONS)
+def _recorded_snapshot(state, snapshot_date, _snapshots, _installs_users):
+    try:
+        return _snapshots.record(_installs_users, snapshot_date, version=state)
+    except OSError:
+        # Read-only deployments just go without history
+        return 0
+
+
+def record_snapshot(today):
+    """Record the session's installs (deltas applied) in the history store, once per dataset state."""
+    live = get_live_dataset()
+    state = f"{st.session_state['data_version']}+{len(live.applied)}"
+    return _recorded_snapshot(state, today, _history(), live.installs_users)
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_FILTERS)
+def _usage_trend(key, software, start, freq, _users, _snapshots):
+    return _snapshots.usage_trend(software, _users, start, None, freq)
+
+
+def get_usage_trend(software=None, department=None, start=None, freq="W"):
+    """Recorded uses per period for one product or department (see opensam.history.HistoryStore.usage_trend)."""
+    users = None
+    if department is not None:
+        users = get_department_installs(department)["user_email"].dropna().unique().tolist()
+    key = selection_key("usage_trend", {"software": software, "department": department, "start": start, "freq": freq})
+    return _usage_trend(key, software, start, freq, users, _history())
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_EXPORTS)
+def _export_payload(key, fmt, member, _frame):
+    mark_miss()
+    return export_bytes(_frame, fmt, member)
+
+
+def _timed_export(name, key, fmt, member, frame):
+    # Streamlit calls this on click, normally outside any page run, so it is logged as a run of its own
+    own_run = current_run() is None
+    if own_run:
+        start_run(f"export:{name}")
+    try:
+        with stage(f"export:{fmt}", rows=len(frame), cached=True):
+            return _export_payload(key, fmt, member, frame)
+    finally:
+        if own_run:
+            finish_run(TIMING_LOG)
+
+
+def selection_key(name, filters):
+    """Hash of the session's dataset version (plus applied deltas), the export ``name`` and ``filters``."""
+    data_dir = st.session_state.get("data_dir", "data")
+    state = (st.session_state.get("data_version"), delta_paths(data_dir), name, sorted(filters.items()))
+    return hashlib.sha256(repr(state).encode()).hexdigest()
+
+
+def lazy_export(name, frame, fmt="csv", **filters):
+    """``data=`` for st.download_button: ``frame`` encoded as ``fmt``, built on the first click only.
+
+    ``filters`` must name everything besides the dataset that ``frame``
+    depends on (selected product, seat mode, filter widgets, today's date);
+    repeated clicks and reruns with the same selection reuse the cached bytes.
+    """
+    key = selection_key(name, filters)
+    return lambda: _timed_export(name, key, fmt, f"{name}.csv", frame)
+
+
+def lazy_csv(name, frame, **filters):
+    """``lazy_export`` as CSV."""
+    return lazy_export(name, frame, "csv", **filters)
+
+
+def lazy_download(stem, frame, fmt="csv", **filters):
+    """``data``, ``file_name`` and ``mime`` arguments for st.download_button exporting ``frame`` as ``fmt``."""
+    return {
+        "data": lazy_export(stem, frame, fmt, **filters),
+        "file_name": export_filename(stem, fmt),
+        "mime": EXPORT_FORMATS[fmt][2],
+    }
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_TABLE_STATES)
+def _sort_positions(key, column, ascending, _frame):
+    return sort_positions(_frame, column, ascending)
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_TABLE_STATES)
+def _match_mask(key, text, _frame):
+    return match_mask(_frame, text)
+
+
+def paged_dataframe(name, frame, column_config=None, **filters):
+    """st.dataframe showing one page of ``frame``, with sort, text filter and page-size controls.
+
+    The sort order and filter mask are computed once per selection (see
+    ``lazy_export`` for ``filters``) and cached; each rerun only slices the
+    visible page out of ``frame``.
+    """
+    key = selection_key(name, filters)
+    columns = [None] + list(frame.columns)
+    c1, c2, c3, c4, c5 = st.columns([3, 2, 1, 1, 1])
+    with c1:
+        text = st.text_input("Filter", key=f"{name}_filter", placeholder="Search text columns…")
+    with c2:
+        sort_by = st.selectbox("Sort by", columns, format_func=lambda c: "(original order)" if c is None else c,
+                               key=f"{name}_sort")
+    with c3:
+        descending = st.toggle("Descending", key=f"{name}_desc")
+    with c4:
+        page_size = st.selectbox("Rows", PAGE_SIZES, index=1, key=f"{name}_page_size")
+    order = _sort_positions(key, sort_by, not descending, frame)
+    mask = _match_mask(key, text.strip(), frame) if text.strip() else None
+    with c5:
+        # Clamped to the last page below, so narrowing the filter never errors
+        page = st.number_input("Page", min_value=1, value=1, step=1, key=f"{name}_page")
+    positions, total, pages, page = page_positions(order, mask, page, page_size)
+    with stage("render_dataframe", rows=len(positions)):
+        st.dataframe(frame.iloc[positions], use_container_width=True, column_config=column_config)
+    first = (page - 1) * page_size
+    st.caption(f"Rows {min(first + 1, total):,}–{first + len(positions):,} of {total:,} · page {page} of {pages}")
+
+
+def start_page(page):
+    """Start timing this run of ``page`` (see opensam.timing)."""
+    start_run(page)
+
+
+def finish_page():
+    """Log this run's stage timings and, if enabled in the sidebar, show them there."""
+    run = finish_run(TIMING_LOG)
+    if run is None or not st.session_state.get("show_timings"):
+        return
+    runs, p50, p95 = recent_latency(run["page"])
+    with st.sidebar.expander("⏱️ Performance", expanded=True):
+        st.caption(f"This run: **{run['seconds'] * 1000:,.0f} ms** · p50 {p50 * 1000:,.0f} ms · "
+                   f"p95 {p95 * 1000:,.0f} ms over the last {runs} runs of this page")
+        stages = stage_table(run)
+        stages["ms"] = (stages.pop("seconds") * 1000).round(1)
+        st.dataframe(stages[["stage", "ms", "rows", "cache"]], hide_index=True, use_container_width=True)
@@ -0,0 +1,75 @@
+"""Per-department seat and reclaim statistics for Department Allocation."""
+
+from opensam.portfolio import is_subscription
+from opensam.usage import aligned_counts, status_counts
+
+DEPARTMENT_COLUMNS = ["department", "used_seats", "terminated_seats", "total_installs", "reclaimable_savings"]
+
+
+def department_stats(installs_users_licenses, count_by_user=False):
+    """used_seats, terminated_seats, total_installs and reclaimable_savings per department.
+
+    Expects the output of ``opensam.enrich.join_licenses``. Reclaimable savings
+    are the unit costs of terminated subscription seats: every install in
+    device mode, one cost per terminated user (their first install) in user mode.
+    """
+    frame = installs_users_licenses
+
+    if count_by_user:
+        stats = frame.groupby("department", observed=True).agg(total_installs=("user_email", "nunique"))
+    else:
+        stats = frame.groupby("department", observed=True).agg(total_installs=("device_id", "count"))
+
+    counts = status_counts(frame, "department", count_by_user)
+    stats["used_seats"] = aligned_counts(counts["active"], stats.index)
+    stats["terminated_seats"] = aligned_counts(counts["terminated"], stats.index)
+
+    reclaimable = frame.loc[
+        (frame["status"] == "terminated") & frame["is_subscription"],
+        ["department", "user_email", "unit_cost_usd"]
+    ]
+    if count_by_user:
+        # Multi-device users are charged once, at the cost of their first listed install
+        reclaimable = reclaimable.dropna(subset=["user_email"]).drop_duplicates(["department", "user_email"])
+    savings = reclaimable.groupby("department", observed=True)["unit_cost_usd"].sum()
+    stats["reclaimable_savings"] = savings.reindex(stats.index).fillna(0).astype("float64")
+
+    return stats.reset_index()[DEPARTMENT_COLUMNS]
+
+
+def allocate_spend(dept_stats, licenses):
+    """Add share_of_spend and share_percent, allocating subscription spend by used seats.
+
+    Returns a new frame sorted by share_of_spend, largest first.
+    """
+    dept_stats = dept_stats.copy()
+    total_used_seats = dept_stats["used_seats"].sum()
+
+    if total_used_seats > 0:
+        # Total portfolio cost (subscription licenses only)
+        subscriptions = licenses[is_subscription(licenses["license_type"])]
+        total_portfolio_cost = subscriptions["unit_cost_usd"].sum() * subscriptions["seats_purchased"].sum()
+
+        # Allocate proportionally
+        dept_stats["share_of_spend"] = (dept_stats["used_seats"] / total_used_seats) * total_portfolio_cost
+        dept_stats["share_percent"] = (dept_stats["used_seats"] / total_used_seats) * 100
+    else:
+        dept_stats["share_of_spend"] = 0
+        dept_stats["share_percent"] = 0
+
+    return dept_stats.sort_values("share_of_spend", ascending=False)
+
+
+def department_installs(installs_users_licenses, department):
+    """Installs belonging to one department."""
+    return installs_users_licenses[installs_users_licenses["department"] == department]
+
+
+def software_breakdown(dept_installs, count_by_user=False):
+    """Software x status seat counts for one department's installs."""
+    breakdown = dept_installs.groupby(["software", "status"], observed=True).agg(
+        count=("device_id", "count" if not count_by_user else "nunique")
+    ).reset_index()
+    # Pivot on plain strings so status headers stay sorted (status is categorical)
+    breakdown["status"] = breakdown["status"].astype(str)
+    return breakdown.pivot(index="software", columns="status", values="count").fillna(0)
@@ -0,0 +1,285 @@
+"""Optional DuckDB backend: the usage, ELP, department and renewal tables as SQL.
+
+The four data sources are loaded from CSV or Parquet (including sharded
+``installations-00000.parquet`` style files from ops/generate_mock_data.py)
+into an embedded DuckDB database, and the aggregations run as multi-threaded
+SQL instead of in-memory pandas. Point ``database`` at a file to let DuckDB
+spill to disk and to keep the loaded tables across restarts. Results match
+the pandas functions column for column; labels come back as plain strings
+rather than categoricals.
+
+Requires the optional ``duckdb`` package (``pip install duckdb``). The app
+uses it when started with ``OPENSAM_BACKEND=duckdb``.
+"""
+
+import json
+import threading
+
+import pandas as pd
+
+from opensam.departments import DEPARTMENT_COLUMNS
+from opensam.ingest import INSTALL_KEY, delta_paths
+from opensam.portfolio import RENEWAL_DUE_DAYS
+from opensam.renewals import DEFAULT_RENEWAL_NOTICE_DAYS, EXPIRING_WITHIN_DAYS, NO_CONTRACT_END_DAYS
+from opensam.schema import CATEGORY, DATE, TABLE_SCHEMAS
+from opensam.storage import DATA_FILES, dataset_version, source_files
+from opensam.usage import USAGE_COLUMNS
+
+try:
+    import duckdb
+except ImportError:  # optional dependency
+    duckdb = None
+
+# Tables created empty when their source file is missing (vendors is optional)
+EMPTY_TABLES = {"vendors": "vendor VARCHAR, renewal_notice_days INTEGER"}
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _scan(files, fmt):
+    paths = "[" + ", ".join("'" + f.replace("'", "''") + "'" for f in files) + "]"
+    return f"read_parquet({paths})" if fmt == "parquet" else f"read_csv({paths}, header = true)"
+
+
+def _typed(column, dtype):
+    """SQL expression casting ``column`` to the declared schema type."""
+    col = _quote(column)
+    if dtype == CATEGORY:
+        return f"CAST({col} AS VARCHAR) AS {col}"
+    if dtype == DATE:
+        return f"TRY_CAST({col} AS DATE) AS {col}"
+    if dtype.startswith("int"):
+        return f"TRY_CAST({col} AS BIGINT) AS {col}"
+    if dtype.startswith("float"):
+        return f"TRY_CAST({col} AS DOUBLE) AS {col}"
+    return col
+
+
+def _is_subscription(column):
+    return f"COALESCE(contains(lower({column}), 'subscription'), false)"
+
+
+class DuckDBBackend:
+    """An embedded DuckDB database over one data directory.
+
+    Tables are (re)loaded when the source files change; installation deltas
+    (see opensam.ingest) are upserted as they appear. Safe to share between
+    threads: each query runs on its own cursor.
+    """
+
+    def __init__(self, data_dir="data", database=":memory:", threads=None, memory_limit=None):
+        if duckdb is None:
+            raise ImportError("The DuckDB backend needs the duckdb package: pip install duckdb")
+        config = {}
+        if threads:
+            config["threads"] = threads
+        if memory_limit:
+            config["memory_limit"] = memory_limit
+        self.data_dir = data_dir
+        self.con = duckdb.connect(database, config=config)
+        self.version = None
+        self.applied = []
+        self._lock = threading.Lock()
+        self._restore_meta()
+        self.refresh()
+
+    def _sources(self):
+        return {name: source_files(self.data_dir, filename) for name, filename in DATA_FILES.items()}
+
+    def _restore_meta(self):
+        # A database file loaded earlier can be reused as-is if the sources haven't changed
+        cur = self.con.cursor()
+        cur.execute("CREATE TABLE IF NOT EXISTS opensam_meta (key VARCHAR PRIMARY KEY, value VARCHAR)")
+        meta = dict(cur.execute("SELECT key, value FROM opensam_meta").fetchall())
+        if "version" in meta:
+            self.version = meta["version"]
+            self.applied = json.loads(meta.get("applied", "[]"))
+
+    def _save_meta(self, cur):
+        cur.execute(
+            "INSERT OR REPLACE INTO opensam_meta VALUES ('version', ?), ('applied', ?)",
+            [self.version, json.dumps(self.applied)],
+        )
+
+    def refresh(self):
+        """Reload changed sources and apply new delta files; returns True if any table changed."""
+        with self._lock:
+            sources = self._sources()
+            version = dataset_version([f for files, _ in sources.values() for f in files])
+            cur = self.con.cursor()
+            changed = False
+            if version != self.version:
+                for name, (files, fmt) in sources.items():
+                    self._load_table(cur, name, files, fmt)
+                self.version, self.applied, changed = version, [], True
+            for path in delta_paths(self.data_dir):
+                if path not in self.applied:
+                    self._apply_delta(cur, path)
+                    self.applied.append(path)
+                    changed = True
+            if changed:
+                self._save_meta(cur)
+            return changed
+
+    def _load_table(self, cur, name, files, fmt):
+        if not files:
+            columns = EMPTY_TABLES.get(name, ", ".join(f"{_quote(c)} VARCHAR" for c in TABLE_SCHEMAS[name]))
+            cur.execute(f"CREATE OR REPLACE TABLE {name} ({columns})")
+            return
+        scan = _scan(files, fmt)
+        schema = TABLE_SCHEMAS[name]
+        columns = [row[0] for row in cur.execute(f"DESCRIBE SELECT * FROM {scan}").fetchall()]
+        select = ", ".join(_typed(c, schema.get(c, "")) for c in columns)
+        # CREATE TABLE AS keeps file order, so rowid is the row's position in the source
+        cur.execute(f"CREATE OR REPLACE TABLE {name} AS SELECT {select} FROM {scan}")
+
+    def _apply_delta(self, cur, path):
+        """Upsert one delta file into installs, keyed on (device_id, software)."""
+        columns = [row[0] for row in cur.execute(f"DESCRIBE SELECT * FROM {_scan([path], 'csv')}").fetchall()]
+        stored = {row[0] for row in cur.execute("DESCRIBE installs").fetchall()}
+        columns = [c for c in columns if c in stored]
+        schema = TABLE_SCHEMAS["installs"]
+        select = ", ".join(_typed(c, schema.get(c, "")) for c in columns)
+        key = " AND ".join(f"{c} IS NOT NULL" for c in INSTALL_KEY)
+        cur.execute(f"CREATE OR REPLACE TEMP TABLE delta_rows AS SELECT {select} FROM {_scan([path], 'csv')}")
+        cur.execute(f"""
+            CREATE OR REPLACE TEMP TABLE delta_last AS
+            SELECT * EXCLUDE (delta_row) FROM (SELECT *, rowid AS delta_row FROM delta_rows WHERE {key})
+            QUALIFY row_number() OVER (PARTITION BY device_id, software ORDER BY delta_row DESC) = 1
+            ORDER BY delta_row
+        """)
+        cur.execute("""
+            DELETE FROM installs USING delta_last d
+            WHERE installs.device_id = d.device_id AND installs.software = d.software
+        """)
+        # Appended rows get the highest rowids, matching opensam.ingest.upsert_installs
+        cur.execute("INSERT INTO installs BY NAME SELECT * FROM delta_last ORDER BY rowid")
+
+    def query(self, sql, params=None):
+        """Run ``sql`` on a fresh cursor and return a DataFrame."""
+        return self.con.cursor().execute(sql, params or []).df()
+
+    def software_usage(self, count_by_user=False):
+        """Same table as ``opensam.usage.software_usage``."""
+        key = "user_email" if count_by_user else "device_id"
+        return self.query(f"""
+            WITH iu AS ({self._installs_users()})
+            SELECT software,
+                   COUNT(DISTINCT {key}) AS installs_count,
+                   {self._seats('active', count_by_user)} AS active_installs,
+                   {self._seats('terminated', count_by_user)} AS inactive_installs,
+                   MAX(last_used_date) AS last_used_max
+            FROM iu
+            WHERE software IS NOT NULL
+            GROUP BY software
+            ORDER BY software
+        """)[USAGE_COLUMNS]
+
+    def license_position(self, today, count_by_user=False):
+        """Same table as ``opensam.portfolio.license_position`` over ``software_usage``."""
+        key = "user_email" if count_by_user else "device_id"
+        return self.query(f"""
+            WITH iu AS ({self._installs_users()}),
+            usage AS (
+                SELECT software,
+                       COUNT(DISTINCT {key}) AS installs_count,
+                       {self._seats('active', count_by_user)} AS active_installs,
+                       {self._seats('terminated', count_by_user)} AS inactive_installs,
+                       MAX(last_used_date) AS last_used_max
+                FROM iu WHERE software IS NOT NULL GROUP BY software
+            )
+            SELECT l.*,
+                   COALESCE(u.installs_count, 0) AS installs_count,
+                   COALESCE(u.active_installs, 0) AS active_installs,
+                   COALESCE(u.inactive_installs, 0) AS inactive_installs,
+                   u.last_used_max,
+                   COALESCE(u.active_installs, 0) AS seats_used,
+                   GREATEST(l.seats_purchased - seats_used, 0) AS seats_unused,
+                   GREATEST(seats_used - l.seats_purchased, 0) AS overage,
+                   l.seats_purchased - seats_used AS elp,
+                   COALESCE(date_diff('day', CAST($today AS DATE), l.contract_end), {NO_CONTRACT_END_DAYS})
+                       AS contract_days_remaining,
+                   contract_days_remaining <= {RENEWAL_DUE_DAYS} AS renewal_due,
+                   CASE WHEN {_is_subscription('l.license_type')} THEN seats_unused * l.unit_cost_usd ELSE 0 END
+                       AS potential_savings_usd
+            FROM licenses l LEFT JOIN usage u ON l.software = u.software
+            ORDER BY l.rowid
+        """, {"today": pd.Timestamp(today).date()})
+
+    def department_stats(self, count_by_user=False):
+        """Same table as ``opensam.departments.department_stats``."""
+        total = "COUNT(DISTINCT user_email)" if count_by_user else "COUNT(device_id)"
+        reclaim = "r.cost" if count_by_user else (
+            f"SUM(unit_cost_usd) FILTER (WHERE status = 'terminated' AND is_subscription)"
+        )
+        return self.query(f"""
+            WITH iul AS (
+                SELECT i.rowid AS row_id, i.device_id, i.user_email,
+                       COALESCE(u.department, 'Unknown') AS department,
+                       COALESCE(u.status, 'unknown') AS status,
+                       COALESCE(l.unit_cost_usd, 0) AS unit_cost_usd,
+                       {_is_subscription('l.license_type')} AS is_subscription
+                FROM installs i
+                LEFT JOIN users u ON i.user_email = u.user_email
+                LEFT JOIN licenses l ON i.software = l.software
+            ),
+            -- User mode charges each terminated user once, at the cost of their first listed install
+            reclaim_users AS (
+                SELECT department, SUM(cost) AS cost FROM (
+                    SELECT department, arg_min(unit_cost_usd, row_id) AS cost
+                    FROM iul
+                    WHERE status = 'terminated' AND is_subscription AND user_email IS NOT NULL
+                    GROUP BY department, user_email
+                ) GROUP BY department
+            )
+            SELECT iul.department,
+                   {self._seats('active', count_by_user)} AS used_seats,
+                   {self._seats('terminated', count_by_user)} AS terminated_seats,
+                   {total} AS total_installs,
+                   COALESCE({reclaim}, 0) AS reclaimable_savings
+            FROM iul LEFT JOIN reclaim_users r ON iul.department = r.department
+            GROUP BY iul.department, r.cost
+            -- "Unknown" sorts last unless users.csv itself has an Unknown department (categorical order)
+            ORDER BY iul.department = 'Unknown'
+                         AND NOT EXISTS (SELECT 1 FROM users WHERE department = 'Unknown'),
+                     iul.department
+        """)[DEPARTMENT_COLUMNS]
+
+    def renewal_metrics(self, today):
+        """Same table as ``opensam.renewals.renewal_metrics``."""
+        vendor_columns = {row[0] for row in self.con.cursor().execute("DESCRIBE vendors").fetchall()}
+        notice = "v.renewal_notice_days" if "renewal_notice_days" in vendor_columns else "NULL"
+        vendor_select = "v.* EXCLUDE (vendor)"
+        if "renewal_notice_days" in vendor_columns:
+            vendor_select += (f" REPLACE (CAST(COALESCE({notice}, {DEFAULT_RENEWAL_NOTICE_DAYS}) AS INTEGER)"
+                              " AS renewal_notice_days)")
+        else:
+            vendor_select += f", {DEFAULT_RENEWAL_NOTICE_DAYS} AS renewal_notice_days"
+        return self.query(f"""
+            SELECT l.*, {vendor_select},
+                   COALESCE(date_diff('day', CAST($today AS DATE), l.contract_end), {NO_CONTRACT_END_DAYS})
+                       AS days_remaining,
+                   GREATEST(days_remaining, 0) AS days_remaining_display,
+                   days_remaining <= {EXPIRING_WITHIN_DAYS} AS expiring_30d,
+                   l.contract_end - CAST(COALESCE({notice}, {DEFAULT_RENEWAL_NOTICE_DAYS}) AS INTEGER) AS notice_start,
+                   COALESCE(notice_start <= CAST($today AS DATE) AND days_remaining > 0, false) AS in_notice_window,
+                   l.seats_purchased * l.unit_cost_usd AS annual_spend_proxy,
+                   {_is_subscription('l.license_type')} AS is_subscription
+            FROM licenses l LEFT JOIN vendors v ON l.vendor = v.vendor
+            ORDER BY l.rowid
+        """, {"today": pd.Timestamp(today).date()})
+
+    @staticmethod
+    def _installs_users():
+        return """
+            SELECT i.*, COALESCE(u.status, 'unknown') AS status
+            FROM installs i LEFT JOIN users u ON i.user_email = u.user_email
+        """
+
+    @staticmethod
+    def _seats(status, count_by_user):
+        if count_by_user:
+            return f"COUNT(DISTINCT user_email) FILTER (WHERE status = '{status}')"
+        return f"COUNT(*) FILTER (WHERE status = '{status}')"
@@ -0,0 +1,31 @@
+"""Joins that enrich the installations table with user and license attributes."""
+
+from opensam.schema import fillna_category
+
+
+def join_users(installs, users):
+    """Left-join installs -> users; missing status becomes "unknown"."""
+    installs_users = installs.merge(users, on="user_email", how="left")
+    if "status" in installs_users.columns:
+        installs_users["status"] = fillna_category(installs_users["status"], "unknown")
+    return installs_users
+
+
+def join_licenses(installs_users, licenses):
+    """Add unit_cost_usd, license_type and is_subscription to an installs->users frame.
+
+    Missing departments become "Unknown" and missing costs 0, matching the
+    Department Allocation page.
+    """
+    installs_users_licenses = installs_users.merge(
+        licenses[["software", "unit_cost_usd", "license_type"]],
+        on="software",
+        how="left"
+    )
+    if "department" in installs_users_licenses.columns:
+        installs_users_licenses["department"] = fillna_category(installs_users_licenses["department"], "Unknown")
+    installs_users_licenses["unit_cost_usd"] = installs_users_licenses["unit_cost_usd"].fillna(0)
+    installs_users_licenses["is_subscription"] = installs_users_licenses["license_type"].str.contains(
+        "subscription", case=False, na=False
+    )
+    return installs_users_licenses
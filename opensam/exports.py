@@ -0,0 +1,64 @@
+"""Download payloads for the export buttons.
+
+CSV is written in row chunks from a generator, so a large export never exists
+as one big string plus its encoded copy; with gzip or zip only the compressed
+bytes are kept. Parquet is offered for loading the lists into other tools.
+"""
+
+import gzip
+import io
+import zipfile
+
+EXPORT_CHUNK_ROWS = 100_000
+# Faster than gzip's default level 9 and nearly as small for CSV
+COMPRESS_LEVEL = 6
+
+# format -> (label, file extension, MIME type)
+EXPORT_FORMATS = {
+    "csv": ("CSV", ".csv", "text/csv"),
+    "csv.gz": ("CSV (gzip)", ".csv.gz", "application/gzip"),
+    "zip": ("CSV (zip)", ".zip", "application/zip"),
+    "parquet": ("Parquet", ".parquet", "application/vnd.apache.parquet"),
+}
+
+
+def iter_csv(df, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yield ``df`` as UTF-8 CSV bytes without the index, header first, ``chunk_rows`` rows at a time."""
+    yield df.iloc[:0].to_csv(index=False).encode("utf-8")
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=False).encode("utf-8")
+
+
+def export_filename(stem, fmt="csv"):
+    """``stem`` with the extension for ``fmt`` (e.g. ``opensam_low_usage.csv.gz``)."""
+    return stem + EXPORT_FORMATS[fmt][1]
+
+
+def write_export(df, fh, fmt="csv", member="export.csv"):
+    """Write ``df`` to the binary file object ``fh`` in ``fmt`` (see EXPORT_FORMATS).
+
+    ``member`` names the CSV inside a zip archive.
+    """
+    if fmt == "parquet":
+        df.to_parquet(fh, index=False)
+    elif fmt == "csv.gz":
+        with gzip.GzipFile(fileobj=fh, mode="wb", compresslevel=COMPRESS_LEVEL, mtime=0) as gz:
+            for chunk in iter_csv(df):
+                gz.write(chunk)
+    elif fmt == "zip":
+        with zipfile.ZipFile(fh, "w", zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL) as archive:
+            with archive.open(member, "w") as out:
+                for chunk in iter_csv(df):
+                    out.write(chunk)
+    elif fmt == "csv":
+        for chunk in iter_csv(df):
+            fh.write(chunk)
+    else:
+        raise ValueError(f"Unknown export format {fmt!r}; expected one of {', '.join(EXPORT_FORMATS)}")
+
+
+def export_bytes(df, fmt="csv", member="export.csv"):
+    """``df`` encoded as ``fmt``, as bytes for a download button."""
+    buffer = io.BytesIO()
+    write_export(df, buffer, fmt, member)
+    return buffer.getvalue()
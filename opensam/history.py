@@ -0,0 +1,247 @@
+"""Dated usage snapshots kept as a compact columnar change log.
+
+Every data load can be recorded as a snapshot of the installs table. Only
+installs whose user or last_used_date changed since the previous snapshot
+(plus installs that disappeared) are written, one Parquet file per load
+under a ``snapshot_date=YYYY-MM-DD`` partition. Device, user and software
+values are dictionary-encoded as int32 ids; the dictionaries are append-only
+so an id never changes meaning. The latest full state is kept separately and
+only read when recording, so queries never replay snapshots.
+
+A changed last_used_date is a use of the install on that day, so
+``usage_trend`` buckets recorded uses by last_used_date. The first snapshot
+can only contribute each install's most recent use. Queries read just the id
+and date columns, skip snapshots recorded before the requested range (a use
+is never recorded before it happens) and push the software, user and date
+filters down to Parquet row-group statistics.
+
+Layout under the history directory (``data/.history`` in the app)::
+
+    dictionary/{device,user,software}.parquet   id = row number
+    state.parquet                               latest full state, in ids
+    snapshots/snapshot_date=2026-10-17/0.parquet
+    manifest.json                               one entry per recorded load
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from opensam.ingest import INSTALL_KEY
+
+HISTORY_DIRNAME = ".history"
+# installs column -> dictionary name
+ID_COLUMNS = {"device_id": "device", "user_email": "user", "software": "software"}
+SNAPSHOT_SCHEMA = pa.schema([
+    ("device", pa.int32()),
+    ("software", pa.int32()),
+    ("user", pa.int32()),
+    ("last_used", pa.date32()),
+    ("removed", pa.bool_()),
+])
+SNAPSHOT_PARTITIONING = ds.partitioning(pa.schema([("snapshot_date", pa.date32())]), flavor="hive")
+# Snapshots are sorted by software, so row groups this size let product queries skip most of a file
+ROW_GROUP_ROWS = 64 * 1024
+TREND_COLUMNS = ["period", "uses", "active_devices", "active_users"]
+
+
+class HistoryStore:
+    """Append-only snapshot history in ``root`` (created on first record)."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        self._dictionaries = None
+
+    @property
+    def snapshot_dir(self):
+        return self.root / "snapshots"
+
+    def manifest(self):
+        """Recorded loads, oldest first: dicts with snapshot_date, version, rows and installs."""
+        try:
+            with open(self.root / "manifest.json", encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return []
+
+    def dictionary(self, name):
+        """Values of one id dictionary as an Index (position = id)."""
+        if self._dictionaries is None:
+            self._dictionaries = {}
+            for dictionary in ID_COLUMNS.values():
+                path = self.root / "dictionary" / f"{dictionary}.parquet"
+                values = pq.read_table(path).column("value").to_pylist() if path.exists() else []
+                self._dictionaries[dictionary] = pd.Index(values, dtype=object)
+        return self._dictionaries[name]
+
+    def encode(self, name, values):
+        """Ids for ``values`` in dictionary ``name``; -1 for missing or unknown values."""
+        codes, uniques = pd.factorize(pd.Series(values))
+        ids = self.dictionary(name).get_indexer(pd.Index(uniques, dtype=object))
+        return np.append(ids, -1)[codes].astype(np.int32)
+
+    def _extend(self, name, values):
+        """Append unseen ``values`` to dictionary ``name`` and return the ids of all of them."""
+        uniques = pd.Index(pd.unique(pd.Series(values).dropna()).astype(object))
+        known = self.dictionary(name)
+        added = uniques[known.get_indexer(uniques) < 0]
+        if len(added):
+            self._dictionaries[name] = known.append(added)
+            (self.root / "dictionary").mkdir(parents=True, exist_ok=True)
+            table = pa.table({"value": pa.array(self._dictionaries[name].astype(str).tolist(), pa.string())})
+            _write_atomic(table, self.root / "dictionary" / f"{name}.parquet")
+        return self.encode(name, values)
+
+    def record(self, installs, snapshot_date, version=None):
+        """Record ``installs`` as the snapshot for ``snapshot_date``; returns rows written.
+
+        Rows are upserted on (device_id, software) like installation deltas,
+        the last one winning. A load whose ``version`` was already recorded is
+        skipped, and a load with no changes writes no file.
+        """
+        with self._lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            manifest = self.manifest()
+            if version is not None and any(entry["version"] == version for entry in manifest):
+                return 0
+            current = self._encode_installs(installs)
+            previous = self._read_state()
+            changes = _changes(previous, current)
+
+            snapshot_date = pd.Timestamp(snapshot_date).date()
+            if changes.num_rows:
+                partition = self.snapshot_dir / f"snapshot_date={snapshot_date.isoformat()}"
+                partition.mkdir(parents=True, exist_ok=True)
+                part = len(list(partition.glob("*.parquet")))
+                _write_atomic(changes, partition / f"{part}.parquet", row_group_size=ROW_GROUP_ROWS)
+            _write_atomic(current, self.root / "state.parquet")
+            manifest.append({
+                "snapshot_date": snapshot_date.isoformat(),
+                "version": version,
+                "rows": changes.num_rows,
+                "installs": current.num_rows,
+            })
+            tmp_path = self.root / "manifest.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as fh:
+                json.dump(manifest, fh)
+            os.replace(tmp_path, self.root / "manifest.json")
+            return changes.num_rows
+
+    def _encode_installs(self, installs):
+        installs = installs.dropna(subset=INSTALL_KEY).drop_duplicates(INSTALL_KEY, keep="last")
+        columns = {
+            dictionary: self._extend(dictionary, installs[column]) if column in installs.columns
+            else np.full(len(installs), -1, dtype=np.int32)
+            for column, dictionary in ID_COLUMNS.items()
+        }
+        if "last_used_date" in installs.columns:
+            last_used = pd.to_datetime(installs["last_used_date"], errors="coerce").to_numpy(dtype="datetime64[D]")
+        else:
+            last_used = np.full(len(installs), np.datetime64("NaT"), dtype="datetime64[D]")
+        return pa.table({
+            "device": columns["device"],
+            "software": columns["software"],
+            "user": pa.array(columns["user"], pa.int32(), mask=columns["user"] < 0),
+            "last_used": pa.array(last_used, pa.date32(), mask=np.isnat(last_used)),
+        })
+
+    def _read_state(self):
+        path = self.root / "state.parquet"
+        return pq.read_table(path) if path.exists() else None
+
+    def usage_trend(self, software=None, users=None, start=None, end=None, freq="W"):
+        """Recorded uses per ``freq`` period ("W", "M", ...) of last_used_date between ``start`` and ``end``.
+
+        ``software`` limits to one product and ``users`` (user emails) to a
+        set of users, e.g. one department. Returns TREND_COLUMNS: period start,
+        uses (install/day pairs), active_devices and active_users.
+        """
+        if not self.snapshot_dir.exists():
+            return pd.DataFrame(columns=TREND_COLUMNS)
+        condition = ~ds.field("removed") & ds.field("last_used").is_valid()
+        if software is not None:
+            condition &= ds.field("software") == int(self.encode("software", [software])[0])
+        if users is not None:
+            ids = self.encode("user", list(users))
+            condition &= ds.field("user").isin(ids[ids >= 0].tolist())
+        if start is not None:
+            start = pd.Timestamp(start).date()
+            condition &= (ds.field("snapshot_date") >= start) & (ds.field("last_used") >= start)
+        if end is not None:
+            condition &= ds.field("last_used") <= pd.Timestamp(end).date()
+
+        dataset = ds.dataset(self.snapshot_dir, format="parquet", schema=SNAPSHOT_SCHEMA.append(
+            pa.field("snapshot_date", pa.date32())), partitioning=SNAPSHOT_PARTITIONING)
+        uses = dataset.to_table(columns=["device", "software", "user", "last_used"], filter=condition).to_pandas()
+        if uses.empty:
+            return pd.DataFrame(columns=TREND_COLUMNS)
+
+        # The same install can be recorded for the same day twice (e.g. reassigned to another user)
+        uses = uses.drop_duplicates(["device", "software", "last_used"])
+        uses["period"] = pd.to_datetime(uses["last_used"]).dt.to_period(freq).dt.start_time
+        trend = uses.groupby("period").agg(
+            uses=("device", "size"),
+            active_devices=("device", "nunique"),
+            active_users=("user", "nunique"),
+        ).reset_index()
+        return trend[TREND_COLUMNS]
+
+
+def _changes(previous, current):
+    """Rows of ``current`` that are new or changed since ``previous``, plus removed installs."""
+    if previous is None or previous.num_rows == 0:
+        changes = current.append_column("removed", pa.array(np.zeros(current.num_rows, dtype=bool)))
+        return _sorted(changes.cast(SNAPSHOT_SCHEMA))
+
+    def keys(table):
+        device = table.column("device").to_numpy().astype(np.int64)
+        return (device << 32) | table.column("software").to_numpy().astype(np.int64)
+
+    def values(table):
+        user = table.column("user").fill_null(-1).to_numpy()
+        last_used = table.column("last_used").cast(pa.int32()).fill_null(np.iinfo(np.int32).min).to_numpy()
+        return user, last_used
+
+    previous_keys, current_keys = keys(previous), keys(current)
+    order = np.argsort(previous_keys, kind="stable")
+    sorted_keys = previous_keys[order]
+    slot = np.minimum(np.searchsorted(sorted_keys, current_keys), len(sorted_keys) - 1)
+    found = sorted_keys[slot] == current_keys
+    match = order[slot]
+
+    previous_user, previous_last_used = values(previous)
+    current_user, current_last_used = values(current)
+    changed = ~found | (previous_user[match] != current_user) | (previous_last_used[match] != current_last_used)
+    changed_rows = current.filter(pa.array(changed)).append_column(
+        "removed", pa.array(np.zeros(int(changed.sum()), dtype=bool)))
+
+    kept = np.zeros(len(previous_keys), dtype=bool)
+    kept[match[found]] = True
+    removed_rows = previous.filter(pa.array(~kept))
+    removed_rows = pa.table({
+        "device": removed_rows.column("device"),
+        "software": removed_rows.column("software"),
+        "user": pa.nulls(removed_rows.num_rows, pa.int32()),
+        "last_used": pa.nulls(removed_rows.num_rows, pa.date32()),
+        "removed": pa.array(np.ones(removed_rows.num_rows, dtype=bool)),
+    })
+    return _sorted(pa.concat_tables([changed_rows.cast(SNAPSHOT_SCHEMA), removed_rows.cast(SNAPSHOT_SCHEMA)]))
+
+
+def _sorted(changes):
+    # By product and date, so row-group statistics prune product and date-range queries
+    return changes.sort_by([("software", "ascending"), ("last_used", "ascending")])
+
+
+def _write_atomic(table, path, **kwargs):
+    tmp_path = path.with_suffix(".tmp")
+    pq.write_table(table, tmp_path, compression="zstd", **kwargs)
+    os.replace(tmp_path, path)
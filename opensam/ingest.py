@@ -0,0 +1,468 @@
+"""Incremental ingestion of installation deltas.
+
+Discovery tooling drops new and changed installation records as CSV files in
+``data/deltas/`` (same columns as installations.csv). Files are applied in
+name order and treated as append-only: once applied, a file is never re-read.
+Each delta row is upserted on (device_id, software): it replaces every stored
+row with that key and moves to the end of the table, as a new row would.
+
+``LiveDataset`` holds the installs->users join and the per-software and
+per-department aggregates for one base dataset and keeps them current as
+deltas arrive, updating the aggregates from the changed rows only.
+"""
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from opensam.departments import DEPARTMENT_COLUMNS, department_stats
+from opensam.enrich import join_licenses, join_users
+from opensam.products import ProductIndex
+from opensam.schema import TABLE_SCHEMAS, apply_schema, combine_chunks
+from opensam.usage import USAGE_COLUMNS, software_usage
+
+DELTA_DIRNAME = "deltas"
+INSTALL_KEY = ["device_id", "software"]
+SEAT_STATUSES = ["active", "terminated"]
+# Rebuild a key index once its overflow reaches this fraction of the bulk-built part
+COMPACT_RATIO = 0.5
+
+
+def delta_paths(data_dir="data"):
+    """Delta CSVs waiting in ``data_dir/deltas``, in name (arrival) order."""
+    delta_dir = os.path.join(data_dir, DELTA_DIRNAME)
+    try:
+        names = sorted(n for n in os.listdir(delta_dir) if n.endswith(".csv"))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(delta_dir, n) for n in names]
+
+
+def read_delta(path):
+    """Load a delta CSV with the installs schema."""
+    return apply_schema(pd.read_csv(path), TABLE_SCHEMAS["installs"])
+
+
+def prepare_delta(delta):
+    """Drop rows without a full key and keep the last row per (device_id, software)."""
+    return delta.dropna(subset=INSTALL_KEY).drop_duplicates(INSTALL_KEY, keep="last")
+
+
+def conform_categories(base, rows):
+    """Cast ``rows`` to ``base``'s categorical dtypes, widening ``base``'s categories if needed.
+
+    Returns new ``(base, rows)`` frames whose categorical columns share one
+    (sorted) category set, so they concatenate without falling back to object.
+    """
+    base = base.copy(deep=False)
+    rows = rows.copy(deep=False)
+    for col in base.columns:
+        if col not in rows.columns or not isinstance(base[col].dtype, pd.CategoricalDtype):
+            continue
+        values = rows[col].astype(object)
+        categories = base[col].cat.categories
+        new = pd.Index(values.dropna().unique()).difference(categories)
+        if len(new):
+            base[col] = base[col].cat.set_categories(sorted(categories.union(new)))
+        rows[col] = values.astype(base[col].dtype)
+    return base, rows
+
+
+def upsert_installs(installs, delta):
+    """Installs with ``delta`` rows replacing stored rows of the same (device_id, software)."""
+    delta = prepare_delta(delta)
+    if delta.empty:
+        return installs
+    installs, delta = conform_categories(installs, delta)
+    replaced = _key_index(installs).isin(_key_index(delta))
+    return pd.concat([installs[~replaced], delta], ignore_index=True)
+
+
+def _key_index(frame):
+    return pd.MultiIndex.from_arrays([frame[c].astype(object) for c in INSTALL_KEY])
+
+
+class LiveDataset:
+    """Installs->users join plus usage and department aggregates, kept current as deltas arrive.
+
+    Until the first delta is applied, aggregates are computed on demand with
+    ``software_usage`` / ``department_stats``. The first delta builds the
+    incremental counters (one pass over the data); from then on each delta
+    only touches its own rows. Frames handed out are never mutated: an update
+    swaps in new ones, so readers always see one consistent revision.
+    """
+
+    def __init__(self, installs, users, licenses):
+        self.users = users
+        self.licenses = licenses
+        # Contiguous columns so per-product row lookups (ProductIndex) don't scan every chunk
+        self.installs_users = combine_chunks(join_users(installs, users))
+        self.revision = 0
+        self.applied = []
+        self._labels = np.arange(len(self.installs_users), dtype=np.int64)
+        self._next_label = len(self.installs_users)
+        self._keys = None
+        self._counters = None
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    @property
+    def incremental(self):
+        """True once the incremental counters have been built."""
+        return self._counters is not None
+
+    def enable_incremental(self):
+        """Build the key index and counters from the current rows (done once)."""
+        with self._lock:
+            self._enable_incremental()
+
+    def _enable_incremental(self):
+        if self._counters is None:
+            self._keys = _KeyIndex(self.installs_users, self._labels)
+            self._counters = _Counters(_changes(self._licensed(self.installs_users), self._labels, 1))
+
+    def sync(self, paths):
+        """Apply the delta files in ``paths`` not applied yet; returns how many were applied."""
+        with self._lock:
+            pending = [p for p in paths if p not in self.applied]
+            for path in pending:
+                self._apply(read_delta(path))
+                self.applied.append(path)
+            return len(pending)
+
+    def apply_delta(self, delta):
+        """Upsert one delta frame (installs columns) and update the aggregates."""
+        with self._lock:
+            self._apply(delta)
+
+    def _apply(self, delta):
+        delta = prepare_delta(delta)
+        if delta.empty:
+            return
+        self._enable_incremental()
+
+        old_labels = self._keys.pop(delta)
+        new_labels = np.arange(self._next_label, self._next_label + len(delta), dtype=np.int64)
+        self._next_label += len(delta)
+
+        positions = np.searchsorted(self._labels, old_labels)
+        keep = np.ones(len(self._labels), dtype=bool)
+        keep[positions] = False
+        removed = self.installs_users.iloc[positions]
+
+        added = join_users(delta, self.users)
+        base, added = conform_categories(self.installs_users.iloc[np.flatnonzero(keep)], added)
+        added = added.reindex(columns=base.columns)
+
+        self._counters.update(pd.concat([
+            _changes(self._licensed(removed), old_labels, -1),
+            _changes(self._licensed(added), new_labels, 1),
+        ], ignore_index=True))
+        self.installs_users = combine_chunks(pd.concat([base, added], ignore_index=True))
+        self._labels = np.concatenate([self._labels[keep], new_labels])
+        self._keys.add(delta, new_labels, self.installs_users, self._labels)
+        self.revision += 1
+        self._cache = {}
+
+    def _licensed(self, installs_users):
+        return join_licenses(installs_users, self.licenses)
+
+    def _cached(self, key, compute):
+        revision = self.revision
+        entry = self._cache.get(key)
+        if entry is None or entry[0] != revision:
+            entry = (revision, compute())
+            self._cache[key] = entry
+        return entry[1]
+
+    def installs_users_licenses(self):
+        """installs ⋈ users ⋈ licenses cost columns (see ``opensam.enrich.join_licenses``)."""
+        return self._cached("licensed", lambda: self._licensed(self.installs_users))
+
+    def product_index(self):
+        """``opensam.products.ProductIndex`` over the current installs->users rows."""
+        return self._cached("products", lambda: ProductIndex(self.installs_users))
+
+    def software_usage(self, count_by_user=False):
+        """Per-software usage table, identical to ``opensam.usage.software_usage``."""
+        if self._counters is None:
+            return self._cached(("usage", count_by_user), lambda: software_usage(self.installs_users, count_by_user))
+        return self._cached(
+            ("usage", count_by_user),
+            lambda: self._counters.software_usage(count_by_user, self.installs_users["software"].dtype),
+        )
+
+    def department_stats(self, count_by_user=False):
+        """Per-department statistics, identical to ``opensam.departments.department_stats``."""
+        if self._counters is None:
+            return self._cached(
+                ("departments", count_by_user),
+                lambda: department_stats(self.installs_users_licenses(), count_by_user),
+            )
+        return self._cached(
+            ("departments", count_by_user),
+            lambda: self._counters.department_stats(count_by_user, self._department_dtype()),
+        )
+
+    def _department_dtype(self):
+        # join_licenses fills missing departments with an appended "Unknown" category
+        dtype = self.installs_users["department"].dtype
+        if isinstance(dtype, pd.CategoricalDtype) and "Unknown" not in dtype.categories:
+            dtype = pd.CategoricalDtype(dtype.categories.append(pd.Index(["Unknown"])))
+        return dtype
+
+
+def _changes(installs_users_licenses, labels, sign):
+    """Row changes (+1 added / -1 removed) with plain object keys, as the counters consume them."""
+    frame = installs_users_licenses
+    return pd.DataFrame({
+        "label": labels,
+        "sign": sign,
+        "software": frame["software"].astype(object).to_numpy(),
+        "device_id": frame["device_id"].astype(object).to_numpy(),
+        "user_email": frame["user_email"].astype(object).to_numpy(),
+        "status": frame["status"].astype(object).to_numpy(),
+        "department": frame["department"].astype(object).to_numpy() if "department" in frame.columns else None,
+        "last_used_date": frame["last_used_date"].to_numpy(),
+        "unit_cost_usd": frame["unit_cost_usd"].to_numpy(),
+        "is_subscription": frame["is_subscription"].to_numpy(),
+    })
+
+
+def _add(series, increments):
+    """``series + increments`` aligned on the index; groups missing on either side count 0."""
+    if series is None:
+        return increments
+    return series.add(increments, fill_value=0)
+
+
+class _KeyIndex:
+    """(device_id, software) -> row labels: a hash index built once plus the changes since."""
+
+    def __init__(self, installs_users, labels):
+        self._index = _key_index(installs_users)
+        self._labels = labels.copy()
+        self._dead = set()
+        self._extra = {}
+
+    def pop(self, delta):
+        """Labels of the live rows sharing a key with ``delta``; they are forgotten."""
+        keys = _key_index(delta)
+        if self._index.is_unique:
+            hits = self._index.get_indexer(keys)
+        else:
+            # Duplicate keys in the base data: every row sharing a key is replaced
+            hits, _ = self._index.get_indexer_non_unique(keys)
+        labels = [int(label) for label in self._labels[hits[hits >= 0]] if int(label) not in self._dead]
+        self._dead.update(labels)
+        for key in keys:
+            label = self._extra.pop(key, None)
+            if label is not None:
+                labels.append(label)
+        return np.array(sorted(labels), dtype=np.int64)
+
+    def add(self, delta, labels, installs_users, all_labels):
+        """Record ``delta``'s rows under their new ``labels``.
+
+        ``installs_users`` / ``all_labels`` are the updated rows, used to
+        rebuild the hash index once the overflow grows too large.
+        """
+        self._extra.update(zip(_key_index(delta), labels.tolist()))
+        if len(self._extra) + len(self._dead) > COMPACT_RATIO * len(self._labels):
+            self.__init__(installs_users, all_labels)
+
+
+class _KeyCounts:
+    """Row multiplicity per key tuple, for distinct counts that survive removals.
+
+    Bulk-built as a sorted MultiIndex of counts; keys first seen in later
+    updates live in a dict until the next compaction. ``update`` returns the
+    keys whose count crossed zero, which is what a distinct count needs.
+    """
+
+    def __init__(self, cols):
+        self.cols = cols
+        self._index = None
+        self._counts = None
+        self._extra = {}
+
+    def update(self, changes):
+        """Apply +/-1 ``changes``; return the (appeared, vanished) keys as frames."""
+        delta = changes.dropna(subset=self.cols).groupby(self.cols)["sign"].sum()
+        delta = delta[delta != 0]
+        if self._index is None:
+            self._index, self._counts = delta.index, delta.to_numpy().copy()
+            return delta.index.to_frame(index=False), delta.index[:0].to_frame(index=False)
+
+        change = delta.to_numpy()
+        positions = self._index.get_indexer(delta.index)
+        found = positions >= 0
+        old = np.zeros(len(delta), dtype=np.int64)
+        old[found] = self._counts[positions[found]]
+        self._counts[positions[found]] += change[found]
+        for i in np.flatnonzero(~found):
+            key = delta.index[i]
+            old[i] = self._extra.get(key, 0)
+            if old[i] + change[i]:
+                self._extra[key] = old[i] + change[i]
+            else:
+                self._extra.pop(key, None)
+        new = old + change
+
+        keys = delta.index.to_frame(index=False)
+        appeared, vanished = keys[(old <= 0) & (new > 0)], keys[(old > 0) & (new <= 0)]
+        if len(self._extra) > COMPACT_RATIO * len(self._counts):
+            self._compact()
+        return appeared, vanished
+
+    def present(self, first):
+        """Second-level values with a positive count under first-level key ``first``."""
+        values = []
+        try:
+            where = self._index.get_loc(first)
+        except KeyError:
+            pass
+        else:
+            sub = self._index[where]
+            values.extend(sub.get_level_values(1)[self._counts[where] > 0])
+        values.extend(key[1] for key, count in self._extra.items() if key[0] == first and count > 0)
+        return values
+
+    def _compact(self):
+        extra = pd.Series(list(self._extra.values()), index=pd.MultiIndex.from_tuples(list(self._extra), names=self.cols))
+        merged = pd.concat([pd.Series(self._counts, index=self._index), extra])
+        merged = merged[merged > 0].sort_index()
+        self._index, self._counts, self._extra = merged.index, merged.to_numpy().copy(), {}
+
+
+class _Counters:
+    """Per-software and per-department aggregates maintained from row changes."""
+
+    def __init__(self, changes):
+        self.sw_devices = _KeyCounts(["software", "device_id"])
+        self.sw_users = _KeyCounts(["software", "user_email"])
+        self.sw_status_users = _KeyCounts(["software", "status", "user_email"])
+        self.sw_dates = _KeyCounts(["software", "last_used_date"])
+        self.dept_users = _KeyCounts(["department", "user_email"])
+        self.dept_status_users = _KeyCounts(["department", "status", "user_email"])
+        self.totals = {}
+        # (department, user_email) -> {label: unit cost} of terminated subscription rows
+        self.reclaim_rows = {}
+        self.update(changes)
+
+    def _count(self, name, increments):
+        self.totals[name] = _add(self.totals.get(name), increments)
+
+    def _distinct(self, name, counts, changes, by):
+        appeared, vanished = counts.update(changes)
+        self._count(name, appeared.groupby(by).size().sub(vanished.groupby(by).size(), fill_value=0))
+        return appeared, vanished
+
+    def update(self, changes):
+        seats = changes[changes["status"].isin(SEAT_STATUSES)]
+
+        # Per software
+        software = changes.dropna(subset=["software"])
+        self._count("sw_rows", software.groupby("software")["sign"].sum())
+        self._count("sw_status_rows", seats.groupby(["software", "status"])["sign"].sum())
+        self._distinct("sw_devices", self.sw_devices, changes, "software")
+        self._distinct("sw_users", self.sw_users, changes, "software")
+        self._distinct("sw_status_users", self.sw_status_users, seats, ["software", "status"])
+        self._update_last_used(changes)
+
+        # Per department
+        self._count("dept_rows", changes.groupby("department")["sign"].sum())
+        self._count("dept_devices", changes.dropna(subset=["device_id"]).groupby("department")["sign"].sum())
+        self._count("dept_status_rows", seats.groupby(["department", "status"])["sign"].sum())
+        self._distinct("dept_users", self.dept_users, changes, "department")
+        self._distinct("dept_status_users", self.dept_status_users, seats, ["department", "status"])
+        self._update_reclaim(changes)
+
+    def _update_last_used(self, changes):
+        appeared, vanished = self.sw_dates.update(changes)
+        latest = self.totals.get("sw_last_used")
+        latest = _max(latest, appeared.groupby("software")["last_used_date"].max())
+        if not vanished.empty:
+            # Only software whose current maximum disappeared needs a rescan of its dates
+            current = latest.reindex(vanished["software"]).to_numpy()
+            for software in vanished["software"][vanished["last_used_date"].to_numpy() >= current].unique():
+                dates = self.sw_dates.present(software)
+                latest.loc[software] = max(dates) if dates else pd.NaT
+        self.totals["sw_last_used"] = latest
+
+    def _update_reclaim(self, changes):
+        reclaim = changes[(changes["status"] == "terminated") & changes["is_subscription"].astype(bool)]
+        self._count("dept_reclaim_rows", (reclaim["unit_cost_usd"] * reclaim["sign"]).groupby(reclaim["department"]).sum())
+
+        # User mode charges each terminated user once, at the cost of their first listed install
+        reclaim = reclaim.dropna(subset=["user_email"])
+        firsts = {}
+        for dept, user, label, cost, sign in zip(reclaim["department"], reclaim["user_email"], reclaim["label"],
+                                                 reclaim["unit_cost_usd"], reclaim["sign"]):
+            rows = self.reclaim_rows.setdefault((dept, user), {})
+            firsts.setdefault((dept, user), rows[min(rows)] if rows else 0.0)
+            if sign > 0:
+                rows[label] = cost
+            else:
+                rows.pop(label, None)
+        totals = {}
+        for (dept, user), before in firsts.items():
+            rows = self.reclaim_rows[(dept, user)]
+            after = rows[min(rows)] if rows else 0.0
+            if not rows:
+                del self.reclaim_rows[(dept, user)]
+            totals[dept] = totals.get(dept, 0.0) + after - before
+        self._count("dept_reclaim_users", pd.Series(totals, dtype="float64"))
+
+    def software_usage(self, count_by_user, software_dtype):
+        groups = _groups(self.totals["sw_rows"], software_dtype)
+        usage = pd.DataFrame(index=groups)
+        usage["installs_count"] = _aligned(self.totals["sw_users" if count_by_user else "sw_devices"], groups)
+        usage["last_used_max"] = self.totals["sw_last_used"].reindex(groups)
+        status = self.totals["sw_status_users" if count_by_user else "sw_status_rows"]
+        usage["active_installs"] = _aligned(_status(status, "active"), groups)
+        usage["inactive_installs"] = _aligned(_status(status, "terminated"), groups)
+        usage.index = groups.astype(software_dtype).rename("software")
+        return usage.reset_index()[USAGE_COLUMNS]
+
+    def department_stats(self, count_by_user, department_dtype):
+        groups = _groups(self.totals["dept_rows"], department_dtype)
+        stats = pd.DataFrame(index=groups)
+        stats["total_installs"] = _aligned(self.totals["dept_users" if count_by_user else "dept_devices"], groups)
+        status = self.totals["dept_status_users" if count_by_user else "dept_status_rows"]
+        stats["used_seats"] = _aligned(_status(status, "active"), groups)
+        stats["terminated_seats"] = _aligned(_status(status, "terminated"), groups)
+        reclaim = self.totals.get("dept_reclaim_users" if count_by_user else "dept_reclaim_rows")
+        stats["reclaimable_savings"] = (reclaim if reclaim is not None else pd.Series(dtype="float64")).reindex(groups).fillna(0).astype("float64")
+        stats.index = groups.astype(department_dtype).rename("department")
+        return stats.reset_index()[DEPARTMENT_COLUMNS]
+
+
+def _max(current, candidates):
+    if current is None:
+        return candidates.copy()
+    return pd.concat([current, candidates]).groupby(level=0).max()
+
+
+def _groups(rows, dtype):
+    """Groups that still have rows, in groupby order (category order for categoricals)."""
+    groups = pd.Index(rows[rows > 0].index, dtype=object)
+    if isinstance(dtype, pd.CategoricalDtype):
+        order = np.argsort(pd.Categorical(groups, dtype=dtype).codes, kind="stable")
+    else:
+        order = np.argsort(groups.to_numpy(), kind="stable")
+    return groups[order]
+
+
+def _status(counts, status):
+    if counts is None or counts.empty:
+        return pd.Series(dtype="int64")
+    return counts.xs(status, level=1) if status in counts.index.get_level_values(1) else pd.Series(dtype="int64")
+
+
+def _aligned(counts, groups):
+    if counts is None:
+        return np.zeros(len(groups), dtype=np.int64)
+    return counts.reindex(groups).fillna(0).astype("int64").to_numpy()
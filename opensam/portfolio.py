@@ -0,0 +1,148 @@
+"""Portfolio-level license position (ELP), savings and risk views for the home page."""
+
+import numpy as np
+import pandas as pd
+
+from opensam.renewals import NO_CONTRACT_END_DAYS, days_until
+
+RENEWAL_DUE_DAYS = 30
+LOW_USAGE_DAYS = 60
+RISK_FILTERS = ["All", "Over-Used", "Expiring < 30d", "Inactive Users Present"]
+
+# Per-row risk bits (see risk_flags); a filter combination is one bitwise AND
+OVERAGE = 1
+RENEWAL_DUE = 2
+INACTIVE_USERS = 4
+SUBSCRIPTION = 8
+RISK_FLAGS = {"All": 0, "Over-Used": OVERAGE, "Expiring < 30d": RENEWAL_DUE, "Inactive Users Present": INACTIVE_USERS}
+
+
+def is_subscription(license_type):
+    """True where license_type mentions "subscription" (case-insensitive)."""
+    return license_type.str.contains("subscription", case=False, na=False)
+
+
+def license_position(licenses, usage, today):
+    """Licenses joined to usage with ELP, overage, renewal and savings columns.
+
+    ``usage`` is the output of ``opensam.usage.software_usage``. Potential
+    savings (unused seats x unit cost) only apply to subscription licenses.
+    """
+    sam = licenses.merge(usage, on="software", how="left").fillna(
+        {"installs_count": 0, "active_installs": 0, "inactive_installs": 0}
+    )
+    sam["installs_count"] = sam["installs_count"].astype(int)
+    sam["active_installs"] = sam["active_installs"].astype(int)
+    sam["inactive_installs"] = sam["inactive_installs"].astype(int)
+
+    # ELP & savings
+    sam["seats_used"] = sam["active_installs"]
+    sam["seats_unused"] = (sam["seats_purchased"] - sam["seats_used"]).clip(lower=0)
+    sam["overage"] = (sam["seats_used"] - sam["seats_purchased"]).clip(lower=0)
+    sam["elp"] = sam["seats_purchased"] - sam["seats_used"]
+
+    # Contract days remaining with guard for NaT
+    if "contract_end" in sam.columns:
+        sam["contract_days_remaining"] = days_until(sam["contract_end"], today)
+    else:
+        sam["contract_days_remaining"] = NO_CONTRACT_END_DAYS
+
+    sam["renewal_due"] = sam["contract_days_remaining"] <= RENEWAL_DUE_DAYS
+
+    # Potential savings (SUBSCRIPTIONS ONLY)
+    if "license_type" in sam.columns and "unit_cost_usd" in sam.columns:
+        sam["potential_savings_usd"] = np.where(
+            is_subscription(sam["license_type"]),
+            sam["seats_unused"] * sam["unit_cost_usd"],
+            0
+        )
+    else:
+        sam["potential_savings_usd"] = 0
+
+    return sam
+
+
+def reclaim_value(positions):
+    """Subscription spend held by terminated users (inactive_installs x unit cost)."""
+    if "license_type" not in positions.columns or "unit_cost_usd" not in positions.columns:
+        return 0
+    value = positions["inactive_installs"] * positions["unit_cost_usd"]
+    mask = (positions["inactive_installs"] > 0) & is_subscription(positions["license_type"])
+    return value[mask].sum()
+
+
+def risk_flags(sam):
+    """uint8 array of OVERAGE | RENEWAL_DUE | INACTIVE_USERS | SUBSCRIPTION bits per row of ``sam``."""
+    flags = np.zeros(len(sam), dtype=np.uint8)
+    flags[sam["overage"].to_numpy() > 0] |= OVERAGE
+    flags[sam["renewal_due"].to_numpy(dtype=bool)] |= RENEWAL_DUE
+    flags[sam["inactive_installs"].to_numpy() > 0] |= INACTIVE_USERS
+    if "license_type" in sam.columns:
+        flags[is_subscription(sam["license_type"]).to_numpy(dtype=bool)] |= SUBSCRIPTION
+    else:
+        # Without a license_type column the subscription filter is a no-op
+        flags |= SUBSCRIPTION
+    return flags
+
+
+def filter_mask(sam, flags, vendors=None, only_subs=False, risk="All", min_savings=0):
+    """Boolean array: rows of ``sam`` passing the home page filters, given ``risk_flags(sam)``."""
+    required = RISK_FLAGS.get(risk, 0) | (SUBSCRIPTION if only_subs else 0)
+    mask = (flags & required) == required
+    if vendors:
+        mask &= sam["vendor"].isin(vendors).to_numpy(dtype=bool)
+    mask &= sam["potential_savings_usd"].to_numpy(dtype=float) >= min_savings
+    return mask
+
+
+def filter_positions(sam, vendors=None, only_subs=False, risk="All", min_savings=0, flags=None):
+    """Apply the home page's vendor, subscription, risk and minimum-savings filters.
+
+    Pass ``flags`` (``risk_flags(sam)``) to reuse them across filter changes.
+    """
+    if flags is None:
+        flags = risk_flags(sam)
+    return sam[filter_mask(sam, flags, vendors, only_subs, risk, min_savings)].copy()
+
+
+def license_type_mix(positions):
+    """Product count and total spend (unit cost x seats) per license type."""
+    spend = positions["unit_cost_usd"] * positions["seats_purchased"]
+    return positions.assign(_spend=spend).groupby("license_type", observed=True).agg(
+        count=("software", "count"),
+        total_spend=("_spend", "sum")
+    ).reset_index()
+
+
+def top_vendors_by_spend(positions, n=5):
+    """The ``n`` vendors with the highest total spend (unit cost x seats)."""
+    spend = positions["unit_cost_usd"] * positions["seats_purchased"]
+    vendor_spend = spend.groupby(positions["vendor"], observed=True).sum()
+    vendor_spend = vendor_spend.sort_values(ascending=False).head(n).reset_index()
+    vendor_spend.columns = ["vendor", "total_spend"]
+    return vendor_spend
+
+
+def renewal_timeline(positions, within_days=90, limit=10):
+    """The ``limit`` soonest contracts ending within ``within_days``, labelled by urgency."""
+    expiring = positions[positions["contract_days_remaining"] <= within_days].sort_values("contract_days_remaining")
+    timeline = expiring.head(limit).copy()
+    timeline["color"] = np.where(
+        timeline["contract_days_remaining"] <= RENEWAL_DUE_DAYS, "Urgent (<30d)", "Soon (30-90d)"
+    )
+    return timeline
+
+
+def terminated_installs(installs_users):
+    """Installs still held by terminated users (reclaim now)."""
+    return installs_users[installs_users["status"] == "terminated"].copy()
+
+
+def low_usage_installs(installs_users, today, days=LOW_USAGE_DAYS):
+    """Active users' installs unused for ``days``+ days (or never used)."""
+    threshold = pd.Timestamp(today) - pd.Timedelta(days=days)
+    last_used = installs_users["last_used_date"]
+    return installs_users[
+        ((last_used < threshold) | last_used.isna()) &
+        (installs_users["status"] == "active")  # Only active users (terminated are in reclaim)
+    ].copy()
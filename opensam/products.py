@@ -0,0 +1,195 @@
+"""Single-product license position and reclaim lists for Product Drilldown."""
+
+import numpy as np
+import pandas as pd
+
+from opensam.portfolio import LOW_USAGE_DAYS
+
+
+def product_license(licenses, software):
+    """First license row for ``software``, or None if it has no license record."""
+    license_row = licenses[licenses["software"] == software]
+    if license_row.empty:
+        return None
+    return license_row.iloc[0]
+
+
+def license_terms(license_info):
+    """(seats_purchased, unit_cost, license_type, is_subscription) with safe defaults."""
+    seats_purchased = int(license_info.get("seats_purchased", 0))
+    unit_cost = license_info.get("unit_cost_usd", 0)
+    if pd.isna(unit_cost):
+        unit_cost = 0
+    license_type = license_info.get("license_type", "unknown")
+    is_subscription = "subscription" in str(license_type).lower()
+    return seats_purchased, unit_cost, license_type, is_subscription
+
+
+def installs_for_product(installs_users, software):
+    """Installs of one product."""
+    return installs_users[installs_users["software"] == software]
+
+
+def seat_count(installs, count_by_user):
+    """Seats held by ``installs``: unique users, or install rows in device mode."""
+    if count_by_user:
+        return installs["user_email"].nunique() if not installs.empty else 0
+    return len(installs)
+
+
+def product_position(license_info, installs, count_by_user, today):
+    """Metrics and reclaim tables for one product.
+
+    ``installs`` is the product's slice of installs->users. Returns a dict of
+    seat metrics, savings (subscription only) and the active, terminated and
+    low-usage install tables restricted to the display columns.
+    """
+    active = installs[installs.get("status") == "active"]
+    terminated = installs[installs.get("status") == "terminated"]
+
+    # Low usage (no activity in 60+ days) - active users only
+    if "last_used_date" in installs.columns:
+        threshold = pd.Timestamp(today) - pd.Timedelta(days=LOW_USAGE_DAYS)
+        last_used = pd.to_datetime(installs["last_used_date"], errors="coerce")
+        low_usage = installs[(last_used.isna() | (last_used < threshold)) & (installs.get("status") == "active")]
+    else:
+        low_usage = installs.iloc[0:0]
+    return _position(license_info, installs.columns, active, terminated, low_usage, count_by_user)
+
+
+def _position(license_info, columns, active, terminated, low_usage, count_by_user):
+    seats_purchased, unit_cost, license_type, is_subscription = license_terms(license_info)
+
+    # Active Installs (used seats) - unique users or unique devices with status="active"
+    active_key = "user_email" if count_by_user else "device_id"
+    active_count = active[active_key].nunique() if active_key in active.columns else 0
+
+    unused_seats = max(0, seats_purchased - active_count)
+    overage = max(0, active_count - seats_purchased)
+    potential_savings = unused_seats * unit_cost if is_subscription else 0
+
+    display_cols = ["user_email", "device_id", "last_used_date"]
+    if "department" in columns:
+        display_cols.append("department")
+
+    # Terminated users (reclaim now)
+    if is_subscription:
+        terminated_count = seat_count(terminated, count_by_user)
+        immediate_savings = terminated_count * unit_cost
+    else:
+        terminated_count = 0
+        immediate_savings = 0
+
+    low_usage_savings = seat_count(low_usage, count_by_user) * unit_cost if is_subscription else 0
+
+    return {
+        "seats_purchased": seats_purchased,
+        "unit_cost": unit_cost,
+        "license_type": license_type,
+        "is_subscription": is_subscription,
+        "active_count": active_count,
+        "unused_seats": unused_seats,
+        "overage": overage,
+        "potential_savings": potential_savings,
+        "terminated_count": terminated_count,
+        "immediate_savings": immediate_savings,
+        "low_usage_savings": low_usage_savings,
+        "active_table": _display_table(active, display_cols),
+        "terminated_table": _display_table(terminated, display_cols),
+        "low_usage_table": _display_table(low_usage, display_cols),
+    }
+
+
+def _display_table(installs, columns):
+    if installs.empty:
+        return pd.DataFrame(columns=columns)
+    return installs[columns].copy()
+
+
+class ProductIndex:
+    """Row positions of each product's installs in ``installs_users``, split by status.
+
+    Built with one sort of the whole frame; afterwards a product's installs,
+    status subsets and low-usage rows cost time proportional to that product's
+    install count. Within each (software, status) group positions are sorted
+    by last_used_date, missing dates first, so "not used since" is a binary
+    search. Returned frames keep the original row order and index. Pass a
+    frame with contiguous string columns (``opensam.schema.combine_chunks``),
+    as LiveDataset does, or each row lookup still scans the whole column.
+    """
+
+    def __init__(self, installs_users):
+        self.installs_users = installs_users
+        n = len(installs_users)
+        software_codes, software = pd.factorize(installs_users["software"])
+        if "status" in installs_users.columns:
+            status_codes, statuses = pd.factorize(installs_users["status"])
+        else:
+            status_codes, statuses = np.full(n, -1, dtype=np.intp), []
+        self.has_last_used = "last_used_date" in installs_users.columns
+        if self.has_last_used:
+            # NaT is the smallest int64, so missing dates sort first
+            last_used = pd.to_datetime(installs_users["last_used_date"], errors="coerce")
+            last_used = last_used.to_numpy(dtype="datetime64[ns]").view(np.int64)
+        else:
+            last_used = np.zeros(n, dtype=np.int64)
+
+        order = np.lexsort((last_used, status_codes, software_codes))
+        group = software_codes[order].astype(np.int64) * (len(statuses) + 1) + status_codes[order]
+        bounds = np.concatenate([[0], np.flatnonzero(np.diff(group)) + 1, [n]]).astype(np.int64)
+
+        self._statuses = {status: code for code, status in enumerate(statuses)}
+        self._codes = {name: code for code, name in enumerate(software)}
+        # software code -> {status code: (positions, their sorted last_used values)}
+        self._groups = {}
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            first = order[start]
+            if start == end or software_codes[first] < 0:
+                continue
+            self._groups.setdefault(software_codes[first], {})[status_codes[first]] = (
+                order[start:end], last_used[order[start:end]]
+            )
+
+    def __contains__(self, software):
+        return software in self._codes
+
+    def _group(self, software, status):
+        groups = self._groups.get(self._codes.get(software), {})
+        return groups.get(self._statuses.get(status, -2))
+
+    def positions(self, software, status=None):
+        """Row positions for ``software`` (one ``status`` or all), grouped by status and sorted by last_used_date."""
+        if status is not None:
+            entry = self._group(software, status)
+            return entry[0] if entry is not None else np.array([], dtype=np.intp)
+        parts = [positions for positions, _ in self._groups.get(self._codes.get(software), {}).values()]
+        return np.concatenate(parts) if parts else np.array([], dtype=np.intp)
+
+    def unused_since(self, software, status, before):
+        """Row positions of ``status`` installs of ``software`` with no use on or after ``before``."""
+        entry = self._group(software, status)
+        if entry is None or not self.has_last_used:
+            return np.array([], dtype=np.intp)
+        positions, last_used = entry
+        cut = np.searchsorted(last_used, pd.Timestamp(before).as_unit("ns").value, side="left")
+        return positions[:cut]
+
+    def rows(self, positions):
+        """``installs_users`` rows at ``positions``, in original order."""
+        return self.installs_users.iloc[np.sort(positions)]
+
+    def installs(self, software):
+        """Installs of one product, identical to ``installs_for_product``."""
+        return self.rows(self.positions(software))
+
+    def product_position(self, license_info, software, count_by_user, today):
+        """``product_position`` for ``software`` answered from the index."""
+        threshold = pd.Timestamp(today) - pd.Timedelta(days=LOW_USAGE_DAYS)
+        return _position(
+            license_info,
+            self.installs_users.columns,
+            self.rows(self.positions(software, "active")),
+            self.rows(self.positions(software, "terminated")),
+            self.rows(self.unused_since(software, "active", threshold)),
+            count_by_user,
+        )
@@ -0,0 +1,240 @@
+"""Contract renewal metrics for the Renewal Radar, computed column-wise."""
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_RENEWAL_NOTICE_DAYS = 30
+# Days remaining reported for contracts without an end date (treated as far future)
+NO_CONTRACT_END_DAYS = 999999
+EXPIRING_WITHIN_DAYS = 30
+FORECAST_MONTHS = 36
+# Renewal term assumed when contract_start is missing or not before contract_end
+DEFAULT_TERM_MONTHS = 12
+FORECAST_COLUMNS = ["month", "vendor", "license_type", "renewals", "spend"]
+
+
+def days_until(dates, today):
+    """Whole days from ``today`` to each date; missing dates get NO_CONTRACT_END_DAYS."""
+    return (dates - pd.Timestamp(today)).dt.days.fillna(NO_CONTRACT_END_DAYS).astype(int)
+
+
+def renewal_metrics(licenses, vendors, today):
+    """Licenses joined to vendor notice periods, with renewal timing columns.
+
+    Adds renewal_notice_days (default 30), days_remaining, days_remaining_display
+    (clamped at 0), expiring_30d, notice_start, in_notice_window,
+    annual_spend_proxy and is_subscription.
+    """
+    today = pd.Timestamp(today)
+
+    # Join on vendor to get renewal_notice_days
+    if not vendors.empty and "vendor" in vendors.columns and "vendor" in licenses.columns:
+        renewals = licenses.merge(vendors, on="vendor", how="left")
+    else:
+        renewals = licenses.copy()
+    if "renewal_notice_days" not in renewals.columns:
+        renewals["renewal_notice_days"] = np.nan
+    renewals["renewal_notice_days"] = renewals["renewal_notice_days"].fillna(DEFAULT_RENEWAL_NOTICE_DAYS).astype(int)
+
+    if "contract_end" in renewals.columns:
+        contract_end = renewals["contract_end"]
+        renewals["days_remaining"] = days_until(contract_end, today)
+    else:
+        contract_end = None
+        renewals["days_remaining"] = NO_CONTRACT_END_DAYS
+    renewals["days_remaining_display"] = renewals["days_remaining"].clip(lower=0)
+    renewals["expiring_30d"] = renewals["days_remaining"] <= EXPIRING_WITHIN_DAYS
+
+    if contract_end is not None:
+        renewals["notice_start"] = contract_end - pd.to_timedelta(renewals["renewal_notice_days"], unit="D")
+        # NaT notice_start compares False, so contracts without an end date never alert
+        renewals["in_notice_window"] = (renewals["notice_start"] <= today) & (renewals["days_remaining"] > 0)
+    else:
+        renewals["notice_start"] = pd.NaT
+        renewals["in_notice_window"] = False
+
+    if "seats_purchased" in renewals.columns and "unit_cost_usd" in renewals.columns:
+        renewals["annual_spend_proxy"] = renewals["seats_purchased"] * renewals["unit_cost_usd"]
+    else:
+        renewals["annual_spend_proxy"] = 0
+
+    if "license_type" in renewals.columns:
+        renewals["is_subscription"] = renewals["license_type"].str.contains("subscription", case=False, na=False)
+    else:
+        renewals["is_subscription"] = False
+
+    return renewals
+
+
+def alert_icons(expiring, in_notice_window):
+    """🔴 for contracts expiring soon, 🟡 for those in their notice window, blank otherwise."""
+    return np.where(expiring, "🔴", np.where(in_notice_window, "🟡", ""))
+
+
+def renewal_schedule(renewals, vendors=None, only_subs=False, max_days=90):
+    """Contracts matching the radar filters, soonest renewal first."""
+    filtered = renewals
+    if vendors:
+        filtered = filtered[filtered["vendor"].isin(vendors)]
+    if only_subs:
+        filtered = filtered[filtered["is_subscription"]]
+    filtered = filtered[filtered["days_remaining"] <= max_days]
+    return filtered.sort_values("days_remaining", ascending=True, kind="stable")
+
+
+def schedule_totals(schedule):
+    """Radar KPIs for a schedule: products, expiring_30d, in_notice_window and subscription_spend."""
+    return {
+        "products": len(schedule),
+        "expiring_30d": int(schedule["expiring_30d"].sum()),
+        "in_notice_window": int(schedule["in_notice_window"].sum()),
+        "subscription_spend": float(schedule.loc[schedule["is_subscription"] == True, "annual_spend_proxy"].sum()),
+    }
+
+
+class RenewalIndex:
+    """Renewal metrics sorted by days remaining, partitioned by vendor and subscription flag.
+
+    Each partition keeps its row positions in days-remaining order plus
+    prefix sums of the KPI columns, so a radar window (vendors, subscriptions
+    only, max days) is a binary search per selected vendor: ``schedule`` slices
+    the rows and ``totals`` reads the KPIs without touching them.
+    """
+
+    def __init__(self, renewals):
+        self.renewals = renewals.sort_values("days_remaining", ascending=True, kind="stable")
+        days = self.renewals["days_remaining"].to_numpy()
+        subscription = self.renewals["is_subscription"].to_numpy(dtype=bool)
+        spend = pd.to_numeric(self.renewals["annual_spend_proxy"], errors="coerce").fillna(0).to_numpy(dtype=float)
+        self._columns = {
+            "days": days,
+            "expiring_30d": self.renewals["expiring_30d"].to_numpy(dtype=np.int64),
+            "in_notice_window": self.renewals["in_notice_window"].to_numpy(dtype=np.int64),
+            "subscription_spend": np.where(subscription, spend, 0.0),
+        }
+
+        everything = np.arange(len(days))
+        self._partitions = {
+            (None, False): self._partition(everything),
+            (None, True): self._partition(everything[subscription]),
+        }
+        if "vendor" in self.renewals.columns:
+            codes, vendors = pd.factorize(self.renewals["vendor"])
+            # Stable, so each vendor's positions stay in days-remaining order
+            by_vendor = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[by_vendor], np.arange(len(vendors) + 1))
+            for code, vendor in enumerate(vendors):
+                positions = by_vendor[bounds[code]:bounds[code + 1]]
+                self._partitions[(vendor, False)] = self._partition(positions)
+                self._partitions[(vendor, True)] = self._partition(positions[subscription[positions]])
+
+    def _partition(self, positions):
+        prefix = {
+            name: np.concatenate([[0], np.cumsum(values[positions])])
+            for name, values in self._columns.items() if name != "days"
+        }
+        return positions, self._columns["days"][positions], prefix
+
+    def _windows(self, vendors, only_subs, max_days):
+        keys = [(vendor, only_subs) for vendor in vendors] if vendors else [(None, only_subs)]
+        for key in keys:
+            partition = self._partitions.get(key)
+            if partition is not None:
+                positions, days, prefix = partition
+                yield positions, prefix, int(np.searchsorted(days, max_days, side="right"))
+
+    def schedule(self, vendors=None, only_subs=False, max_days=90):
+        """Same rows and order as ``renewal_schedule`` on the indexed renewals."""
+        parts = [positions[:end] for positions, _, end in self._windows(vendors, only_subs, max_days)]
+        positions = np.sort(np.concatenate(parts)) if parts else np.array([], dtype=np.intp)
+        return self.renewals.iloc[positions]
+
+    def totals(self, vendors=None, only_subs=False, max_days=90):
+        """``schedule_totals`` of the same window, from the prefix sums."""
+        totals = {"products": 0, "expiring_30d": 0, "in_notice_window": 0, "subscription_spend": 0.0}
+        for _, prefix, end in self._windows(vendors, only_subs, max_days):
+            totals["products"] += end
+            for name, cumulative in prefix.items():
+                totals[name] += cumulative[end]
+        totals["expiring_30d"] = int(totals["expiring_30d"])
+        totals["in_notice_window"] = int(totals["in_notice_window"])
+        totals["subscription_spend"] = float(totals["subscription_spend"])
+        return totals
+
+
+def term_months(licenses):
+    """Contract term in whole months (contract_start to contract_end inclusive), DEFAULT_TERM_MONTHS if unknown."""
+    start = pd.to_datetime(licenses["contract_start"], errors="coerce") if "contract_start" in licenses.columns else pd.NaT
+    end = pd.to_datetime(licenses["contract_end"], errors="coerce")
+    days = ((end - start).dt.days + 1).to_numpy(dtype=float)
+    months = np.rint(days * 12 / 365.25)
+    return np.where(np.isnan(months) | (months < 1), DEFAULT_TERM_MONTHS, months).astype(np.int64)
+
+
+def renewal_forecast(licenses, today, months=FORECAST_MONTHS):
+    """Renewal spend per calendar month for the next ``months`` months, by vendor and license_type.
+
+    Each contract renews in the month of its contract_end and then once per
+    term (see ``term_months``); contracts that already ended are assumed to
+    have renewed on schedule. Every renewal costs seats_purchased ×
+    unit_cost_usd. All renewal cycles are expanded with array operations and
+    summed in one groupby. Returns FORECAST_COLUMNS, month being the first
+    day of the month; contracts without a contract_end are left out.
+    """
+    if "contract_end" not in licenses.columns:
+        return pd.DataFrame(columns=FORECAST_COLUMNS)
+    end = pd.to_datetime(licenses["contract_end"], errors="coerce")
+    today = pd.Timestamp(today)
+
+    # First renewal as a month offset from the current month, rolled forward by whole terms
+    term = term_months(licenses)
+    first = ((end.dt.year - today.year) * 12 + end.dt.month - today.month).to_numpy(dtype=float)
+    known = ~np.isnan(first)
+    first = np.where(known, first, months).astype(np.int64)
+    first += np.maximum(0, -(first // term)) * term
+    count = np.where(first < months, (months - 1 - first) // term + 1, 0)
+
+    # One row per renewal inside the horizon: contract position and month offset
+    rows = np.repeat(np.arange(len(licenses)), count)
+    cycle = np.arange(len(rows)) - np.repeat(np.cumsum(count) - count, count)
+    offset = first[rows] + cycle * term[rows]
+
+    spend = np.zeros(len(licenses))
+    if "seats_purchased" in licenses.columns and "unit_cost_usd" in licenses.columns:
+        spend = (
+            pd.to_numeric(licenses["seats_purchased"], errors="coerce").fillna(0).to_numpy(dtype=float)
+            * pd.to_numeric(licenses["unit_cost_usd"], errors="coerce").fillna(0).to_numpy(dtype=float)
+        )
+    cycles = pd.DataFrame({
+        "offset": offset,
+        "vendor": _labels(licenses, "vendor", rows),
+        "license_type": _labels(licenses, "license_type", rows),
+        "spend": spend[rows],
+    })
+    forecast = cycles.groupby(["offset", "vendor", "license_type"], observed=True, sort=True).agg(
+        renewals=("spend", "size"), spend=("spend", "sum")
+    ).reset_index()
+    month_starts = pd.date_range(today.to_period("M").to_timestamp(), periods=months, freq="MS")
+    forecast.insert(0, "month", month_starts[forecast.pop("offset").to_numpy()])
+    return forecast[FORECAST_COLUMNS]
+
+
+def _labels(licenses, column, rows):
+    if column not in licenses.columns:
+        return np.full(len(rows), "Unknown", dtype=object)
+    return licenses[column].astype(str).where(licenses[column].notna(), "Unknown").to_numpy()[rows]
+
+
+def servicenow_export(schedule, mapping):
+    """Renewal schedule re-labelled for a ServiceNow import (``mapping``: snow field -> local column)."""
+    snow_df = pd.DataFrame()
+    for snow_col, local_col in mapping.items():
+        if local_col in schedule.columns:
+            snow_df[snow_col] = schedule[local_col]
+
+    # Additional ServiceNow fields
+    if "days_remaining" in schedule.columns:
+        snow_df["days_until_expiration"] = schedule["days_remaining"]
+    if "expiring_30d" in schedule.columns:
+        snow_df["requires_action"] = schedule["expiring_30d"]
+    return snow_df
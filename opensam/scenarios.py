@@ -0,0 +1,258 @@
+"""Seat-reduction scenarios for Scenario Planning."""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from opensam.portfolio import LOW_USAGE_DAYS, is_subscription
+
+SEAT_COLUMNS = ["software", "user_email", "device_id", "last_used_date", "department"]
+# Overage simulation: a seat idle for RECENCY_HALF_LIFE_DAYS is half as likely to be needed
+# next period as one used today; seats with no recorded use get UNKNOWN_USAGE_PROBABILITY
+SIMULATION_TRIALS = 2000
+RECENCY_HALF_LIFE_DAYS = LOW_USAGE_DAYS
+UNKNOWN_USAGE_PROBABILITY = 0.5
+# Probabilities are rounded to this step so holders can be drawn in a few binomial groups
+PROBABILITY_STEP = 0.02
+PLAN_COLUMNS = [
+    "software", "vendor", "license_type", "unit_cost_usd", "seats_purchased", "seats_used",
+    "unused_cut", "in_use_cut", "reduce_seats", "new_seat_count", "projected_savings",
+]
+
+
+def removal_candidates(installs, count_by_user, exclude_terminated=True):
+    """A product's installs ordered for removal, least recently used first.
+
+    Installs with no last_used_date sort last. With ``exclude_terminated``
+    only active users are candidates. In user mode the list is deduped to
+    one row per user.
+    """
+    if exclude_terminated:
+        candidates = installs[installs["status"] == "active"].copy()
+    else:
+        candidates = installs.copy()
+
+    # Convert last_used_date to datetime for sorting
+    if "last_used_date" in candidates.columns:
+        candidates["last_used_datetime"] = pd.to_datetime(candidates["last_used_date"], errors="coerce")
+        # Sort by last_used_date ascending (oldest first), NaT values last
+        candidates = candidates.sort_values("last_used_datetime", ascending=True, na_position="last")
+    else:
+        candidates["last_used_datetime"] = pd.NaT
+
+    # If counting by user, dedupe to show one row per user (keep oldest last_used_date)
+    if count_by_user and "user_email" in candidates.columns:
+        candidates = candidates.sort_values("last_used_datetime", ascending=True).groupby("user_email").first().reset_index()
+
+    return candidates
+
+
+def scenario_impact(seats_purchased, reduce_seats, active_count, unit_cost, is_subscription):
+    """New seat count, remaining active users, resulting overage and projected savings."""
+    new_seat_count = seats_purchased - reduce_seats
+    remaining_users = active_count - min(reduce_seats, active_count)
+    return {
+        "new_seat_count": new_seat_count,
+        "remaining_users": remaining_users,
+        "overage": max(0, remaining_users - new_seat_count),
+        "projected_savings": reduce_seats * unit_cost if is_subscription else 0,
+    }
+
+
+def lru_seats(installs_users, count_by_user):
+    """Active seats of every product, least recently used first within each product.
+
+    The portfolio-wide form of ``removal_candidates(..., exclude_terminated=True)``:
+    one row per active install, or per (product, user) in user mode keeping
+    the user's oldest last_used_date. Missing dates rank last; ``rank`` is
+    the 0-based position within the product.
+    """
+    cols = [col for col in SEAT_COLUMNS if col in installs_users.columns]
+    seats = installs_users.loc[installs_users["status"] == "active", cols]
+    if "last_used_date" in seats.columns:
+        last_used = pd.to_datetime(seats["last_used_date"], errors="coerce")
+    else:
+        last_used = pd.Series(pd.NaT, index=seats.index, dtype="datetime64[ns]")
+    seats = seats.assign(last_used_datetime=last_used)
+    seats = seats.sort_values("last_used_datetime", kind="stable", na_position="last")
+    if count_by_user and "user_email" in seats.columns:
+        seats = seats.drop_duplicates(["software", "user_email"])
+    # Stable, so each product keeps its least-recently-used order
+    seats = seats.sort_values("software", kind="stable").reset_index(drop=True)
+    seats["rank"] = seats.groupby("software", observed=True).cumcount()
+    return seats
+
+
+def optimize_reductions(positions, seats, target_savings=None, max_overage=0):
+    """Seat reductions across all subscription products, with the users they remove.
+
+    ``positions`` is the ELP table (``opensam.portfolio.license_position``)
+    and ``seats`` the ``lru_seats`` ranking for the same seat mode. Unused
+    seats carry no risk and are cut first, most expensive first. If they fall
+    short of ``target_savings``, seats held by active users are cut in
+    least-recently-used order across the portfolio, at most ``max_overage``
+    of them (None for no cap): each is a user who loses access and becomes an
+    overage if they still need the software. Without a target, every unused
+    seat and up to ``max_overage`` in-use seats are cut.
+
+    Returns a dict with the per-product ``plan``, the combined ``removals``
+    list, ``total_savings``, ``seats_cut``, ``in_use_cut`` and ``target_met``.
+    """
+    subs = positions[is_subscription(positions["license_type"]) & (positions["unit_cost_usd"] > 0)]
+    subs = subs.drop_duplicates("software").sort_values("unit_cost_usd", ascending=False, kind="stable")
+    cost = subs["unit_cost_usd"].to_numpy(dtype=float)
+    unused = subs["seats_unused"].to_numpy(dtype=np.int64)
+
+    # Unused seats: the shortest most-expensive-first prefix reaching the target
+    unused_cut = unused.copy()
+    if target_savings is not None:
+        cumulative = np.cumsum(unused * cost)
+        k = int(np.searchsorted(cumulative, target_savings, side="left"))
+        unused_cut[k:] = 0
+        if k < len(unused):
+            remaining = target_savings - (cumulative[k - 1] if k else 0)
+            unused_cut[k] = min(unused[k], max(0, int(np.ceil(remaining / cost[k]))))
+    unused_savings = float((unused_cut * cost).sum())
+
+    # In-use seats: every product's LRU prefix, merged into one least-recently-used order
+    if isinstance(seats["software"].dtype, pd.CategoricalDtype):
+        codes, categories = seats["software"].cat.codes.to_numpy(), seats["software"].cat.categories
+    else:
+        codes, categories = pd.factorize(seats["software"])
+    # Row of ``subs`` for each seat, -1 if the product is not a priced subscription
+    lookup = np.append(pd.Index(subs["software"].astype(str)).get_indexer(categories.astype(str)), -1)
+    product = lookup[codes]
+    cap = np.minimum(subs["seats_used"].to_numpy(), subs["seats_purchased"].to_numpy())
+    eligible = np.flatnonzero((product >= 0) & (seats["rank"].to_numpy() < np.append(cap, 0)[product]))
+    product = product[eligible]
+    pool_cost = cost[product]
+    # Oldest use first (missing dates last), then the dearer seat; rank keeps each product's own order
+    last_used = seats["last_used_datetime"].iloc[eligible]
+    idle = np.where(last_used.isna(), np.iinfo(np.int64).max, last_used.to_numpy(dtype="datetime64[ns]").view(np.int64))
+    order = np.lexsort((seats["rank"].to_numpy()[eligible], product, -pool_cost, idle))
+
+    limit = len(order) if max_overage is None else min(len(order), int(max_overage))
+    if target_savings is None:
+        n = limit
+    elif unused_savings >= target_savings:
+        n = 0
+    else:
+        n = min(limit, int(np.searchsorted(np.cumsum(pool_cost[order]), target_savings - unused_savings)) + 1)
+    chosen = order[:n]
+    removals = seats.iloc[eligible[chosen]].drop(columns=["last_used_datetime", "rank"])
+    removals = removals.assign(unit_cost_usd=pool_cost[chosen])
+    in_use_cut = np.bincount(product[chosen], minlength=len(subs))
+
+    plan = subs.assign(unused_cut=unused_cut, in_use_cut=in_use_cut)
+    plan["reduce_seats"] = plan["unused_cut"] + plan["in_use_cut"]
+    plan["new_seat_count"] = plan["seats_purchased"] - plan["reduce_seats"]
+    plan["projected_savings"] = plan["reduce_seats"] * plan["unit_cost_usd"]
+    plan = plan[plan["reduce_seats"] > 0].sort_values("projected_savings", ascending=False, kind="stable")
+    plan = plan[[col for col in PLAN_COLUMNS if col in plan.columns]].reset_index(drop=True)
+
+    total_savings = float(plan["projected_savings"].sum())
+    return {
+        "plan": plan,
+        "removals": removals.reset_index(drop=True),
+        "total_savings": total_savings,
+        "seats_cut": int(plan["reduce_seats"].sum()),
+        "in_use_cut": int(n),
+        "target_met": target_savings is None or total_savings >= target_savings,
+    }
+
+
+def _idle_probability(last_used, today, half_life_days):
+    idle_days = (pd.Timestamp(today) - last_used).dt.days.clip(lower=0)
+    return np.power(0.5, idle_days / half_life_days).fillna(UNKNOWN_USAGE_PROBABILITY)
+
+
+def _active_last_used(installs, count_by_user, by=()):
+    """Most recent last_used_date per active seat (device, or user in user mode), grouped by ``by`` columns too."""
+    active = installs[installs["status"] == "active"]
+    if "last_used_date" in active.columns:
+        last_used = pd.to_datetime(active["last_used_date"], errors="coerce")
+    else:
+        last_used = pd.Series(pd.NaT, index=active.index, dtype="datetime64[ns]")
+    keys = [active[col] for col in by] + [active["user_email" if count_by_user else "device_id"]]
+    return last_used.groupby(keys, observed=True).max()
+
+
+def need_probabilities(installs, count_by_user, today, half_life_days=RECENCY_HALF_LIFE_DAYS):
+    """Chance each active seat of ``installs`` is needed next period, from how long it has been idle.
+
+    One value per active device, or per active user in user mode (using the
+    seat's most recent last_used_date).
+    """
+    return _idle_probability(_active_last_used(installs, count_by_user), today, half_life_days).to_numpy()
+
+
+def _levels(probabilities):
+    # Distinct probabilities (rounded to PROBABILITY_STEP) and how many holders have each
+    steps, counts = np.unique(np.rint(np.asarray(probabilities, dtype=float) / PROBABILITY_STEP), return_counts=True)
+    return steps * PROBABILITY_STEP, counts
+
+
+def _simulate(levels, counts, seats, trials, seed):
+    levels = np.clip(levels, 0, 1)
+    # Holders certain to need (or not need) a seat add a constant; only the rest are drawn
+    uncertain = (levels > 0) & (levels < 1)
+    certain = int(counts[levels >= 1].sum())
+    rng = np.random.default_rng(seed)
+    draws = rng.binomial(counts[uncertain], levels[uncertain], size=(trials, int(uncertain.sum())))
+    demand = certain + draws.sum(axis=1)
+    return {
+        "overage_probability": float((demand > seats).mean()),
+        "expected_demand": float(demand.mean()),
+        "p95_demand": float(np.percentile(demand, 95)),
+    }
+
+
+def simulate_overage(probabilities, seats, trials=SIMULATION_TRIALS, seed=0):
+    """Monte Carlo estimate of the chance that seats needed exceed ``seats``.
+
+    Each holder needs a seat with its own probability. Holders are grouped by
+    probability (rounded to PROBABILITY_STEP) and each group is one binomial
+    draw, so all ``trials`` are a single (trials x groups) array. Returns a
+    dict with ``overage_probability``, ``expected_demand`` and ``p95_demand``.
+    """
+    levels, counts = _levels(probabilities)
+    return _simulate(levels, counts, seats, trials, seed)
+
+
+def _simulate_batch(tasks):
+    return [_simulate(*task) for task in tasks]
+
+
+def portfolio_overage_risk(plan, installs_users, count_by_user, today, trials=SIMULATION_TRIALS, workers=None, seed=0):
+    """``simulate_overage`` for every product in an ``optimize_reductions`` plan at its new seat count.
+
+    Seat probabilities for all products come from one grouped pass over
+    ``installs_users``. With ``workers`` > 1 the simulations are split across
+    that many processes; results do not depend on the split (each product has
+    its own seed). Returns the plan's software and new_seat_count with
+    expected_demand, p95_demand and overage_probability columns.
+    """
+    products = plan["software"].astype(str).tolist()
+    installs = installs_users[installs_users["software"].isin(products)]
+    probability = _idle_probability(_active_last_used(installs, count_by_user, by=["software"]), today, RECENCY_HALF_LIFE_DAYS)
+    step = np.rint(probability.to_numpy() / PROBABILITY_STEP).astype(np.int64)
+    holders = pd.Series(step).groupby([probability.index.get_level_values(0).astype(str), step]).size()
+    by_product = {name: group.droplevel(0) for name, group in holders.groupby(level=0)}
+
+    empty = pd.Series(dtype=np.int64)
+    tasks = []
+    for i, (name, seats) in enumerate(zip(products, plan["new_seat_count"].tolist())):
+        counts = by_product.get(name, empty)
+        tasks.append((counts.index.to_numpy() * PROBABILITY_STEP, counts.to_numpy(), seats, trials, (seed, i)))
+    if workers and workers > 1 and len(tasks) > 1:
+        batches = [tasks[i::workers] for i in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            done = list(pool.map(_simulate_batch, batches))
+        results = [None] * len(tasks)
+        for i, batch in enumerate(done):
+            results[i::workers] = batch
+    else:
+        results = _simulate_batch(tasks)
+    risk = pd.DataFrame(results, columns=["expected_demand", "p95_demand", "overage_probability"])
+    return pd.concat([plan[["software", "new_seat_count"]].reset_index(drop=True), risk], axis=1)
@@ -0,0 +1,120 @@
+"""Declared column types for the OpenSAM data sources.
+
+Dates load as datetime64 (so day arithmetic stays vectorized), low-cardinality
+labels load as categoricals, and seat counts use a compact integer type.
+Columns missing from a file are simply skipped.
+"""
+
+import pandas as pd
+import pyarrow as pa
+
+CATEGORY = "category"
+DATE = "date"
+
+TABLE_SCHEMAS = {
+    "licenses": {
+        "software": CATEGORY,
+        "vendor": CATEGORY,
+        "license_type": CATEGORY,
+        "unit_cost_usd": "float64",
+        "seats_purchased": "int32",
+        "contract_start": DATE,
+        "contract_end": DATE,
+    },
+    "installs": {
+        "software": CATEGORY,
+        "install_date": DATE,
+        "last_used_date": DATE,
+    },
+    "users": {
+        "department": CATEGORY,
+        "country": CATEGORY,
+        "status": CATEGORY,
+    },
+    "vendors": {
+        "vendor": CATEGORY,
+    },
+}
+
+# Join keys that must share one category set across tables
+SHARED_CATEGORIES = {
+    "software": ["licenses", "installs"],
+    "vendor": ["licenses", "vendors"],
+}
+
+
+def coerce_dates(df, cols):
+    """Convert specified columns to midnight-normalized datetime64 (unparseable -> NaT)."""
+    for c in cols:
+        if c in df.columns:
+            df[c] = pd.to_datetime(df[c], errors="coerce").dt.normalize()
+    return df
+
+
+def _to_category(s):
+    """Categorical of string labels with lexically sorted categories."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return s
+    labels = s.where(s.isna(), s.astype(str))
+    return labels.astype(CATEGORY)
+
+
+def _to_integer(s, dtype):
+    """Downcast to an integer dtype when lossless; otherwise keep float64 (NaNs stay NaN)."""
+    numeric = pd.to_numeric(s, errors="coerce")
+    if numeric.isna().any() or (numeric % 1 != 0).any():
+        return numeric.astype("float64")
+    return numeric.astype(dtype)
+
+
+def apply_schema(df, schema):
+    """Coerce a frame's columns to the declared dtypes."""
+    coerce_dates(df, [c for c, dtype in schema.items() if dtype == DATE])
+    for col, dtype in schema.items():
+        if col not in df.columns or dtype == DATE:
+            continue
+        if dtype == CATEGORY:
+            df[col] = _to_category(df[col])
+        elif dtype.startswith("int"):
+            df[col] = _to_integer(df[col], dtype)
+        else:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(dtype)
+    return df
+
+
+def align_categories(data):
+    """Give shared join keys identical (sorted) categories so merges stay categorical.
+
+    ``data`` may hold only some of the tables (e.g. slices about to be joined).
+    """
+    for col, tables in SHARED_CATEGORIES.items():
+        present = [t for t in tables if t in data and col in data[t].columns]
+        if len(present) < 2:
+            continue
+        categories = sorted(set().union(*(data[t][col].cat.categories for t in present)))
+        for t in present:
+            data[t][col] = data[t][col].cat.set_categories(categories)
+    return data
+
+
+def fillna_category(s, value):
+    """fillna that also works on categoricals lacking the fill value as a category."""
+    if isinstance(s.dtype, pd.CategoricalDtype) and value not in s.cat.categories:
+        s = s.cat.add_categories([value])
+    return s.fillna(value)
+
+
+def combine_chunks(df):
+    """``df`` with every Arrow-backed column (pandas' default strings) in one contiguous chunk.
+
+    Parquet reads and concats leave such columns in many chunks, and taking a
+    handful of rows from a chunked column costs time in its full length.
+    """
+    combined = {}
+    for col in df.columns:
+        if getattr(df[col].dtype, "storage", None) != "pyarrow":
+            continue
+        values = pa.array(df[col].array)
+        if isinstance(values, pa.ChunkedArray) and values.num_chunks > 1:
+            combined[col] = pd.array(values.combine_chunks(), dtype=df[col].dtype)
+    return df.assign(**combined) if combined else df
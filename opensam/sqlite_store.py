@@ -0,0 +1,284 @@
+"""Indexed SQLite store for pages that only need a slice of the estate.
+
+The four tables (plus pending installation deltas) are copied once per
+dataset version into a SQLite file with a declared schema and indexes on the
+columns the pages filter by. Product Drilldown then reads one product's
+installs, the department detail view one department's, and Renewal Radar
+only the contracts ending inside its window, instead of every page joining
+the full frames. Each query returns exactly what the pandas pipeline would
+(``installs_for_product``, ``department_installs``, ``renewal_metrics``),
+typed per opensam.schema; categoricals only carry the categories present in
+the slice.
+
+Uses the standard-library ``sqlite3`` module. The app uses it when started
+with ``OPENSAM_STORE=sqlite``.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import timedelta
+
+import pandas as pd
+
+from opensam.enrich import join_licenses, join_users
+from opensam.ingest import INSTALL_KEY, delta_paths, prepare_delta, read_delta
+from opensam.renewals import renewal_metrics
+from opensam.schema import CATEGORY, TABLE_SCHEMAS, align_categories, apply_schema
+from opensam.storage import CACHE_DIRNAME, dataset_version, load_dataset, source_paths
+
+STORE_FILENAME = "opensam.sqlite"
+DATE_FORMAT = "%Y-%m-%d"
+# Rows carry their position in the store (rowid - 1) through the joins as the index
+ROW_COLUMN = "_row"
+
+# Declared column types; columns a file adds beyond these are stored untyped
+STORE_SCHEMA = {
+    "users": {
+        "user_email": "TEXT",
+        "department": "TEXT",
+        "country": "TEXT",
+        "status": "TEXT",
+    },
+    "licenses": {
+        "software": "TEXT",
+        "vendor": "TEXT",
+        "license_type": "TEXT",
+        "unit_cost_usd": "REAL",
+        "seats_purchased": "INTEGER",
+        "contract_start": "TEXT",
+        "contract_end": "TEXT",
+        "license_key": "TEXT",
+    },
+    "installs": {
+        "device_id": "TEXT",
+        "user_email": "TEXT",
+        "software": "TEXT",
+        "version": "TEXT",
+        "install_date": "TEXT",
+        "last_used_date": "TEXT",
+    },
+    "vendors": {
+        "vendor": "TEXT",
+        "account_manager": "TEXT",
+        "email": "TEXT",
+        "renewal_notice_days": "INTEGER",
+    },
+}
+
+# index name -> (table, columns); skipped when the table lacks a column
+STORE_INDEXES = {
+    "installs_software": ("installs", ["software"]),
+    "installs_user_email": ("installs", ["user_email"]),
+    "installs_key": ("installs", INSTALL_KEY),
+    "users_user_email": ("users", ["user_email"]),
+    "users_department": ("users", ["department"]),
+    "users_status": ("users", ["status"]),
+    "licenses_software": ("licenses", ["software"]),
+    "licenses_contract_end": ("licenses", ["contract_end"]),
+    "vendors_vendor": ("vendors", ["vendor"]),
+}
+
+
+def default_store_path(data_dir="data"):
+    """``data_dir/.cache/opensam.sqlite``, next to the Parquet cache."""
+    return os.path.join(data_dir, CACHE_DIRNAME, STORE_FILENAME)
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _placeholders(n):
+    return ", ".join("?" * n)
+
+
+def _column_values(s):
+    """Python values for one column: dates as ISO strings, missing values as None."""
+    if pd.api.types.is_datetime64_any_dtype(s):
+        s = s.dt.strftime(DATE_FORMAT)
+    return [None if pd.isna(v) else v for v in s.astype(object).tolist()]
+
+
+def _rows(df, columns):
+    return zip(*(_column_values(df[c]) for c in columns))
+
+
+def _create_table(con, name, df):
+    declared = STORE_SCHEMA[name]
+    definition = ", ".join(f"{_quote(c)} {declared.get(c, '')}".strip() for c in df.columns)
+    con.execute(f"CREATE TABLE {name} ({definition})")
+    con.executemany(
+        f"INSERT INTO {name} VALUES ({_placeholders(len(df.columns))})", _rows(df, list(df.columns))
+    )
+
+
+def _create_indexes(con, tables):
+    for index, (table, columns) in STORE_INDEXES.items():
+        if table in tables and set(columns) <= set(tables[table]):
+            con.execute(f"CREATE INDEX {index} ON {table} ({', '.join(_quote(c) for c in columns)})")
+
+
+def _by_row(joined):
+    """Index joined rows by their store position, like slices of the in-memory joins."""
+    return joined.set_index(ROW_COLUMN).rename_axis(None)
+
+
+class SQLiteStore:
+    """A SQLite copy of one data directory, rebuilt when its source files change.
+
+    Installation deltas (see opensam.ingest) are upserted in place as they
+    appear. Safe to share between threads: every query opens its own
+    connection, and rebuilds swap in a complete new file.
+    """
+
+    def __init__(self, data_dir="data", path=None):
+        self.data_dir = data_dir
+        self.path = path or default_store_path(data_dir)
+        self.version = None
+        self.applied = []
+        self.dtypes = {}
+        self._lock = threading.Lock()
+        self._restore_meta()
+        self.refresh()
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path))
+
+    def _restore_meta(self):
+        # A store built earlier (by another process or run) is reused if the sources haven't changed
+        if not os.path.exists(self.path):
+            return
+        try:
+            with self._connect() as con:
+                meta = dict(con.execute("SELECT key, value FROM opensam_meta").fetchall())
+        except sqlite3.DatabaseError:
+            return
+        self.version = meta.get("version")
+        self.applied = json.loads(meta.get("applied", "[]"))
+        self.dtypes = json.loads(meta.get("dtypes", "{}"))
+
+    def _save_meta(self, con):
+        con.execute(
+            "INSERT OR REPLACE INTO opensam_meta VALUES ('version', ?), ('applied', ?), ('dtypes', ?)",
+            [self.version, json.dumps(self.applied), json.dumps(self.dtypes)],
+        )
+
+    def refresh(self):
+        """Rebuild if the source files changed and apply new delta files; returns True if anything changed."""
+        with self._lock:
+            version = dataset_version(source_paths(self.data_dir))
+            changed = False
+            if version != self.version:
+                self._build(version)
+                changed = True
+            pending = [p for p in delta_paths(self.data_dir) if p not in self.applied]
+            if pending:
+                with self._connect() as con, con:
+                    for path in pending:
+                        self._apply_delta(con, path)
+                        self.applied.append(path)
+                    self._save_meta(con)
+                changed = True
+            return changed
+
+    def _build(self, version):
+        """Write every table to a fresh file and swap it in."""
+        data, _ = load_dataset(self.data_dir, apply_deltas=False)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        with closing(sqlite3.connect(tmp_path)) as con, con:
+            con.execute("CREATE TABLE opensam_meta (key TEXT PRIMARY KEY, value TEXT)")
+            tables = {name: list(df.columns) for name, df in data.items() if len(df.columns)}
+            for name in tables:
+                _create_table(con, name, data[name])
+            _create_indexes(con, tables)
+            # pandas dtypes of the loaded frames, restored on read (SQLite only knows a few storage classes)
+            self.dtypes = {name: data[name].dtypes.astype(str).to_dict() for name in tables}
+            self.version, self.applied = version, []
+            self._save_meta(con)
+        os.replace(tmp_path, self.path)
+
+    def _apply_delta(self, con, path):
+        """Upsert one delta file into installs, keyed on (device_id, software)."""
+        delta = prepare_delta(read_delta(path))
+        stored = self._columns(con, "installs")
+        columns = [c for c in delta.columns if c in stored]
+        key = " AND ".join(f"{c} = ?" for c in INSTALL_KEY)
+        con.executemany(f"DELETE FROM installs WHERE {key}", _rows(delta, INSTALL_KEY))
+        # Appended rows get the highest rowids, matching opensam.ingest.upsert_installs
+        con.executemany(
+            f"INSERT INTO installs ({', '.join(_quote(c) for c in columns)}) VALUES ({_placeholders(len(columns))})",
+            _rows(delta, columns),
+        )
+
+    @staticmethod
+    def _columns(con, table):
+        return [row[1] for row in con.execute(f"PRAGMA table_info({table})").fetchall()]
+
+    def _read(self, con, table, where="", params=(), rows=False):
+        """Rows of ``table`` matching ``where`` in file order, typed per opensam.schema.
+
+        ``rows`` adds each row's position in the store as a ROW_COLUMN column.
+        """
+        columns = self._columns(con, table)
+        if not columns:
+            return pd.DataFrame()
+        select = ", ".join(_quote(c) for c in columns)
+        if rows:
+            select += f", rowid - 1 AS {ROW_COLUMN}"
+        df = apply_schema(
+            pd.read_sql_query(f"SELECT {select} FROM {table} {where} ORDER BY rowid", con, params=list(params)),
+            TABLE_SCHEMAS[table],
+        )
+        return df.astype({c: d for c, d in self.dtypes.get(table, {}).items() if d != CATEGORY})
+
+    def product_installs(self, software):
+        """Same rows as ``installs_for_product(join_users(installs, users), software)``."""
+        with self._connect() as con:
+            installs = self._read(con, "installs", "WHERE software = ?", [software], rows=True)
+            users = self._read(
+                con, "users", "WHERE user_email IN (SELECT user_email FROM installs WHERE software = ?)", [software]
+            )
+        return _by_row(join_users(installs, users))
+
+    def department_installs(self, department):
+        """Same rows as ``department_installs(join_licenses(join_users(...), licenses), department)``."""
+        if department == "Unknown":
+            # Installs whose user is missing from users.csv or has no department are filled as "Unknown"
+            emails = ("SELECT user_email FROM users WHERE department IS NULL OR department = ? "
+                      "UNION SELECT i.user_email FROM installs i "
+                      "WHERE NOT EXISTS (SELECT 1 FROM users u WHERE u.user_email = i.user_email)")
+            install_where = f"WHERE user_email IS NULL OR user_email IN ({emails})"
+        else:
+            emails = "SELECT user_email FROM users WHERE department = ?"
+            install_where = f"WHERE user_email IN ({emails})"
+        with self._connect() as con:
+            installs = self._read(con, "installs", install_where, [department], rows=True)
+            users = self._read(
+                con, "users", f"WHERE user_email IN (SELECT user_email FROM installs {install_where})", [department]
+            )
+            licenses = self._read(
+                con, "licenses", f"WHERE software IN (SELECT software FROM installs {install_where})", [department]
+            )
+        align_categories({"installs": installs, "licenses": licenses})
+        installs_users_licenses = _by_row(join_licenses(join_users(installs, users), licenses))
+        return installs_users_licenses[installs_users_licenses["department"] == department]
+
+    def renewal_metrics(self, today, max_days):
+        """``renewal_metrics`` for the contracts with at most ``max_days`` remaining."""
+        with self._connect() as con:
+            if "contract_end" not in self._columns(con, "licenses"):
+                # Without end dates no contract falls inside the window
+                return _by_row(renewal_metrics(self._read(con, "licenses", "WHERE 0", rows=True), pd.DataFrame(), today))
+            window = "WHERE contract_end <= ?"
+            window_end = (pd.Timestamp(today) + timedelta(days=max_days)).strftime(DATE_FORMAT)
+            licenses = self._read(con, "licenses", window, [window_end], rows=True)
+            # One row per vendor: read whole so an empty window still gets the vendor columns
+            vendors = self._read(con, "vendors")
+        align_categories({"licenses": licenses, "vendors": vendors})
+        return _by_row(renewal_metrics(licenses, vendors, today))
@@ -0,0 +1,223 @@
+"""Columnar on-disk cache for the CSV data sources.
+
+Each CSV is parsed once and written as Parquet to a ``.cache/`` folder next
+to the source file. A small JSON sidecar records the source's size, mtime
+and SHA-256 (plus the schema applied) so the Parquet copy is only rebuilt
+when the CSV or the declared schema changes.
+
+A table can also be stored as ``<name>.parquet`` or split into numbered
+shards (``installations-00000.csv``, ``installations-00001.parquet``, ... as
+written by ops/generate_mock_data.py); shards are concatenated in name order.
+"""
+
+import glob
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from opensam.ingest import DELTA_DIRNAME, delta_paths, read_delta, upsert_installs
+from opensam.schema import TABLE_SCHEMAS, align_categories, apply_schema
+from opensam.timing import stage
+
+CACHE_DIRNAME = ".cache"
+HASH_CHUNK_BYTES = 1 << 20
+
+# Source file for each table, relative to the data directory
+DATA_FILES = {
+    "licenses": "licenses.csv",
+    "installs": "installations.csv",
+    "users": "users.csv",
+    "vendors": "vendors.csv",
+}
+# Source formats in order of preference when a table exists in more than one
+SOURCE_FORMATS = ["parquet", "csv"]
+
+
+def file_sha256(path):
+    """Return the SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def dataset_version(paths):
+    """Short fingerprint of a set of source files (size + mtime), used as a cache key."""
+    digest = hashlib.sha256()
+    for path in sorted(str(p) for p in paths):
+        try:
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+        except FileNotFoundError:
+            digest.update(f"{path}:missing;".encode())
+    return digest.hexdigest()[:16]
+
+
+def cache_paths(path):
+    """Return the (parquet, meta) cache paths for a source CSV."""
+    path = Path(path)
+    cache_dir = path.parent / CACHE_DIRNAME
+    return cache_dir / f"{path.stem}.parquet", cache_dir / f"{path.stem}.meta.json"
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(meta_path, meta):
+    tmp_path = meta_path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(meta, fh)
+    os.replace(tmp_path, meta_path)
+
+
+def _write_cache(df, parquet_path, meta_path, meta):
+    """Write the Parquet copy and its sidecar atomically; skip silently if not writable."""
+    try:
+        parquet_path.parent.mkdir(exist_ok=True)
+        tmp_path = parquet_path.with_suffix(".tmp")
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, parquet_path)
+        _write_meta(meta_path, meta)
+    except (OSError, ImportError, ValueError):
+        # Read-only deployments (or a missing Parquet engine) just fall back to CSV parsing
+        pass
+
+
+def read_csv_cached(path, schema=None):
+    """Load a CSV through its Parquet cache, re-parsing only when the source changed.
+
+    ``schema`` (see ``opensam.schema.TABLE_SCHEMAS``) is applied before the
+    frame is cached, so typed columns load straight from Parquet.
+    The cache is trusted when the source's size and mtime match the sidecar.
+    If only the mtime moved (e.g. a fresh checkout), the content hash decides.
+    Raises FileNotFoundError if the source CSV does not exist.
+    """
+    schema = dict(schema or {})
+    path = Path(path)
+    stat = path.stat()
+    parquet_path, meta_path = cache_paths(path)
+
+    meta = _read_meta(meta_path)
+    if (meta and parquet_path.exists() and meta.get("size") == stat.st_size
+            and meta.get("schema") == schema):
+        if meta.get("mtime_ns") == stat.st_mtime_ns:
+            return pd.read_parquet(parquet_path)
+        if meta.get("sha256") == file_sha256(path):
+            meta["mtime_ns"] = stat.st_mtime_ns
+            try:
+                _write_meta(meta_path, meta)
+            except OSError:
+                pass
+            return pd.read_parquet(parquet_path)
+
+    raw = pd.read_csv(path)
+    with stage("coerce_dates", rows=len(raw)):
+        df = apply_schema(raw, schema)
+    _write_cache(df, parquet_path, meta_path, {
+        "source": path.name,
+        "schema": schema,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": file_sha256(path),
+    })
+    return df
+
+
+def source_files(data_dir, filename):
+    """(files, format) for one table: <stem>.parquet / <stem>-*.parquet, else the CSV equivalents."""
+    stem = Path(filename).stem
+    for fmt in SOURCE_FORMATS:
+        single = os.path.join(data_dir, f"{stem}.{fmt}")
+        files = ([single] if os.path.exists(single) else []) + sorted(glob.glob(os.path.join(data_dir, f"{stem}-*.{fmt}")))
+        if files:
+            return files, fmt
+    return [], None
+
+
+def data_paths(data_dir="data"):
+    """Map each table name to its source files under ``data_dir`` (empty if the table is missing)."""
+    return {name: source_files(data_dir, filename)[0] for name, filename in DATA_FILES.items()}
+
+
+def source_paths(data_dir="data"):
+    """Every source file under ``data_dir``, as passed to ``dataset_version``."""
+    return [path for files in data_paths(data_dir).values() for path in files]
+
+
+def read_table(files, schema=None):
+    """Load one table from its source files with ``schema`` applied.
+
+    CSV files go through their Parquet cache; Parquet files are read as-is.
+    Shards are concatenated in the order given.
+    Raises FileNotFoundError if ``files`` is empty.
+    """
+    if not files:
+        raise FileNotFoundError("no source files for table")
+    schema = dict(schema or {})
+    frames = [
+        read_csv_cached(path, schema) if str(path).endswith(".csv") else apply_schema(pd.read_parquet(path), schema)
+        for path in files
+    ]
+    if len(frames) == 1:
+        return frames[0]
+    # Shards carry their own category sets; the concat falls back to labels and is re-typed once
+    return apply_schema(pd.concat(frames, ignore_index=True), schema)
+
+
+def load_dataset(data_dir="data", apply_deltas=True):
+    """Load all four tables with the declared schema, outside Streamlit.
+
+    Each table is read from CSV or Parquet, whole or sharded (see ``source_files``).
+    Pending installation deltas (``data_dir/deltas/*.csv``, see
+    ``opensam.ingest``) are upserted into installs unless ``apply_deltas`` is
+    False. Returns ``(data, version)``: a dict of frames keyed like DATA_FILES
+    (missing files load as empty frames) and the dataset version fingerprint.
+    """
+    paths = data_paths(data_dir)
+    deltas = delta_paths(data_dir) if apply_deltas else []
+    version = dataset_version([path for files in paths.values() for path in files] + deltas)
+    data = {}
+    for name, files in paths.items():
+        try:
+            with stage(f"load_csv:{name}") as timing:
+                data[name] = read_table(files, TABLE_SCHEMAS[name])
+                timing["rows"] = len(data[name])
+        except FileNotFoundError:
+            data[name] = pd.DataFrame()
+    for path in deltas:
+        data["installs"] = upsert_installs(data["installs"], read_delta(path))
+    return align_categories(data), version
+
+
+def compact_deltas(data_dir="data"):
+    """Fold pending deltas into installations.csv and move them to ``deltas/applied/``.
+
+    Returns the delta paths that were folded in. Rewriting the CSV changes the
+    dataset version, so running apps reload once rather than replaying deltas.
+    Raises ValueError if installs are stored as Parquet or as shards.
+    """
+    deltas = delta_paths(data_dir)
+    if not deltas:
+        return []
+    installs_path = os.path.join(data_dir, DATA_FILES["installs"])
+    if data_paths(data_dir)["installs"] not in ([], [installs_path]):
+        raise ValueError(f"compact_deltas only rewrites {installs_path}; installs here are Parquet or sharded")
+    data, _ = load_dataset(data_dir)
+    tmp_path = installs_path + ".tmp"
+    data["installs"].to_csv(tmp_path, index=False, date_format="%Y-%m-%d")
+    os.replace(tmp_path, installs_path)
+
+    applied_dir = os.path.join(data_dir, DELTA_DIRNAME, "applied")
+    os.makedirs(applied_dir, exist_ok=True)
+    for path in deltas:
+        os.replace(path, os.path.join(applied_dir, os.path.basename(path)))
+    return deltas
@@ -0,0 +1,52 @@
+"""Server-side sorting, filtering and paging for large install tables.
+
+A table is sorted once per column into an array of row positions, and a
+text filter becomes a boolean mask over the rows; both can be cached. Each
+page is then a slice of ``order[mask[order]]``, so only the visible rows are
+ever materialized.
+"""
+
+import numpy as np
+import pandas as pd
+
+PAGE_SIZES = [25, 50, 100, 500]
+
+
+def sort_positions(df, column=None, ascending=True):
+    """Row positions of ``df`` sorted by ``column`` (stable, missing values last); file order if None."""
+    if column is None:
+        return np.arange(len(df))
+    values = df[column].reset_index(drop=True)
+    return values.sort_values(ascending=ascending, kind="stable", na_position="last").index.to_numpy()
+
+
+def _contains(s, text):
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        # Match each category once, then broadcast through the codes
+        hits = np.append(s.cat.categories.astype(str).str.contains(text, case=False, regex=False), False)
+        return hits[s.cat.codes.to_numpy()]
+    return s.str.contains(text, case=False, regex=False, na=False).to_numpy(dtype=bool)
+
+
+def match_mask(df, text, columns=None):
+    """Boolean array: rows where any text column in ``columns`` contains ``text`` (case-insensitive)."""
+    columns = columns or list(df.columns)
+    mask = np.zeros(len(df), dtype=bool)
+    for col in columns:
+        s = df[col]
+        if isinstance(s.dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(s):
+            mask |= _contains(s, text)
+    return mask
+
+
+def page_positions(order, mask=None, page=1, page_size=PAGE_SIZES[1]):
+    """``(positions, total, pages, page)`` for one page of the rows in ``order`` that pass ``mask``.
+
+    ``page`` is 1-based and clamped to the available pages.
+    """
+    visible = order if mask is None else order[mask[order]]
+    total = len(visible)
+    pages = max(1, -(-total // page_size))
+    page = min(max(1, page), pages)
+    start = (page - 1) * page_size
+    return visible[start:start + page_size], total, pages, page
@@ -0,0 +1,126 @@
+"""Per-stage timings for one run of a page script.
+
+A run is started at the top of a page (``start_run``) and closed at the end
+(``finish_run``), which appends it to a JSONL log. In between, ``stage``
+blocks record their duration, input row count and, for cached stages,
+whether the cache was hit: the cached function's body calls ``mark_miss``,
+so a stage that never reaches it was served from the cache. Runs are kept
+per thread (Streamlit runs each session's script on its own thread); with no
+run open, as in batch jobs and benchmarks, ``stage`` only costs a timer.
+
+The log has one JSON object per run::
+
+    {"ts": 1792224000.0, "page": "home", "seconds": 0.42,
+     "stages": [{"stage": "build_sam", "seconds": 0.01, "rows": 52, "cache": "hit"}, ...]}
+
+``latency_summary`` turns it into p50/p95 rerun latency per page.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# Runs kept in memory for the in-app latency summary
+MAX_RECENT_RUNS = 500
+STAGE_COLUMNS = ["stage", "seconds", "rows", "cache"]
+SUMMARY_COLUMNS = ["page", "runs", "p50_seconds", "p95_seconds"]
+
+_local = threading.local()
+_log_lock = threading.Lock()
+_recent = deque(maxlen=MAX_RECENT_RUNS)
+
+
+def current_run():
+    """The run open on this thread, or None."""
+    return getattr(_local, "run", None)
+
+
+def start_run(page):
+    """Open a run for ``page`` on this thread, discarding any run left open."""
+    _local.run = {"page": page, "ts": time.time(), "stages": []}
+    _local.open = []
+    _local.started = time.perf_counter()
+
+
+@contextmanager
+def stage(name, rows=None, cached=False):
+    """Time the block as stage ``name``; yields its record so ``rows`` can be set inside.
+
+    ``cached`` stages start as a cache "hit" and become a "miss" if
+    ``mark_miss`` is called while they are open.
+    """
+    record = {"stage": name, "seconds": None, "rows": rows, "cache": "hit" if cached else None}
+    run = current_run()
+    if run is not None:
+        run["stages"].append(record)
+        _local.open.append(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = round(time.perf_counter() - started, 6)
+        if run is not None and _local.open and _local.open[-1] is record:
+            _local.open.pop()
+
+
+def mark_miss():
+    """Mark the innermost open cached stage as a cache miss."""
+    for record in reversed(getattr(_local, "open", [])):
+        if record["cache"] is not None:
+            record["cache"] = "miss"
+            return
+
+
+def finish_run(log_path=None):
+    """Close this thread's run, append it to ``log_path`` (JSONL) if given, and return it."""
+    run = current_run()
+    if run is None:
+        return None
+    run["seconds"] = round(time.perf_counter() - _local.started, 6)
+    _local.run = None
+    _recent.append((run["page"], run["seconds"]))
+    if log_path:
+        try:
+            os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+            line = json.dumps(run, default=str)
+            with _log_lock, open(log_path, "a", encoding="utf-8") as fh:
+                fh.write(line + "\n")
+        except OSError:
+            # A read-only deployment still gets the in-app panel
+            pass
+    return run
+
+
+def stage_table(run):
+    """A run's stages as a frame of STAGE_COLUMNS, in start order."""
+    return pd.DataFrame(run["stages"], columns=STAGE_COLUMNS)
+
+
+def recent_latency(page):
+    """(runs, p50, p95) seconds over this process's recent runs of ``page``."""
+    seconds = np.array([s for p, s in _recent if p == page])
+    if not len(seconds):
+        return 0, 0.0, 0.0
+    return len(seconds), float(np.percentile(seconds, 50)), float(np.percentile(seconds, 95))
+
+
+def latency_summary(log_path):
+    """Rerun latency per page from a timing log: SUMMARY_COLUMNS, slowest p95 first."""
+    try:
+        runs = pd.read_json(log_path, lines=True)
+    except (OSError, ValueError):
+        return pd.DataFrame(columns=SUMMARY_COLUMNS)
+    if runs.empty:
+        return pd.DataFrame(columns=SUMMARY_COLUMNS)
+    summary = runs.groupby("page")["seconds"].agg(
+        runs="size",
+        p50_seconds=lambda s: s.quantile(0.5),
+        p95_seconds=lambda s: s.quantile(0.95),
+    ).reset_index()
+    return summary.sort_values("p95_seconds", ascending=False, ignore_index=True)[SUMMARY_COLUMNS]
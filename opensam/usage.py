@@ -0,0 +1,50 @@
+"""Per-software usage aggregation.
+
+One grouped pass per metric over the installs->users frame, instead of
+per-group lambdas that re-index the full frame for every product.
+"""
+
+import pandas as pd
+
+USAGE_COLUMNS = ["software", "installs_count", "active_installs", "inactive_installs", "last_used_max"]
+
+
+def status_counts(frame, by, count_by_user=False):
+    """Active and terminated seat counts per ``by`` group, as int64 columns.
+
+    Device mode counts install rows by status; user mode counts distinct
+    users per status, so a multi-device user is one seat.
+    """
+    status = frame["status"]
+    if count_by_user:
+        seats = frame.loc[status.isin(["active", "terminated"]), [by, "status", "user_email"]]
+        counts = seats.groupby([by, "status"], observed=True)["user_email"].nunique().unstack("status")
+        counts = counts.reindex(columns=pd.Index(["active", "terminated"]))
+    else:
+        flags = pd.DataFrame({"active": status == "active", "terminated": status == "terminated"})
+        counts = flags.groupby(frame[by], observed=True).sum()
+    return counts.rename_axis(by)
+
+
+def aligned_counts(counts, index):
+    """Reindex per-group counts onto ``index``; absent groups count 0."""
+    return counts.reindex(index).fillna(0).astype("int64")
+
+
+def software_usage(installs_users, count_by_user=False):
+    """installs_count, active_installs, inactive_installs and last_used_max per software.
+
+    Device mode counts unique devices for installs_count and install rows by
+    status; user mode counts unique users throughout (multi-device users once).
+    """
+    key = "user_email" if count_by_user else "device_id"
+
+    usage = installs_users.groupby("software", observed=True).agg(
+        installs_count=(key, "nunique"),
+        last_used_max=("last_used_date", "max"),
+    )
+
+    counts = status_counts(installs_users, "software", count_by_user)
+    usage["active_installs"] = aligned_counts(counts["active"], usage.index)
+    usage["inactive_installs"] = aligned_counts(counts["terminated"], usage.index)
+    return usage.reset_index()[USAGE_COLUMNS]
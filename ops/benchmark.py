@@ -0,0 +1,272 @@
+"""Benchmark every dashboard computation at several data scales.
+
+Generates (or reuses) a synthetic dataset per scale with generate_mock_data.py,
+then times each stage the app runs and records its peak memory. Each scale
+runs in its own subprocess, so memory figures don't leak between scales and an
+out-of-memory failure at a large scale is recorded instead of aborting the run.
+
+    python ops/benchmark.py                                   # 1k, 100k, 1M, 10M installs
+    python ops/benchmark.py --scales 1000,100000 --output bench.json
+
+Per stage the JSON reports ``seconds`` (wall time), ``peak_mb`` (peak Python/NumPy
+heap growth during the stage, via tracemalloc) and ``max_rss_mb`` (process
+high-water mark after the stage, which also covers Arrow buffers).
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from generate_mock_data import gen, write_table  # noqa: E402
+from opensam.departments import department_stats  # noqa: E402
+from opensam.enrich import join_licenses, join_users  # noqa: E402
+from opensam.exports import export_bytes  # noqa: E402
+from opensam.history import HISTORY_DIRNAME, HistoryStore  # noqa: E402
+from opensam.ingest import LiveDataset  # noqa: E402
+from opensam.portfolio import (  # noqa: E402
+    filter_positions, license_position, low_usage_installs, risk_flags, terminated_installs,
+)
+from opensam.products import ProductIndex, installs_for_product, product_license  # noqa: E402
+from opensam.renewals import RenewalIndex, renewal_forecast, renewal_metrics  # noqa: E402
+from opensam.scenarios import (  # noqa: E402
+    lru_seats, optimize_reductions, portfolio_overage_risk, removal_candidates,
+)
+from opensam.schema import coerce_dates, combine_chunks  # noqa: E402
+from opensam.sqlite_store import SQLiteStore  # noqa: E402
+from opensam.storage import CACHE_DIRNAME, data_paths, load_dataset  # noqa: E402
+from opensam.usage import software_usage  # noqa: E402
+
+DEFAULT_SCALES = [1_000, 100_000, 1_000_000, 10_000_000]
+# Generated data and every stage are anchored to this date, so runs on different days are comparable
+BENCH_TODAY = date(2026, 1, 1)
+MB = 1024 * 1024
+
+
+def scale_params(n_installs):
+    """Generator arguments for a dataset of ``n_installs`` installs (~20 installs per user)."""
+    n_users = max(50, n_installs // 20)
+    return {
+        "n_users": n_users,
+        "n_products": max(5, min(5000, n_installs // 500)),
+        "n_installs": n_installs,
+        "n_departments": max(7, min(500, n_users // 250)),
+    }
+
+
+def ensure_dataset(workdir, n_installs, seed):
+    """Generate the CSV dataset for a scale once; later runs (and commits) reuse it."""
+    data_dir = os.path.join(workdir, f"installs_{n_installs}_seed{seed}_{BENCH_TODAY:%Y%m%d}")
+    if os.path.exists(os.path.join(data_dir, "installations.csv")):
+        return data_dir
+    os.makedirs(data_dir, exist_ok=True)
+    frames = gen(seed=seed, today=BENCH_TODAY, **scale_params(n_installs))
+    for name, df in zip(["users", "licenses", "installations", "vendors"], frames):
+        write_table(df, data_dir, name)
+    return data_dir
+
+
+def _max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_stage(stages, name, fn):
+    """Run ``fn()``, append its timing and memory record to ``stages`` and return its result.
+
+    ``peak_mb`` is only measured when tracemalloc is tracing (and is None
+    otherwise); tracing slows allocations down, so its seconds are not wall times.
+    """
+    gc.collect()
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    peak_mb = round((tracemalloc.get_traced_memory()[1] - base) / MB, 1) if tracing else None
+    stages.append({
+        "stage": name,
+        "seconds": round(seconds, 4),
+        "peak_mb": peak_mb,
+        "max_rss_mb": round(_max_rss_mb(), 1),
+    })
+    return result
+
+
+def bench_scale(data_dir, today):
+    """Time every stage on one dataset; returns the list of stage records."""
+    stages = []
+    paths = data_paths(data_dir)
+    shutil.rmtree(os.path.join(data_dir, CACHE_DIRNAME), ignore_errors=True)
+
+    run_stage(stages, "load_data_cold", lambda: load_dataset(data_dir))
+    data, _ = run_stage(stages, "load_data_warm", lambda: load_dataset(data_dir))
+
+    raw_installs = pd.concat([pd.read_csv(path) for path in paths["installs"]], ignore_index=True)
+    run_stage(stages, "coerce_dates", lambda: coerce_dates(raw_installs, ["install_date", "last_used_date"]))
+    del raw_installs
+
+    installs_users = run_stage(stages, "merge_installs_users", lambda: join_users(data["installs"], data["users"]))
+    installs_users_licenses = run_stage(
+        stages, "merge_installs_licenses", lambda: join_licenses(installs_users, data["licenses"])
+    )
+
+    usage = run_stage(stages, "usage_by_device", lambda: software_usage(installs_users, False))
+    run_stage(stages, "usage_by_user", lambda: software_usage(installs_users, True))
+    sam = run_stage(stages, "license_position", lambda: license_position(data["licenses"], usage, today))
+    # Quick View filters: flags once per ELP table, then one bitwise AND per filter combination
+    flags = run_stage(stages, "risk_flags", lambda: risk_flags(sam))
+    run_stage(stages, "quick_view_filter", lambda: filter_positions(sam, None, True, "Over-Used", 0, flags=flags))
+
+    run_stage(stages, "department_stats_by_device", lambda: department_stats(installs_users_licenses, False))
+    run_stage(stages, "department_stats_by_user", lambda: department_stats(installs_users_licenses, True))
+
+    renewals = run_stage(stages, "renewal_metrics", lambda: renewal_metrics(data["licenses"], data["vendors"], today))
+    # Renewal Radar: contracts indexed by days remaining per vendor, then one window's rows and KPIs
+    renewal_index = run_stage(stages, "renewal_index_build", lambda: RenewalIndex(renewals))
+    run_stage(stages, "renewal_window", lambda: (renewal_index.schedule(None, True, 90), renewal_index.totals(None, True, 90)))
+    run_stage(stages, "renewal_forecast", lambda: renewal_forecast(data["licenses"], today))
+
+    # Scenario Planning ranks the largest product's installs
+    top_product = usage.sort_values("installs_count", ascending=False)["software"].iloc[0]
+    product_installs = installs_for_product(installs_users, top_product)
+    run_stage(stages, "scenario_ranking_by_device", lambda: removal_candidates(product_installs, False))
+    run_stage(stages, "scenario_ranking_by_user", lambda: removal_candidates(product_installs, True))
+
+    # Portfolio optimizer: every product's LRU ranking once, then a savings-target plan
+    seats = run_stage(stages, "lru_seats_by_device", lambda: lru_seats(installs_users, False))
+    plan = run_stage(stages, "portfolio_optimizer", lambda: optimize_reductions(sam, seats, 1_000_000, None))["plan"]
+    run_stage(stages, "portfolio_overage_risk", lambda: portfolio_overage_risk(plan, installs_users, False, today))
+
+    # Product Drilldown: one-off per-product index, then the largest product's metrics and tables
+    product_index = run_stage(stages, "product_index_build", lambda: ProductIndex(combine_chunks(installs_users)))
+    license_info = product_license(data["licenses"], top_product)
+    run_stage(stages, "product_position_indexed",
+              lambda: product_index.product_position(license_info, top_product, False, today))
+
+    # Indexed SQLite store: one-off build, then the slices Product Drilldown and Renewal Radar read
+    store = run_stage(stages, "sqlite_store_build", lambda: SQLiteStore(data_dir))
+    run_stage(stages, "sqlite_product_installs", lambda: store.product_installs(top_product))
+    run_stage(stages, "sqlite_renewal_window", lambda: store.renewal_metrics(today, 90))
+
+    # The overview page's three downloads, as CSV and as gzip-compressed CSV
+    exports = [sam, terminated_installs(installs_users), low_usage_installs(installs_users, today)]
+    run_stage(stages, "csv_export", lambda: [export_bytes(df, "csv") for df in exports])
+    run_stage(stages, "csv_gzip_export", lambda: [export_bytes(df, "csv.gz") for df in exports])
+    del exports
+
+    # Hourly discovery delta: 1% of installs re-reported as just used
+    live = LiveDataset(data["installs"], data["users"], data["licenses"])
+    run_stage(stages, "delta_index_build", live.enable_incremental)
+    delta = data["installs"].sample(frac=0.01, random_state=0).assign(last_used_date=pd.Timestamp(today))
+    run_stage(stages, "delta_apply_1pct", lambda: live.apply_delta(delta))
+
+    # Snapshot history: the first load writes everything, the next only the delta's changed installs
+    history_dir = os.path.join(data_dir, HISTORY_DIRNAME)
+    shutil.rmtree(history_dir, ignore_errors=True)
+    history = HistoryStore(history_dir)
+    run_stage(stages, "history_first_snapshot", lambda: history.record(installs_users, today))
+    run_stage(stages, "history_delta_snapshot", lambda: history.record(live.installs_users, today))
+    run_stage(stages, "history_product_trend",
+              lambda: history.usage_trend(top_product, start=today - pd.Timedelta(weeks=52)))
+
+    return stages, {name: len(df) for name, df in data.items()}
+
+
+def run_single(n_installs, workdir, seed):
+    """Benchmark one scale in this process and return its result record.
+
+    Every stage runs twice: a timed pass with tracemalloc off, then a traced
+    pass for peak memory. max_rss_mb comes from the timed pass, before
+    tracing's own bookkeeping adds to the process.
+    """
+    data_dir = ensure_dataset(workdir, n_installs, seed)
+    today = BENCH_TODAY
+    stages, rows = bench_scale(data_dir, today)
+    tracemalloc.start()
+    try:
+        traced, _ = bench_scale(data_dir, today)
+    finally:
+        tracemalloc.stop()
+    for record, traced_record in zip(stages, traced):
+        record["peak_mb"] = traced_record["peak_mb"]
+    return {
+        "installs": n_installs,
+        "rows": rows,
+        "total_seconds": round(sum(s["seconds"] for s in stages), 4),
+        "stages": stages,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark OpenSAM computations at several data scales.")
+    parser.add_argument("--scales", default=",".join(str(s) for s in DEFAULT_SCALES),
+                        help="comma-separated install counts (default: 1000,100000,1000000,10000000)")
+    parser.add_argument("--workdir", default=os.path.join(ROOT, "bench_data"),
+                        help="where generated datasets are kept between runs (default: bench_data/)")
+    parser.add_argument("--seed", type=int, default=42, help="generator seed (default: 42)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--in-process", action="store_true",
+                        help="run all scales in this process (used for the per-scale subprocesses)")
+    args = parser.parse_args(argv)
+    scales = [int(s) for s in args.scales.split(",") if s.strip()]
+
+    if args.in_process:
+        results = [run_single(n, args.workdir, args.seed) for n in scales]
+    else:
+        results = []
+        for n in scales:
+            print(f"benchmarking {n:,} installs...", file=sys.stderr)
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--in-process", "--scales", str(n),
+                 "--workdir", args.workdir, "--seed", str(args.seed)],
+                capture_output=True, text=True,
+            )
+            if proc.returncode == 0:
+                results.extend(json.loads(proc.stdout)["results"])
+            else:
+                # e.g. killed by the OOM killer at the largest scale
+                error = proc.stderr.strip().splitlines()[-1:] or [f"exit code {proc.returncode}"]
+                results.append({"installs": n, "error": error[0]})
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "today": BENCH_TODAY.isoformat(),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,239 @@
+"""Generate synthetic OpenSAM datasets, from demo size up to load-test scale.
 
+All sampling is vectorized NumPy, so 100k users / 5M installs take seconds.
+Runs are reproducible for a given --seed and --today.
+
+    python ops/generate_mock_data.py                                  # demo-sized data/*.csv
+    python ops/generate_mock_data.py --users 100000 --products 2000 \\
+        --installs 5000000 --departments 400 --out bench_data --format parquet --shard-rows 1000000
+"""
+
+import argparse
+import os
+from datetime import date
+
+import numpy as np
 import pandas as pd
-from faker import Faker
-import random, argparse
-from datetime import datetime, timedelta, date
-
-def gen(n_users=50, seed=42):
-    fake = Faker()
-    random.seed(seed)
-    Faker.seed(seed)
-
-    users = []
-    for i in range(n_users):
-        email = f"{fake.first_name().lower()}@acme.com"
-        dept = random.choice(["Engineering","Sales","Marketing","Finance","Support","Design","Data"])
-        status = random.choices(["active","terminated"], weights=[0.85,0.15])[0]
-        users.append([email, dept, "US", status])
-    users_df = pd.DataFrame(users, columns=["user_email","department","country","status"])
-
-    products = [
-        ("Microsoft 365 E3","Microsoft","subscription",36,100, "2025-01-01", "2025-12-31"),
-        ("Visio Plan 2","Microsoft","subscription",15,25,"2025-03-01","2026-02-28"),
-        ("SAP S/4HANA","SAP","perpetual",2500,10,"2024-07-01","2029-06-30"),
-        ("Tableau Creator","Salesforce","subscription",70,12,"2025-05-01","2026-04-30"),
-        ("Zoom Pro","Zoom","subscription",12,50,"2025-01-15","2026-01-14"),
-    ]
-    lic_df = pd.DataFrame(products, columns=["software","vendor","license_type","unit_cost_usd","seats_purchased","contract_start","contract_end"])
-    lic_df["license_key"] = [f"KEY-{i:04d}" for i in range(len(lic_df))]
-
-    installs = []
-    for _, row in lic_df.iterrows():
-        sw = row["software"]
-        for _ in range(random.randint(int(row["seats_purchased"]*0.3), int(row["seats_purchased"]*0.9))):
-            u = users_df.sample(1).iloc[0]
-            last_used = date.today() - timedelta(days=random.randint(0,200))
-            installs.append([f"LAP-{random.randint(1000,9999)}", u["user_email"], sw, "1.0", date.today(), last_used])
-    inst_df = pd.DataFrame(installs, columns=["device_id","user_email","software","version","install_date","last_used_date"])
-
-    return users_df, lic_df, inst_df
+
+# Real-world anchors for the first products; the rest are synthesized
+CATALOG = [
+    ("Microsoft 365 E3", "Microsoft", "subscription", 36),
+    ("Visio Plan 2", "Microsoft", "subscription", 15),
+    ("SAP S/4HANA", "SAP", "perpetual", 2500),
+    ("Tableau Creator", "Salesforce", "subscription", 70),
+    ("Zoom Pro", "Zoom", "subscription", 12),
+    ("Slack Enterprise", "Slack", "subscription", 15),
+    ("Adobe Acrobat Pro", "Adobe", "perpetual", 450),
+    ("Jira Software", "Atlassian", "subscription", 8),
+    ("GitHub Enterprise", "GitHub", "subscription", 21),
+    ("AutoCAD", "Autodesk", "subscription", 220),
+]
+DEPARTMENTS = ["Engineering", "Sales", "Marketing", "Finance", "Support", "Design", "Data",
+               "HR", "Legal", "Operations", "Product", "IT"]
+COUNTRIES = ["US", "US", "US", "CA", "GB", "DE", "IN"]
+VERSIONS = ["1.0", "2.0", "16.0", "2024", "2025"]
+
+
+def _labels(prefix, n, width=4):
+    """["<prefix> 0001", ...] as an object array."""
+    return (prefix + pd.Series(np.arange(1, n + 1)).astype(str).str.zfill(width)).to_numpy(dtype=object)
+
+
+def _named(base, n, prefix):
+    """The first ``n`` of ``base``, padded with synthesized ``prefix NNNN`` names."""
+    if n <= len(base):
+        return np.array(base[:n], dtype=object)
+    return np.concatenate([np.array(base, dtype=object), _labels(prefix + " ", n - len(base))])
+
+
+def gen_users(rng, n_users, n_departments, terminated_ratio):
+    """Users with skewed department sizes and a terminated_ratio share of leavers."""
+    departments = _named(DEPARTMENTS, n_departments, "Dept")
+    dept_weights = rng.dirichlet(np.full(n_departments, 2.0))
+    emails = ("user" + pd.Series(np.arange(n_users)).astype(str).str.zfill(6) + "@acme.com").to_numpy(dtype=object)
+    return pd.DataFrame({
+        "user_email": emails,
+        "department": departments[rng.choice(n_departments, n_users, p=dept_weights)],
+        "country": np.array(COUNTRIES, dtype=object)[rng.integers(0, len(COUNTRIES), n_users)],
+        "status": np.where(rng.random(n_users) < terminated_ratio, "terminated", "active").astype(object),
+    })
+
+
+def gen_products(rng, n_products, popularity_alpha):
+    """Product catalog plus its power-law popularity weights (rank 1 = most installed)."""
+    n_anchor = min(n_products, len(CATALOG))
+    n_extra = n_products - n_anchor
+    vendors_extra = _labels("Vendor ", max(1, n_products // 8), width=3)
+
+    software = np.concatenate([[c[0] for c in CATALOG[:n_anchor]], _labels("Product ", n_extra)]).astype(object)
+    vendor = np.concatenate([[c[1] for c in CATALOG[:n_anchor]],
+                             vendors_extra[rng.integers(0, len(vendors_extra), n_extra)]]).astype(object)
+    license_type = np.concatenate([[c[2] for c in CATALOG[:n_anchor]],
+                                   np.where(rng.random(n_extra) < 0.8, "subscription", "perpetual")]).astype(object)
+    unit_cost = np.concatenate([[c[3] for c in CATALOG[:n_anchor]],
+                                np.round(rng.lognormal(3.5, 1.0, n_extra), 2)])
+
+    popularity = 1.0 / np.arange(1, n_products + 1) ** popularity_alpha
+    return pd.DataFrame({
+        "software": software,
+        "vendor": vendor,
+        "license_type": license_type,
+        "unit_cost_usd": unit_cost,
+    }), popularity / popularity.sum()
+
+
+def gen_installs(rng, users_df, products_df, popularity, n_installs, devices_per_user, today):
+    """Installs keyed by unique (device_id, software), with recency-skewed last_used_date."""
+    n_users = len(users_df)
+    # Multi-device users: 1 + Poisson(devices_per_user - 1) devices each
+    device_counts = 1 + rng.poisson(max(devices_per_user - 1.0, 0.0), n_users)
+    device_user = np.repeat(np.arange(n_users), device_counts)
+    device_ids = _labels("DEV-", len(device_user), width=7)
+
+    n_products = len(products_df)
+    target = min(n_installs, len(device_user) * n_products)
+    # Oversample and drop duplicate (device, product) pairs, topping up while popular
+    # products saturate; gives up after a few rounds if the skew makes target unreachable
+    pairs = pd.DataFrame({"d": np.empty(0, dtype=np.int64), "p": np.empty(0, dtype=np.int64)})
+    for _ in range(8):
+        missing = target - len(pairs)
+        if missing <= 0:
+            break
+        sample = int(missing * 1.3) + 16
+        drawn = pd.DataFrame({
+            "d": rng.integers(0, len(device_user), sample),
+            "p": rng.choice(n_products, sample, p=popularity),
+        })
+        pairs = pd.concat([pairs, drawn], ignore_index=True).drop_duplicates()
+    pairs = pairs.head(target)
+    device_idx = pairs["d"].to_numpy()
+    product_idx = pairs["p"].to_numpy()
+    n = len(pairs)
+
+    user_idx = device_user[device_idx]
+    terminated = (users_df["status"].to_numpy() == "terminated")[user_idx]
+
+    # Most installs are used recently; a long tail (and most leavers' installs) goes stale
+    stale = rng.random(n) < np.where(terminated, 0.8, 0.2)
+    idle_days = np.where(stale, rng.integers(60, 400, n), rng.exponential(12, n).astype(int))
+    today = np.datetime64(today, "D")
+    last_used = today - idle_days.astype("timedelta64[D]")
+    install_date = last_used - rng.exponential(240, n).astype(int).astype("timedelta64[D]")
+    never_used = rng.random(n) < 0.01
+
+    return pd.DataFrame({
+        "device_id": device_ids[device_idx],
+        "user_email": users_df["user_email"].to_numpy()[user_idx],
+        "software": products_df["software"].to_numpy()[product_idx],
+        "version": np.array(VERSIONS, dtype=object)[rng.integers(0, len(VERSIONS), n)],
+        "install_date": pd.to_datetime(install_date).strftime("%Y-%m-%d"),
+        "last_used_date": pd.Series(pd.to_datetime(last_used).strftime("%Y-%m-%d")).where(~never_used),
+    })
+
+
+def gen_licenses(rng, products_df, installs_df, today):
+    """Licenses sized around observed installs (some over-bought, some over-deployed)."""
+    n = len(products_df)
+    deployed = installs_df["software"].value_counts().reindex(products_df["software"]).fillna(0).to_numpy()
+    seats = np.maximum(1, np.round(deployed * rng.uniform(0.8, 1.4, n))).astype(int)
+
+    start = np.datetime64(today, "D") - rng.integers(0, 365, n).astype("timedelta64[D]")
+    end = start + (365 * rng.choice([1, 1, 1, 3], n) - 1).astype("timedelta64[D]")
+    contract_end = pd.Series(pd.to_datetime(end).strftime("%Y-%m-%d")).where(rng.random(n) >= 0.02)
+
+    licenses = products_df.copy()
+    licenses["seats_purchased"] = seats
+    licenses["contract_start"] = pd.to_datetime(start).strftime("%Y-%m-%d")
+    licenses["contract_end"] = contract_end.to_numpy()
+    licenses["license_key"] = _labels("KEY-", n, width=6)
+    return licenses
+
+
+def gen_vendors(rng, licenses_df):
+    """One row per vendor; about 10% have no renewal_notice_days (app defaults to 30)."""
+    vendors = pd.Series(licenses_df["vendor"].unique())
+    n = len(vendors)
+    slug = vendors.str.lower().str.replace(r"[^a-z0-9]+", "", regex=True)
+    notice = pd.Series(rng.choice([30, 45, 60, 90], n)).where(rng.random(n) >= 0.1)
+    return pd.DataFrame({
+        "vendor": vendors,
+        "account_manager": _labels("Account Manager ", n, width=3),
+        "email": "renewals@" + slug + ".example.com",
+        "renewal_notice_days": notice.astype("Int64"),
+    })
+
+
+def gen(n_users=50, n_products=5, n_installs=None, n_departments=7, terminated_ratio=0.15,
+        devices_per_user=1.3, popularity_alpha=1.1, seed=42, today=None):
+    """Generate (users, licenses, installs, vendors) frames.
+
+    ``n_installs`` defaults to about 60% of the licensed seats a demo-sized
+    portfolio would hold (users x products x 0.6).
+    """
+    rng = np.random.default_rng(seed)
+    today = today or date.today()
+    if n_installs is None:
+        n_installs = int(n_users * n_products * 0.6)
+
+    users_df = gen_users(rng, n_users, n_departments, terminated_ratio)
+    products_df, popularity = gen_products(rng, n_products, popularity_alpha)
+    inst_df = gen_installs(rng, users_df, products_df, popularity, n_installs, devices_per_user, today)
+    lic_df = gen_licenses(rng, products_df, inst_df, today)
+    vendors_df = gen_vendors(rng, lic_df)
+    return users_df, lic_df, inst_df, vendors_df
+
+
+def write_table(df, out_dir, name, fmt="csv", shard_rows=0):
+    """Write ``df`` as <name>.<fmt>, or <name>-00000.<fmt>, ... when larger than ``shard_rows``."""
+    ext = "parquet" if fmt == "parquet" else "csv"
+    if shard_rows and len(df) > shard_rows:
+        starts = range(0, len(df), shard_rows)
+        paths = [os.path.join(out_dir, f"{name}-{i:05d}.{ext}") for i in range(len(starts))]
+        chunks = [df.iloc[start:start + shard_rows] for start in starts]
+    else:
+        paths, chunks = [os.path.join(out_dir, f"{name}.{ext}")], [df]
+    for path, chunk in zip(paths, chunks):
+        if fmt == "parquet":
+            chunk.to_parquet(path, index=False)
+        else:
+            chunk.to_csv(path, index=False)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic OpenSAM data.")
+    parser.add_argument("--users", type=int, default=50, help="number of users (default: 50)")
+    parser.add_argument("--products", type=int, default=5, help="number of licensed products (default: 5)")
+    parser.add_argument("--installs", type=int, default=None,
+                        help="number of installs (default: users x products x 0.6)")
+    parser.add_argument("--departments", type=int, default=7, help="number of departments (default: 7)")
+    parser.add_argument("--terminated-ratio", type=float, default=0.15,
+                        help="share of users with status=terminated (default: 0.15)")
+    parser.add_argument("--devices-per-user", type=float, default=1.3,
+                        help="mean devices per user, >= 1 (default: 1.3)")
+    parser.add_argument("--popularity-alpha", type=float, default=1.1,
+                        help="power-law exponent of product popularity; 0 = uniform (default: 1.1)")
+    parser.add_argument("--seed", type=int, default=42, help="random seed (default: 42)")
+    parser.add_argument("--today", type=date.fromisoformat, default=None,
+                        help="YYYY-MM-DD that install, usage and contract dates are anchored to (default: today)")
+    parser.add_argument("--out", default="data", help="output directory (default: data)")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="output format (default: csv)")
+    parser.add_argument("--shard-rows", type=int, default=0,
+                        help="split tables larger than this into numbered shards (default: no sharding)")
+    args = parser.parse_args(argv)
+
+    users_df, lic_df, inst_df, vendors_df = gen(
+        n_users=args.users, n_products=args.products, n_installs=args.installs,
+        n_departments=args.departments, terminated_ratio=args.terminated_ratio,
+        devices_per_user=args.devices_per_user, popularity_alpha=args.popularity_alpha, seed=args.seed,
+        today=args.today,
+    )
+
+    os.makedirs(args.out, exist_ok=True)
+    for name, df in [("users", users_df), ("licenses", lic_df), ("installations", inst_df), ("vendors", vendors_df)]:
+        paths = write_table(df, args.out, name, args.format, args.shard_rows)
+        print(f"{name}: {len(df):,} rows -> {', '.join(paths) if len(paths) <= 3 else f'{len(paths)} shards in {args.out}'}")
+
 
 if __name__ == "__main__":
-    users_df, lic_df, inst_df = gen()
-    users_df.to_csv("data/users.csv", index=False)
-    lic_df.to_csv("data/licenses.csv", index=False)
-    inst_df.to_csv("data/installations.csv", index=False)
-    print("Mock data written to data/*.csv")
+    main()
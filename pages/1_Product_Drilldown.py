@@ -3,7 +3,14 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 
+from opensam.app_data import (
+    finish_page, get_data, get_product_position, get_usage_trend, lazy_download, paged_dataframe, start_page,
+)
+from opensam.exports import EXPORT_FORMATS
+from opensam.products import product_license
+
 st.set_page_config(page_title="Product Drilldown - OpenSAM", layout="wide")
+start_page("product_drilldown")
 
 st.title("Product Drilldown")
 st.markdown("Deep dive into license utilization, active installs, and reclaim opportunities for a specific product.")
@@ -45,17 +52,20 @@ def fmt_date(value):
         return value
     return pd.to_datetime(value, errors="coerce").strftime("%Y-%m-%d")
 
+# Date columns are datetime64; render them as plain dates in tables
+DATE_COLUMN_CONFIG = {"last_used_date": st.column_config.DateColumn("last_used_date", format="YYYY-MM-DD")}
+
 # ============================================================================
 # Load Data from Session State
 # ============================================================================
 
 # Check if data exists in session_state
-if "data" not in st.session_state or "data_loaded" not in st.session_state:
+if "data_loaded" not in st.session_state:
     st.warning("⚠️ Data not loaded. Please visit the home page first to load data.")
     st.stop()
 
-# Get data from session state
-data = st.session_state["data"]
+# Shared base tables for the session's dataset version
+data = get_data()
 licenses = data["licenses"]
 installs = data["installs"]
 users = data["users"]
@@ -68,17 +78,6 @@ if licenses.empty or installs.empty or users.empty:
 # Get seat counting mode from session state (set in main app)
 count_by_user = st.session_state.get("count_by_user", False)
 
-# ============================================================================
-# Data Processing
-# ============================================================================
-
-# Join installs → users to get user status and department
-installs_users = installs.merge(users, on="user_email", how="left")
-
-# Fill missing status with "unknown"
-if "status" in installs_users.columns:
-    installs_users["status"] = installs_users["status"].fillna("unknown")
-
 # ============================================================================
 # Product Selection
 # ============================================================================
@@ -105,57 +104,29 @@ selected_product = st.selectbox(
 # Filter Data for Selected Product
 # ============================================================================
 
-# Filter licenses for selected product
-license_row = licenses[licenses["software"] == selected_product]
+# License for selected product (first row in case of duplicates)
+license_info = product_license(licenses, selected_product)
 
-if license_row.empty:
+if license_info is None:
     st.warning(f"⚠️ No license information found for {selected_product}")
     st.stop()
 
-# Get first row (in case of duplicates)
-license_info = license_row.iloc[0]
-
-# Filter installations for selected product
-product_installs = installs_users[installs_users["software"] == selected_product].copy()
-
 # ============================================================================
 # Calculate Metrics
 # ============================================================================
 
 today = datetime.utcnow().date()
 
-# Seats Purchased
-seats_purchased = int(license_info.get("seats_purchased", 0))
-
-# License type
-license_type = license_info.get("license_type", "unknown")
-is_subscription = "subscription" in str(license_type).lower()
-
-# Active Installs (used seats) - respects count_by_user toggle
-if count_by_user:
-    # Count unique users with status="active"
-    active_installs_df = product_installs[product_installs.get("status") == "active"]
-    active_installs_count = active_installs_df["user_email"].nunique() if "user_email" in active_installs_df.columns else 0
-else:
-    # Count unique devices with status="active"
-    active_installs_df = product_installs[product_installs.get("status") == "active"]
-    active_installs_count = active_installs_df["device_id"].nunique() if "device_id" in active_installs_df.columns else 0
-
-# Unused Seats
-unused_seats = max(0, seats_purchased - active_installs_count)
-
-# Overage
-overage = max(0, active_installs_count - seats_purchased)
-
-# Potential Savings (SUBSCRIPTION ONLY)
-unit_cost = license_info.get("unit_cost_usd", 0)
-if pd.isna(unit_cost):
-    unit_cost = 0
-
-if is_subscription:
-    potential_savings = unused_seats * unit_cost
-else:
-    potential_savings = 0
+# Seat metrics (respecting count_by_user), savings (subscription only) and the three install tables,
+# read from the per-product index of installs→users (or an indexed query with OPENSAM_STORE=sqlite)
+position = get_product_position(license_info, selected_product, count_by_user, today)
+seats_purchased = position["seats_purchased"]
+license_type = position["license_type"]
+is_subscription = position["is_subscription"]
+active_installs_count = position["active_count"]
+unused_seats = position["unused_seats"]
+overage = position["overage"]
+potential_savings = position["potential_savings"]
 
 # ============================================================================
 # Display Metrics
@@ -200,57 +171,12 @@ with st.expander("📋 License Details"):
 # Prepare Tables
 # ============================================================================
 
-threshold_60_days = today - timedelta(days=60)
-
-# Define display columns
-base_display_cols = ["user_email", "device_id", "last_used_date"]
-if "department" in product_installs.columns:
-    base_display_cols.append("department")
-
-# Table 1: Active Installs
-active_installs_table = active_installs_df[base_display_cols].copy() if not active_installs_df.empty else pd.DataFrame(columns=base_display_cols)
-
-# Table 2: Terminated Users (Reclaim Now)
-terminated_users_df = product_installs[product_installs.get("status") == "terminated"].copy()
-terminated_users_table = terminated_users_df[base_display_cols].copy() if not terminated_users_df.empty else pd.DataFrame(columns=base_display_cols)
-
-# Calculate immediate savings (subscription only)
-if is_subscription:
-    if count_by_user:
-        terminated_count = terminated_users_df["user_email"].nunique() if not terminated_users_df.empty else 0
-    else:
-        terminated_count = len(terminated_users_df)
-    immediate_savings = terminated_count * unit_cost
-else:
-    immediate_savings = 0
-    terminated_count = 0
-
-# Table 3: Low-Usage (No activity 60+ days) - ACTIVE USERS ONLY
-if "last_used_date" in product_installs.columns:
-    product_installs["last_used_datetime"] = pd.to_datetime(product_installs["last_used_date"], errors="coerce")
-
-    low_usage_df = product_installs[
-        (
-            (product_installs["last_used_datetime"].isna()) |
-            (product_installs["last_used_datetime"] < pd.to_datetime(threshold_60_days))
-        ) &
-        (product_installs.get("status") == "active")  # Only active users
-    ].copy()
-
-    low_usage_table = low_usage_df[base_display_cols].copy() if not low_usage_df.empty else pd.DataFrame(columns=base_display_cols)
-
-    # Calculate low-usage savings (subscription only)
-    if is_subscription:
-        if count_by_user:
-            low_usage_count = low_usage_df["user_email"].nunique() if not low_usage_df.empty else 0
-        else:
-            low_usage_count = len(low_usage_df)
-        low_usage_savings = low_usage_count * unit_cost
-    else:
-        low_usage_savings = 0
-else:
-    low_usage_table = pd.DataFrame(columns=base_display_cols)
-    low_usage_savings = 0
+active_installs_table = position["active_table"]
+terminated_users_table = position["terminated_table"]
+low_usage_table = position["low_usage_table"]
+terminated_count = position["terminated_count"]
+immediate_savings = position["immediate_savings"]
+low_usage_savings = position["low_usage_savings"]
 
 # ============================================================================
 # Display Tables
@@ -258,20 +184,25 @@ else:
 
 st.markdown("---")
 
+# Download format for the three tables below; files are generated (in chunks) on click and cached
+export_format = st.selectbox(
+    "Export format",
+    list(EXPORT_FORMATS),
+    format_func=lambda fmt: EXPORT_FORMATS[fmt][0],
+    key="product_export_format",
+    help="🗜️ gzip/zip downloads of large lists are several times smaller; Parquet loads straight into pandas, Power BI or Spark"
+)
+export_label = EXPORT_FORMATS[export_format][0]
+
 # Table 1: Active Installs
 st.subheader("✅ Active Installs", help="👥 Users currently using this software (status = active)")
 st.markdown(f"*{len(active_installs_table)} active installations*")
-st.dataframe(active_installs_table, use_container_width=True)
-
-# CSV Download for Active Installs
-def to_csv(df):
-    return df.to_csv(index=False).encode("utf-8")
+# Sorted, filtered and paged on the server: only the visible page is sent to the browser
+paged_dataframe("product_active", active_installs_table, column_config=DATE_COLUMN_CONFIG, product=selected_product)
 
 st.download_button(
-    label="📥 Download Active Installs CSV",
-    data=to_csv(active_installs_table),
-    file_name=f"{selected_product}_active_installs.csv",
-    mime="text/csv",
+    label=f"📥 Download Active Installs {export_label}",
+    **lazy_download(f"{selected_product}_active_installs", active_installs_table, export_format),
     key="download_active",
     help="Export list of active users for this product"
 )
@@ -287,13 +218,11 @@ if not terminated_users_table.empty and immediate_savings > 0:
 elif not terminated_users_table.empty and not is_subscription:
     st.info(f"ℹ️ {terminated_count} installations from terminated users. Perpetual license (savings = $0, but may reduce maintenance costs).")
 
-st.dataframe(terminated_users_table, use_container_width=True)
+paged_dataframe("product_terminated", terminated_users_table, column_config=DATE_COLUMN_CONFIG, product=selected_product)
 
 st.download_button(
-    label="📥 Download Terminated Users CSV",
-    data=to_csv(terminated_users_table),
-    file_name=f"{selected_product}_terminated_users.csv",
-    mime="text/csv",
+    label=f"📥 Download Terminated Users {export_label}",
+    **lazy_download(f"{selected_product}_terminated_users", terminated_users_table, export_format),
     key="download_terminated",
     help="Export list of terminated users to share with IT for license removal"
 )
@@ -309,17 +238,31 @@ if not low_usage_table.empty and low_usage_savings > 0:
 elif not low_usage_table.empty and not is_subscription:
     st.info(f"ℹ️ {len(low_usage_table)} low-usage installations. Perpetual license (savings = $0, but may reduce support needs).")
 
-st.dataframe(low_usage_table, use_container_width=True)
+paged_dataframe("product_low_usage", low_usage_table, column_config=DATE_COLUMN_CONFIG,
+                product=selected_product, today=today)
 
 st.download_button(
-    label="📥 Download Low-Usage CSV",
-    data=to_csv(low_usage_table),
-    file_name=f"{selected_product}_low_usage.csv",
-    mime="text/csv",
+    label=f"📥 Download Low-Usage {export_label}",
+    **lazy_download(f"{selected_product}_low_usage", low_usage_table, export_format, today=today),
     key="download_low_usage",
     help="Export low-usage users to follow up and verify if they still need licenses"
 )
 
+# ============================================================================
+# Usage History
+# ============================================================================
+
+st.markdown("---")
+st.subheader("📈 Usage History (52 weeks)", help="📊 Weekly users and devices seen using this product, from the snapshots recorded at each data load")
+
+# Read from the snapshot history: only this product's rows from snapshots inside the window
+trend = get_usage_trend(software=selected_product, start=today - timedelta(weeks=52))
+if trend.empty:
+    st.info("No usage recorded in the snapshot history for this product yet.")
+else:
+    st.line_chart(trend.set_index("period")[["active_users", "active_devices"]])
+    st.caption("💡 Each data load records only changed installs. Weeks before the first snapshot only show each install's most recent use.")
+
 # ============================================================================
 # Summary
 # ============================================================================
@@ -332,3 +275,5 @@ with col1:
 with col2:
     if st.button("🚀 Get Custom Reports", use_container_width=True, key="upgrade_drilldown"):
         st.info("**Need advanced product analytics?**\n\n✅ Usage trend analysis\n✅ Predictive recommendations\n✅ Automated reclaim workflows\n\n📧 Contact: paulsemaan007@gmail.com")
+
+finish_page()
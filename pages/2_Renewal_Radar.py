@@ -1,9 +1,17 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
+import plotly.express as px
 from datetime import datetime, timedelta
 
+from opensam.app_data import (
+    finish_page, get_data, get_renewal_forecast, get_renewal_schedule, get_renewal_totals, lazy_csv, start_page,
+)
+from opensam.timing import stage
+from opensam.renewals import FORECAST_MONTHS, alert_icons, servicenow_export
+
 st.set_page_config(page_title="Renewal Radar - OpenSAM", layout="wide")
+start_page("renewal_radar")
 
 st.title("Renewal Radar")
 st.markdown("Track contract expirations, renewal windows, and proactively manage license renewals.")
@@ -50,80 +58,20 @@ def fmt_date(value):
 # ============================================================================
 
 # Check if data exists in session_state
-if "data" not in st.session_state or "data_loaded" not in st.session_state:
+if "data_loaded" not in st.session_state:
     st.warning("⚠️ Data not loaded. Please visit the home page first to load data.")
     st.stop()
 
-# Get data from session state
-data = st.session_state["data"]
+# Shared base tables for the session's dataset version
+data = get_data()
 licenses = data["licenses"]
-vendors = data["vendors"]
 
 # Check if data is empty
 if licenses.empty:
     st.error("❌ Licenses data is missing or empty. Please check data/ folder.")
     st.stop()
 
-# ============================================================================
-# Join Licenses with Vendors
-# ============================================================================
-
-# Join on vendor to get renewal_notice_days
-if not vendors.empty and "vendor" in vendors.columns and "vendor" in licenses.columns:
-    licenses_with_vendors = licenses.merge(vendors, on="vendor", how="left")
-else:
-    licenses_with_vendors = licenses.copy()
-    if "renewal_notice_days" not in licenses_with_vendors.columns:
-        licenses_with_vendors["renewal_notice_days"] = np.nan
-
-# Default renewal_notice_days to 30 if missing
-licenses_with_vendors["renewal_notice_days"] = licenses_with_vendors["renewal_notice_days"].fillna(30).astype(int)
-
-# ============================================================================
-# Calculate Renewal Metrics
-# ============================================================================
-
-today = datetime.utcnow().date()
-
-# Days remaining (guard against NaT)
-if "contract_end" in licenses_with_vendors.columns:
-    licenses_with_vendors["days_remaining"] = licenses_with_vendors["contract_end"].apply(
-        lambda x: (x - today).days if pd.notna(x) else 999999
-    )
-else:
-    licenses_with_vendors["days_remaining"] = 999999
-
-# Clamp negative days to 0 for display purposes
-licenses_with_vendors["days_remaining_display"] = licenses_with_vendors["days_remaining"].apply(lambda x: max(0, x))
-
-# Expiring within 30 days
-licenses_with_vendors["expiring_30d"] = licenses_with_vendors["days_remaining"] <= 30
-
-# Notice start date and in_notice_window
-if "contract_end" in licenses_with_vendors.columns:
-    licenses_with_vendors["notice_start"] = licenses_with_vendors.apply(
-        lambda row: row["contract_end"] - timedelta(days=row["renewal_notice_days"]) if pd.notna(row["contract_end"]) else None,
-        axis=1
-    )
-    licenses_with_vendors["in_notice_window"] = licenses_with_vendors.apply(
-        lambda row: (today >= row["notice_start"]) and (row["days_remaining"] > 0) if pd.notna(row["notice_start"]) else False,
-        axis=1
-    )
-else:
-    licenses_with_vendors["notice_start"] = None
-    licenses_with_vendors["in_notice_window"] = False
-
-# Annual spend proxy
-if "seats_purchased" in licenses_with_vendors.columns and "unit_cost_usd" in licenses_with_vendors.columns:
-    licenses_with_vendors["annual_spend_proxy"] = licenses_with_vendors["seats_purchased"] * licenses_with_vendors["unit_cost_usd"]
-else:
-    licenses_with_vendors["annual_spend_proxy"] = 0
-
-# Check if subscription
-if "license_type" in licenses_with_vendors.columns:
-    licenses_with_vendors["is_subscription"] = licenses_with_vendors["license_type"].str.contains("subscription", case=False, na=False)
-else:
-    licenses_with_vendors["is_subscription"] = False
+today = pd.Timestamp(datetime.utcnow().date())
 
 # ============================================================================
 # Filters
@@ -136,7 +84,7 @@ col1, col2, col3 = st.columns(3)
 with col1:
     vendor_filter = st.multiselect(
         "Vendor",
-        sorted(licenses_with_vendors["vendor"].dropna().unique().tolist()) if "vendor" in licenses_with_vendors.columns else [],
+        sorted(licenses["vendor"].dropna().unique().tolist()) if "vendor" in licenses.columns else [],
         help="🔍 Filter by software vendor"
     )
 
@@ -155,16 +103,17 @@ with col3:
 
 st.caption("💡 **Notice Window**: Period before contract end when renewal action is typically required (vendor-specific).")
 
-# Apply filters
-filtered = licenses_with_vendors.copy()
-
-if vendor_filter:
-    filtered = filtered[filtered["vendor"].isin(vendor_filter)]
-
-if only_subs:
-    filtered = filtered[filtered["is_subscription"] == True]
+# ============================================================================
+# Calculate Renewal Metrics
+# ============================================================================
 
-filtered = filtered[filtered["days_remaining"] <= max_days]
+# Join vendors for renewal_notice_days (default 30), then compute days_remaining (999999 when
+# contract_end is missing), notice_start, in_notice_window and spend as whole-column operations.
+# Filters applied (vendor, subscriptions only, max days remaining); soonest renewal first.
+# Contracts are indexed by days remaining per vendor, so a window is a binary search plus a slice
+# and the KPIs come from prefix sums. With OPENSAM_STORE=sqlite only the window's contracts are read.
+filtered = get_renewal_schedule(today, vendor_filter, only_subs, max_days)
+totals = get_renewal_totals(today, vendor_filter, only_subs, max_days)
 
 # ============================================================================
 # KPIs
@@ -175,19 +124,19 @@ st.subheader("Key Metrics")
 k1, k2, k3, k4 = st.columns(4)
 
 with k1:
-    st.metric("Products", len(filtered), help="📦 Number of products matching filters")
+    st.metric("Products", totals["products"], help="📦 Number of products matching filters")
 
 with k2:
-    expiring_count = filtered["expiring_30d"].sum()
+    expiring_count = totals["expiring_30d"]
     st.metric("Expiring in 30d", expiring_count, help="🔴 URGENT: Contracts expiring in ≤30 days")
 
 with k3:
-    notice_count = filtered["in_notice_window"].sum()
+    notice_count = totals["in_notice_window"]
     st.metric("In Notice Window", notice_count, help="🟡 Contracts in vendor notice window (action needed soon)")
 
 with k4:
     # Total Annual Spend Proxy (subscriptions only)
-    total_spend = filtered[filtered["is_subscription"] == True]["annual_spend_proxy"].sum()
+    total_spend = totals["subscription_spend"]
     st.metric("Total Annual Spend (Subs)", fmt_currency(total_spend), help="💰 Total annual spend for subscription licenses shown")
 
 st.caption("📊 **Total Annual Spend** includes subscription licenses only (perpetual licenses excluded).")
@@ -198,8 +147,8 @@ st.caption("📊 **Total Annual Spend** includes subscription licenses only (per
 
 st.subheader("Renewal Schedule")
 
-# Sort by days_remaining ascending
-filtered_sorted = filtered.sort_values("days_remaining", ascending=True)
+# Already sorted by days_remaining ascending
+filtered_sorted = filtered
 
 # Select display columns
 display_cols = [
@@ -220,10 +169,7 @@ if "contract_end" in display_df.columns:
     display_df["contract_end_fmt"] = display_df["contract_end"].apply(fmt_date)
 
 # Add alert indicators
-display_df["alert"] = display_df.apply(
-    lambda row: "🔴" if row.get("expiring_30d", False) else ("🟡" if row.get("in_notice_window", False) else ""),
-    axis=1
-)
+display_df["alert"] = alert_icons(display_df["expiring_30d"], display_df["in_notice_window"])
 
 # Create final display
 final_cols = ["alert", "software", "vendor", "license_type", "seats_purchased"]
@@ -246,19 +192,66 @@ final_display = display_df[final_cols].rename(columns={
     "days_remaining_display": "days_remaining"
 })
 
-st.dataframe(final_display, use_container_width=True)
+with stage("render_dataframe", rows=len(final_display)):
+    st.dataframe(final_display, use_container_width=True)
 
 st.caption("🔴 Expiring in 30 days | 🟡 In vendor notice window")
 
+# ============================================================================
+# Renewal Spend Forecast
+# ============================================================================
+
+st.subheader(f"📈 Renewal Spend Forecast ({FORECAST_MONTHS} months)",
+             help="💵 Every contract projected forward from contract_end, one renewal per contract term")
+
+# Renewal cycles for all contracts (filters above do not apply), cached per dataset version and day
+forecast = get_renewal_forecast(today)
+
+if forecast.empty:
+    st.info(f"No renewals with a contract end date in the next {FORECAST_MONTHS} months")
+else:
+    breakdown = st.radio(
+        "Break down by",
+        ["vendor", "license_type"],
+        horizontal=True,
+        key="forecast_breakdown",
+        help="📊 Stack monthly spend by vendor or by license type"
+    )
+    monthly = forecast.groupby(["month", breakdown], observed=True, as_index=False)["spend"].sum()
+
+    with stage("chart:renewal_forecast", rows=len(forecast)):
+        fig_forecast = px.bar(monthly, x="month", y="spend", color=breakdown)
+        fig_forecast.update_layout(
+            height=350,
+            margin=dict(t=0, b=0, l=10, r=0),
+            xaxis_title="",
+            yaxis_title="Renewal Spend (USD)",
+            legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+        )
+        st.plotly_chart(fig_forecast, use_container_width=True)
+
+    forecast_table = monthly.pivot(index="month", columns=breakdown, values="spend").fillna(0)
+    forecast_table["Total"] = forecast_table.sum(axis=1)
+    forecast_table.index = forecast_table.index.strftime("%Y-%m")
+    st.dataframe(forecast_table.map(fmt_currency), use_container_width=True)
+
+    st.download_button(
+        label="📥 Download Renewal Forecast (CSV)",
+        data=lazy_csv("renewal_forecast", forecast, today=today),
+        file_name="opensam_renewal_forecast.csv",
+        mime="text/csv"
+    )
+    st.caption(f"💡 Term = contract_start to contract_end (12 months if unknown); each renewal costs seats_purchased × unit_cost_usd. "
+               f"Expired contracts are assumed to have renewed. Total: **{fmt_currency(forecast['spend'].sum())}**")
+
 # ============================================================================
 # Export Options
 # ============================================================================
 
 st.subheader("Export & Alerts")
 
-def to_csv(df):
-    """Convert dataframe to CSV bytes."""
-    return df.to_csv(index=False).encode("utf-8")
+# CSVs are generated when a button is clicked, and cached per dataset version and filter selection
+filter_state = {"today": today, "vendors": vendor_filter, "only_subs": only_subs, "max_days": max_days}
 
 col1, col2, col3 = st.columns(3)
 
@@ -266,7 +259,7 @@ col1, col2, col3 = st.columns(3)
 with col1:
     st.download_button(
         label="📥 Download Renewal Schedule (CSV)",
-        data=to_csv(filtered_sorted),
+        data=lazy_csv("renewal_schedule", filtered_sorted, **filter_state),
         file_name="opensam_renewal_schedule.csv",
         mime="text/csv",
         use_container_width=True
@@ -284,23 +277,12 @@ with col2:
         "expiration_date": "contract_end"
     }
 
-    # Create ServiceNow formatted export
-    snow_export = filtered_sorted.copy()
-    snow_df = pd.DataFrame()
-
-    for snow_col, local_col in SNOW_MAPPING.items():
-        if local_col in snow_export.columns:
-            snow_df[snow_col] = snow_export[local_col]
-
-    # Add additional ServiceNow fields
-    if "days_remaining" in snow_export.columns:
-        snow_df["days_until_expiration"] = snow_export["days_remaining"]
-    if "expiring_30d" in snow_export.columns:
-        snow_df["requires_action"] = snow_export["expiring_30d"]
+    # Create ServiceNow formatted export (plus days_until_expiration and requires_action)
+    snow_df = servicenow_export(filtered_sorted, SNOW_MAPPING)
 
     st.download_button(
         label="📥 ServiceNow Format (CSV)",
-        data=to_csv(snow_df),
+        data=lazy_csv("servicenow_export", snow_df, mapping=SNOW_MAPPING, **filter_state),
         file_name="opensam_servicenow_export.csv",
         mime="text/csv",
         use_container_width=True,
@@ -382,3 +364,5 @@ with col1:
 with col2:
     if st.button("🚀 Automate Alerts", use_container_width=True, key="upgrade_renewal"):
         st.info("**AppForge Labs Renewal Automation:**\n\n✅ Email/Slack alerts\n✅ Vendor negotiation tracking\n✅ Historical pricing analysis\n✅ Auto-renewal prevention\n\n📧 Contact: paulsemaan007@gmail.com")
+
+finish_page()
@@ -3,7 +3,14 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 
+from opensam.app_data import (
+    finish_page, get_data, get_department_installs, get_department_stats, get_usage_trend, lazy_csv, start_page,
+)
+from opensam.timing import stage
+from opensam.departments import allocate_spend, software_breakdown
+
 st.set_page_config(page_title="Department Allocation - OpenSAM", layout="wide")
+start_page("department_allocation")
 
 st.title("Department Allocation")
 st.markdown("Analyze software license costs and utilization by department. Identify reclaim opportunities and cost allocation.")
@@ -43,17 +50,20 @@ def fmt_percent(value):
         return "0.0%"
     return f"{value:.1f}%"
 
+# Date columns are datetime64; render them as plain dates in tables
+DATE_COLUMN_CONFIG = {"last_used_date": st.column_config.DateColumn("last_used_date", format="YYYY-MM-DD")}
+
 # ============================================================================
 # Load Data from Session State
 # ============================================================================
 
 # Check if data exists in session_state
-if "data" not in st.session_state or "data_loaded" not in st.session_state:
+if "data_loaded" not in st.session_state:
     st.warning("⚠️ Data not loaded. Please visit the home page first to load data.")
     st.stop()
 
-# Get data from session state
-data = st.session_state["data"]
+# Shared base tables for the session's dataset version
+data = get_data()
 licenses = data["licenses"]
 installs = data["installs"]
 users = data["users"]
@@ -66,106 +76,22 @@ if licenses.empty or installs.empty or users.empty:
 # Get seat counting mode from session state
 count_by_user = st.session_state.get("count_by_user", False)
 
+# Same reference date as record_snapshot on the home page, so the trend window ends on the snapshot day
+today = datetime.utcnow().date()
+
 # Check if department column exists
 if "department" not in users.columns:
     st.error("❌ Column 'department' not found in users.csv. This page requires department information.")
     st.stop()
 
-# ============================================================================
-# Data Processing
-# ============================================================================
-
-# Join installs → users to get department and status
-installs_users = installs.merge(users, on="user_email", how="left")
-
-# Fill missing values
-if "status" in installs_users.columns:
-    installs_users["status"] = installs_users["status"].fillna("unknown")
-if "department" in installs_users.columns:
-    installs_users["department"] = installs_users["department"].fillna("Unknown")
-
-# Join with licenses to get unit costs and license type
-installs_users_licenses = installs_users.merge(
-    licenses[["software", "unit_cost_usd", "license_type"]],
-    on="software",
-    how="left"
-)
-
-# Fill missing costs
-installs_users_licenses["unit_cost_usd"] = installs_users_licenses["unit_cost_usd"].fillna(0)
-
-# Check if subscription
-installs_users_licenses["is_subscription"] = installs_users_licenses["license_type"].str.contains("subscription", case=False, na=False)
-
 # ============================================================================
 # Calculate Department Metrics
 # ============================================================================
 
-# Group by department
-if count_by_user:
-    # Count unique users per department
-    dept_stats = installs_users_licenses.groupby("department").agg(
-        used_seats=("user_email", lambda x: installs_users_licenses.loc[x.index][installs_users_licenses.loc[x.index, "status"] == "active"]["user_email"].nunique()),
-        terminated_seats=("user_email", lambda x: installs_users_licenses.loc[x.index][installs_users_licenses.loc[x.index, "status"] == "terminated"]["user_email"].nunique()),
-        total_installs=("user_email", "nunique")
-    ).reset_index()
-else:
-    # Count devices per department
-    dept_stats = installs_users_licenses.groupby("department").agg(
-        used_seats=("status", lambda s: (s == "active").sum()),
-        terminated_seats=("status", lambda s: (s == "terminated").sum()),
-        total_installs=("device_id", "count")
-    ).reset_index()
-
-# Calculate reclaimable savings (subscription licenses only)
-# For each department, calculate cost of terminated seats
-reclaimable_by_dept = []
-
-for dept in dept_stats["department"]:
-    dept_terminated = installs_users_licenses[
-        (installs_users_licenses["department"] == dept) &
-        (installs_users_licenses["status"] == "terminated") &
-        (installs_users_licenses["is_subscription"] == True)
-    ]
-
-    if count_by_user:
-        # Count unique users, then multiply by unit cost
-        # For simplicity, we'll use average unit cost per user
-        if not dept_terminated.empty:
-            # Group by user to avoid double-counting multi-device users
-            user_costs = dept_terminated.groupby("user_email")["unit_cost_usd"].first()
-            reclaimable_savings = user_costs.sum()
-        else:
-            reclaimable_savings = 0
-    else:
-        # Count each install
-        reclaimable_savings = dept_terminated["unit_cost_usd"].sum()
-
-    reclaimable_by_dept.append(reclaimable_savings)
-
-dept_stats["reclaimable_savings"] = reclaimable_by_dept
-
-# Calculate share of total spend (proportional allocation)
-# Allocate costs based on used_seats
-total_used_seats = dept_stats["used_seats"].sum()
-
-if total_used_seats > 0:
-    # Calculate total portfolio cost (subscription licenses only)
-    total_portfolio_cost = licenses[
-        licenses["license_type"].str.contains("subscription", case=False, na=False)
-    ]["unit_cost_usd"].sum() * licenses[
-        licenses["license_type"].str.contains("subscription", case=False, na=False)
-    ]["seats_purchased"].sum()
-
-    # Allocate proportionally
-    dept_stats["share_of_spend"] = (dept_stats["used_seats"] / total_used_seats) * total_portfolio_cost
-    dept_stats["share_percent"] = (dept_stats["used_seats"] / total_used_seats) * 100
-else:
-    dept_stats["share_of_spend"] = 0
-    dept_stats["share_percent"] = 0
-
-# Sort by share_of_spend descending
-dept_stats = dept_stats.sort_values("share_of_spend", ascending=False)
+# used_seats, terminated_seats, total_installs and reclaimable_savings (subscription licenses only)
+# for every department in one grouped pass, then subscription spend allocated by used_seats
+# (share_of_spend, share_percent), sorted by share_of_spend descending
+dept_stats = allocate_spend(get_department_stats(count_by_user), licenses)
 
 # ============================================================================
 # Display Metrics
@@ -196,7 +122,8 @@ st.caption(f"📊 Seats counted by: **{'unique users' if count_by_user else 'uni
 st.subheader("Department Breakdown")
 
 # Format display table
-display_df = dept_stats.copy()
+# Shallow copy: new columns only, the shared dept_stats frame is left untouched
+display_df = dept_stats.copy(deep=False)
 display_df["used_seats_fmt"] = display_df["used_seats"].astype(int)
 display_df["terminated_seats_fmt"] = display_df["terminated_seats"].astype(int)
 display_df["reclaimable_savings_fmt"] = display_df["reclaimable_savings"].apply(fmt_currency)
@@ -214,7 +141,8 @@ final_display = display_df[[
     "share_percent_fmt": "share_%"
 })
 
-st.dataframe(final_display, use_container_width=True)
+with stage("render_dataframe", rows=len(final_display)):
+    st.dataframe(final_display, use_container_width=True)
 
 st.caption("💡 **Share of Spend**: Proportional allocation based on active seat usage across subscription licenses.")
 
@@ -226,7 +154,8 @@ st.subheader("Cost Distribution")
 
 # Create bar chart data
 chart_data = dept_stats[["department", "share_of_spend"]].set_index("department")
-st.bar_chart(chart_data)
+with stage("chart:department_spend", rows=len(chart_data)):
+    st.bar_chart(chart_data)
 
 # ============================================================================
 # Detailed Drilldown
@@ -240,15 +169,12 @@ selected_dept = st.selectbox(
 )
 
 if selected_dept:
-    # Filter installs for selected department
-    dept_installs = installs_users_licenses[installs_users_licenses["department"] == selected_dept]
+    # Installs for selected department, joined to users and licenses for status and unit cost
+    # (missing departments are "Unknown"; an indexed query with OPENSAM_STORE=sqlite)
+    dept_installs = get_department_installs(selected_dept)
 
     # Show software breakdown for this department
-    software_breakdown = dept_installs.groupby(["software", "status"]).agg(
-        count=("device_id", "count" if not count_by_user else "nunique")
-    ).reset_index()
-
-    software_pivot = software_breakdown.pivot(index="software", columns="status", values="count").fillna(0)
+    software_pivot = software_breakdown(dept_installs, count_by_user)
 
     st.markdown(f"**Software Usage by {selected_dept}:**")
     st.dataframe(software_pivot, use_container_width=True)
@@ -260,28 +186,31 @@ if selected_dept:
         st.markdown(f"**Terminated Users in {selected_dept} (Reclaim Opportunities):**")
         reclaim_cols = ["user_email", "software", "device_id", "last_used_date"]
         reclaim_display = dept_terminated[[col for col in reclaim_cols if col in dept_terminated.columns]]
-        st.dataframe(reclaim_display, use_container_width=True)
+        st.dataframe(reclaim_display, use_container_width=True, column_config=DATE_COLUMN_CONFIG)
 
         # Calculate savings for this department
         dept_savings = dept_stats[dept_stats["department"] == selected_dept]["reclaimable_savings"].iloc[0]
         st.info(f"💰 Reclaimable savings for {selected_dept}: {fmt_currency(dept_savings)}")
 
+    # Weekly users and devices seen across all products, read from the snapshot history
+    trend = get_usage_trend(department=selected_dept, start=today - timedelta(weeks=52))
+    if not trend.empty:
+        st.markdown(f"**Usage History for {selected_dept} (52 weeks):**")
+        st.line_chart(trend.set_index("period")[["active_users", "active_devices"]])
+
 # ============================================================================
 # Export
 # ============================================================================
 
 st.subheader("Export")
 
-def to_csv(df):
-    """Convert dataframe to CSV bytes."""
-    return df.to_csv(index=False).encode("utf-8")
-
+# CSVs are generated when a button is clicked, and cached per dataset version and selection
 col1, col2 = st.columns(2)
 
 with col1:
     st.download_button(
         label="📥 Download Department Summary (CSV)",
-        data=to_csv(dept_stats),
+        data=lazy_csv("department_allocation", dept_stats, count_by_user=count_by_user),
         file_name="opensam_department_allocation.csv",
         mime="text/csv",
         use_container_width=True
@@ -292,7 +221,7 @@ with col2:
         dept_installs_export = dept_installs[["user_email", "software", "device_id", "status", "last_used_date", "unit_cost_usd"]]
         st.download_button(
             label=f"📥 Download {selected_dept} Details (CSV)",
-            data=to_csv(dept_installs_export),
+            data=lazy_csv("department_details", dept_installs_export, department=selected_dept),
             file_name=f"opensam_{selected_dept}_details.csv",
             mime="text/csv",
             use_container_width=True
@@ -310,3 +239,5 @@ with col1:
 with col2:
     if st.button("🚀 Advanced Allocation", use_container_width=True, key="upgrade_allocation"):
         st.info("**AppForge Labs Cost Allocation:**\n\n✅ Multi-dimension allocation (dept, location, project)\n✅ Custom chargeback rules\n✅ Automated invoicing\n✅ Budget forecasting\n\n📧 Contact: paulsemaan007@gmail.com")
+
+finish_page()
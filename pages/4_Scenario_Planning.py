@@ -3,7 +3,15 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 
+from opensam.app_data import (
+    finish_page, get_data, get_overage_risk, get_plan_risk, get_product_seats, get_reduction_plan,
+    get_removal_ranking, lazy_csv, paged_dataframe, start_page,
+)
+from opensam.products import license_terms, product_license
+from opensam.scenarios import RECENCY_HALF_LIFE_DAYS, SIMULATION_TRIALS, scenario_impact
+
 st.set_page_config(page_title="Scenario Planning - OpenSAM", layout="wide")
+start_page("scenario_planning")
 
 st.title("Scenario Planning")
 st.markdown("Model seat reduction scenarios and generate removal recommendations based on usage patterns.")
@@ -24,6 +32,7 @@ with st.expander("🎯 How to Use This Page (Click to Expand)"):
         st.markdown("3. Review the **removal recommendations** (sorted by last usage)")
         st.markdown("4. Check the **impact summary** for potential overages")
         st.markdown("5. Download **CSV exports** to share with stakeholders before renewal")
+        st.markdown("6. Or switch to **Portfolio optimizer** to hit a company-wide savings target")
 
 st.markdown("---")
 
@@ -45,17 +54,40 @@ def fmt_date(value):
         return value
     return pd.to_datetime(value, errors="coerce").strftime("%Y-%m-%d")
 
+# Products whose simulated overage probability reaches this are flagged
+OVERAGE_RISK_ALERT = 0.10
+SIMULATION_HELP = (
+    f"🎲 Monte Carlo over {SIMULATION_TRIALS:,} trials: each active seat is needed again with a probability that "
+    f"halves every {RECENCY_HALF_LIFE_DAYS} days since last use (50% if never used)."
+)
+
+# Date columns are datetime64; render them as plain dates in tables
+DATE_COLUMN_CONFIG = {"last_used_date": st.column_config.DateColumn("last_used_date", format="YYYY-MM-DD")}
+
+def render_footer():
+    """Page footer (shared by both scenario modes)."""
+    st.markdown("---")
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.caption("**OpenSAM Scenario Planning** — Powered by **AppForge Labs**")
+        st.caption("💡 Run scenarios 60+ days before renewal to allow time for stakeholder review and vendor negotiations.")
+    with col2:
+        if st.button("🚀 Predictive Planning", use_container_width=True, key="upgrade_scenario"):
+            st.info("**AppForge Labs Scenario Tools:**\n\n✅ AI-powered usage forecasting\n✅ What-if analysis with multiple variables\n✅ ROI calculators\n✅ Automated stakeholder reports\n\n📧 Contact: paulsemaan007@gmail.com")
+    # Last thing on the page in both modes
+    finish_page()
+
 # ============================================================================
 # Load Data from Session State
 # ============================================================================
 
 # Check if data exists in session_state
-if "data" not in st.session_state or "data_loaded" not in st.session_state:
+if "data_loaded" not in st.session_state:
     st.warning("⚠️ Data not loaded. Please visit the home page first to load data.")
     st.stop()
 
-# Get data from session state
-data = st.session_state["data"]
+# Shared base tables for the session's dataset version
+data = get_data()
 licenses = data["licenses"]
 installs = data["installs"]
 users = data["users"]
@@ -68,16 +100,110 @@ if licenses.empty or installs.empty or users.empty:
 # Get seat counting mode from session state
 count_by_user = st.session_state.get("count_by_user", False)
 
+scenario_mode = st.radio(
+    "Scenario mode",
+    ["Single product", "Portfolio optimizer"],
+    horizontal=True,
+    key="scenario_mode",
+    help="🎯 Single product: model one product's reduction. Portfolio optimizer: choose reductions across every subscription to reach a savings target."
+)
+
 # ============================================================================
-# Data Processing
+# Portfolio Optimizer
 # ============================================================================
 
-# Join installs → users to get status and department
-installs_users = installs.merge(users, on="user_email", how="left")
+today = datetime.utcnow().date()
+
+if scenario_mode == "Portfolio optimizer":
+    st.subheader("Portfolio Optimizer")
+    st.caption("Chooses seat reductions across **all subscription products** at once: unused seats first (most expensive first, nobody loses access), then seats of the least-recently-used active users if the target needs more.")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        target_savings = st.number_input(
+            "Target annual savings ($)",
+            min_value=0,
+            value=0,
+            step=1000,
+            key="optimizer_target",
+            help="💰 0 = no target: cut every unused subscription seat"
+        )
+    with col2:
+        max_overage = st.number_input(
+            "Max active users to remove (overage risk)",
+            min_value=0,
+            value=0,
+            step=1,
+            key="optimizer_max_overage",
+            help="⚠️ Seats taken from active users, least recently used first. Each one becomes an overage if that user still needs the software."
+        )
 
-# Fill missing status
-if "status" in installs_users.columns:
-    installs_users["status"] = installs_users["status"].fillna("unknown")
+    # Rankings are built once per dataset; each target / risk limit is solved once and cached
+    result = get_reduction_plan(count_by_user, today, target_savings or None, max_overage)
+    plan = result["plan"]
+    removals = result["removals"]
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Projected Annual Savings", fmt_currency(result["total_savings"]))
+    with col2:
+        st.metric("Seats Cut", f"{result['seats_cut']:,}")
+    with col3:
+        st.metric("Products Affected", f"{len(plan):,}")
+    with col4:
+        st.metric("Active Users Removed", f"{result['in_use_cut']:,}", help="⚠️ Overage risk: users losing a seat they hold today")
+
+    if not result["target_met"]:
+        st.warning(f"⚠️ Reachable savings of {fmt_currency(result['total_savings'])} fall short of the {fmt_currency(target_savings)} target. Allow more active users to be removed to go further.")
+    elif target_savings:
+        st.success(f"✅ Target of {fmt_currency(target_savings)} reached.")
+
+    st.markdown("**Per-product plan** (largest savings first):")
+    simulate_plan = st.toggle("🎲 Simulate overage risk per product", key="optimizer_simulate", help=SIMULATION_HELP)
+    display_plan = plan.copy(deep=False)
+    if simulate_plan and not plan.empty:
+        risk = get_plan_risk(count_by_user, today, target_savings or None, max_overage)
+        display_plan["expected_seats_needed"] = risk["expected_demand"].round(1).to_numpy()
+        display_plan["overage_risk"] = risk["overage_probability"].to_numpy()
+        risky = display_plan[display_plan["overage_risk"] >= OVERAGE_RISK_ALERT]
+        if risky.empty:
+            st.success(f"✅ No product has a {OVERAGE_RISK_ALERT:.0%}+ chance of going into overage after these cuts.")
+        else:
+            st.warning(f"⚠️ {len(risky)} products have a {OVERAGE_RISK_ALERT:.0%}+ chance of overage after these cuts: {', '.join(risky['software'].astype(str).head(10))}{'…' if len(risky) > 10 else ''}. Consider cutting fewer seats there.")
+        display_plan["overage_risk"] = display_plan["overage_risk"].map(lambda p: f"{p:.1%}")
+    for col in ["unit_cost_usd", "projected_savings"]:
+        display_plan[col] = display_plan[col].apply(fmt_currency)
+    st.dataframe(display_plan, use_container_width=True)
+
+    st.markdown("**Combined removal list** (least recently used first):")
+    if removals.empty:
+        st.info("No active users need to be removed: the plan only cuts unused seats.")
+    else:
+        paged_dataframe("optimizer_removals", removals, column_config=DATE_COLUMN_CONFIG, count_by_user=count_by_user,
+                        today=today, target=target_savings, max_overage=max_overage)
+
+    optimizer_state = {"count_by_user": count_by_user, "today": today, "target": target_savings, "max_overage": max_overage}
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            label="📥 Download Reduction Plan (CSV)",
+            data=lazy_csv("portfolio_reduction_plan", plan, **optimizer_state),
+            file_name="portfolio_reduction_plan.csv",
+            mime="text/csv",
+            use_container_width=True
+        )
+    with col2:
+        st.download_button(
+            label="📥 Download Removal List (CSV)",
+            data=lazy_csv("portfolio_removal_list", removals, **optimizer_state),
+            file_name="portfolio_removal_list.csv",
+            mime="text/csv",
+            use_container_width=True,
+            disabled=removals.empty
+        )
+
+    render_footer()
+    st.stop()
 
 # ============================================================================
 # Product Selection
@@ -103,25 +229,17 @@ selected_product = st.selectbox("Product", products, key="scenario_product")
 # ============================================================================
 
 # Get license info
-license_row = licenses[licenses["software"] == selected_product]
+license_info = product_license(licenses, selected_product)
 
-if license_row.empty:
+if license_info is None:
     st.warning(f"⚠️ No license information found for {selected_product}")
     st.stop()
 
-license_info = license_row.iloc[0]
-
-# Get product installations
-product_installs = installs_users[installs_users["software"] == selected_product].copy()
+# Seat counts of the product's installations (joined to users for status), cached per product and seat mode
+product_seats = get_product_seats(selected_product, count_by_user)
 
 # Get license details
-seats_purchased = int(license_info.get("seats_purchased", 0))
-unit_cost = license_info.get("unit_cost_usd", 0)
-if pd.isna(unit_cost):
-    unit_cost = 0
-
-license_type = license_info.get("license_type", "unknown")
-is_subscription = "subscription" in str(license_type).lower()
+seats_purchased, unit_cost, license_type, is_subscription = license_terms(license_info)
 
 # ============================================================================
 # Current State
@@ -130,12 +248,8 @@ is_subscription = "subscription" in str(license_type).lower()
 st.subheader("Current State")
 
 # Calculate current usage
-if count_by_user:
-    active_count = product_installs[product_installs["status"] == "active"]["user_email"].nunique()
-    terminated_count = product_installs[product_installs["status"] == "terminated"]["user_email"].nunique()
-else:
-    active_count = len(product_installs[product_installs["status"] == "active"])
-    terminated_count = len(product_installs[product_installs["status"] == "terminated"])
+active_count = product_seats["active"]
+terminated_count = product_seats["terminated"]
 
 total_in_use = active_count + terminated_count
 unused_seats = max(0, seats_purchased - active_count)
@@ -178,12 +292,12 @@ with col2:
         help="When ON: Generate removal list from active users only. Terminated users should be handled via reclaim process."
     )
 
-# Calculate projected savings
+# Calculate projected savings and post-reduction position
+impact = scenario_impact(seats_purchased, reduce_seats, active_count, unit_cost, is_subscription)
+projected_savings = impact["projected_savings"]
 if is_subscription:
-    projected_savings = reduce_seats * unit_cost
     savings_note = f"Projected Annual Savings: {fmt_currency(projected_savings)}"
 else:
-    projected_savings = 0
     savings_note = f"Perpetual license (no recurring savings, but may reduce maintenance/support costs)"
 
 st.info(f"💰 {savings_note}")
@@ -194,28 +308,17 @@ st.info(f"💰 {savings_note}")
 
 st.subheader("Removal Recommendations")
 
-# Filter users based on exclude_terminated setting
+# Rank candidates least-recently-used first (active users only when exclude_terminated)
 if exclude_terminated:
-    candidate_users = product_installs[product_installs["status"] == "active"].copy()
     st.caption("🔍 Showing **active users only** (terminated users excluded). Handle terminated users via Reclaim process.")
 else:
-    candidate_users = product_installs.copy()
     st.caption("🔍 Showing **all users** (including terminated). Consider reviewing reclaim process first.")
 
-# Convert last_used_date to datetime for sorting
-if "last_used_date" in candidate_users.columns:
-    candidate_users["last_used_datetime"] = pd.to_datetime(candidate_users["last_used_date"], errors="coerce")
-
-    # Sort by last_used_date ascending (oldest first), NaT values last
-    candidate_users = candidate_users.sort_values("last_used_datetime", ascending=True, na_position="last")
-else:
+if not product_seats["has_last_used"]:
     st.warning("⚠️ last_used_date column not found. Cannot generate usage-based recommendations.")
-    candidate_users["last_used_datetime"] = pd.NaT
 
-# If counting by user, dedupe to show one row per user (keep oldest last_used_date)
-if count_by_user and "user_email" in candidate_users.columns:
-    # Group by user and keep row with oldest last_used_date
-    candidate_users = candidate_users.sort_values("last_used_datetime", ascending=True).groupby("user_email").first().reset_index()
+# Ranked once per product and setting (cached), so moving the slider only takes a prefix
+candidate_users = get_removal_ranking(selected_product, count_by_user, exclude_terminated)
 
 # Take top N recommendations
 recommendation_list = candidate_users.head(reduce_seats)
@@ -246,11 +349,11 @@ st.subheader("Scenario Impact")
 col1, col2, col3 = st.columns(3)
 
 with col1:
-    new_seat_count = seats_purchased - reduce_seats
+    new_seat_count = impact["new_seat_count"]
     st.metric("New Seat Count", new_seat_count, delta=f"-{reduce_seats}")
 
 with col2:
-    remaining_users = active_count - min(reduce_seats, active_count)
+    remaining_users = impact["remaining_users"]
     st.metric("Remaining Active Users", remaining_users)
 
 with col3:
@@ -260,21 +363,33 @@ with col3:
         st.metric("Savings", "$0 (Perpetual)")
 
 # Warning if overage would result
-if remaining_users > new_seat_count:
-    overage = remaining_users - new_seat_count
+if impact["overage"] > 0:
+    overage = impact["overage"]
     st.warning(f"⚠️ **Warning:** Reducing by {reduce_seats} seats would create an overage of {overage} seats. Consider reducing more or reassigning users.")
 else:
     st.success(f"✅ After reduction, you would have {new_seat_count - remaining_users} unused seats remaining.")
 
+# Probabilistic check: do the seats still needed (removed users included) exceed the new seat count?
+if st.toggle("🎲 Simulate overage risk", key="scenario_simulate", help=SIMULATION_HELP):
+    risk = get_overage_risk(selected_product, count_by_user, today, new_seat_count)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Overage Probability", f"{risk['overage_probability']:.1%}")
+    with col2:
+        st.metric("Expected Seats Needed", f"{risk['expected_demand']:.1f}", help=f"95th percentile: {risk['p95_demand']:.0f}")
+    if risk["overage_probability"] >= OVERAGE_RISK_ALERT:
+        st.warning(f"⚠️ {risk['overage_probability']:.0%} chance that more than {new_seat_count} seats are needed. Consider a smaller reduction.")
+    st.caption("Removed users are counted too: if they still need the software they will ask for a seat back.")
+
 # ============================================================================
 # Export
 # ============================================================================
 
 st.subheader("Export Recommendations")
 
-def to_csv(df):
-    """Convert dataframe to CSV bytes."""
-    return df.to_csv(index=False).encode("utf-8")
+# CSVs are generated when a button is clicked, and cached per dataset version and scenario settings
+scenario_state = {"product": selected_product, "count_by_user": count_by_user,
+                  "reduce_seats": reduce_seats, "exclude_terminated": exclude_terminated}
 
 col1, col2 = st.columns(2)
 
@@ -285,11 +400,11 @@ with col1:
         if "department" in recommendation_list.columns:
             export_cols.append("department")
 
-        export_df = recommendation_list[[col for col in export_cols if col in recommendation_list.columns]].copy()
+        export_df = recommendation_list[[col for col in export_cols if col in recommendation_list.columns]]
 
         st.download_button(
             label="📥 Download Removal Recommendation List (CSV)",
-            data=to_csv(export_df),
+            data=lazy_csv("removal_recommendations", export_df, **scenario_state),
             file_name=f"{selected_product}_removal_recommendations.csv",
             mime="text/csv",
             use_container_width=True
@@ -313,7 +428,7 @@ with col2:
 
     st.download_button(
         label="📥 Download Scenario Summary (CSV)",
-        data=to_csv(scenario_summary),
+        data=lazy_csv("scenario_summary", scenario_summary, date=scenario_summary["Date Generated"].iloc[0], **scenario_state),
         file_name=f"{selected_product}_scenario_summary.csv",
         mime="text/csv",
         use_container_width=True
@@ -355,11 +470,4 @@ with st.expander("📋 Implementation Guidance"):
 # Footer
 # ============================================================================
 
-st.markdown("---")
-col1, col2 = st.columns([3, 1])
-with col1:
-    st.caption("**OpenSAM Scenario Planning** — Powered by **AppForge Labs**")
-    st.caption("💡 Run scenarios 60+ days before renewal to allow time for stakeholder review and vendor negotiations.")
-with col2:
-    if st.button("🚀 Predictive Planning", use_container_width=True, key="upgrade_scenario"):
-        st.info("**AppForge Labs Scenario Tools:**\n\n✅ AI-powered usage forecasting\n✅ What-if analysis with multiple variables\n✅ ROI calculators\n✅ Automated stakeholder reports\n\n📧 Contact: paulsemaan007@gmail.com")
+render_footer()